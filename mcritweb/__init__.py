@@ -5,6 +5,20 @@ from flask import Flask, render_template, g, redirect, url_for, request
 from flask_dropzone import Dropzone
 
 from .views.utility import ensure_local_data_paths, get_mcritweb_version_from_setup
+from .views.server_health import health_monitor
+from .views.client_pool import client_pool
+from .views.result_cache import result_cache
+from .views.matching_result_cache import matching_result_cache
+from .views.diagram_renderer import diagram_renderer
+from .views.function_metrics import function_metrics_store
+from .views.cfg_cache import cfg_cache
+from .views.block_fingerprints import block_fingerprint_cache
+from .views.upstream_fetcher import upstream_fetcher
+from .views.job_cache import finished_job_cache
+from .views.job_progress import job_progress_monitor
+from .views.family_names import family_name_index
+from .views.sample_cache import sample_cache
+from .views.import_stream import import_manager
 
 
 dropzone = Dropzone()
@@ -46,6 +60,22 @@ def create_app(test_config=None):
     # ensure the instance and cache folders exists
     ensure_local_data_paths(app)
     db.init_app(app)
+    health_monitor.init_app(app)
+    client_pool.init_app(app)
+    result_cache.init_app(app)
+    matching_result_cache.init_app(app)
+    diagram_renderer.init_app(app)
+    function_metrics_store.init_app(app)
+    cfg_cache.init_app(app)
+    block_fingerprint_cache.init_app(app)
+    upstream_fetcher.init_app(app)
+    finished_job_cache.init_app(app)
+    job_progress_monitor.init_app(app)
+    family_name_index.init_app(app)
+    # jobs e.g. add, rename or delete families, which is only visible in MCRIT once they are finished
+    finished_job_cache.addFinishedListener(lambda job: family_name_index.invalidate())
+    sample_cache.init_app(app)
+    import_manager.init_app(app)
     app.register_blueprint(explore.bp)
     app.register_blueprint(analyze.bp)
     app.register_blueprint(authentication.bp)
@@ -1,9 +1,17 @@
+import os
 import click
 import sqlite3
+import threading
 from flask import current_app, g
 from flask.cli import with_appcontext
 
 
+SERVER_CONFIG_FIELDS = ["url", "operation_mode", "registration_token", "server_uuid", "server_version"]
+# database path -> {"stamp": ..., "config": ..., "users": ...}
+_server_config_cache = {}
+_server_config_lock = threading.Lock()
+
+
 def get_db():
     if 'db' not in g:
         g.db = sqlite3.connect(
@@ -26,6 +34,7 @@ def init_db():
 
     with current_app.open_resource('create_table.sql') as f:
         db.executescript(f.read().decode('utf8'))
+    invalidate_server_config()
 
 @click.command('init-db')
 @with_appcontext
@@ -38,46 +47,72 @@ def init_app(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
 
-def is_first_user():
+def _get_database_stamp(database_path):
+    # any committed write changes size or mtime of the database file, also when done by another worker
+    try:
+        stat = os.stat(database_path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def _load_server_config():
     db = get_db()
     cursor = db.cursor()
-    if len(cursor.execute("select * from user;").fetchall()) > 0:
-        return False
-    else:
-        return True
+    has_users = cursor.execute("select exists(select 1 from user) as has_users;").fetchone()["has_users"]
+    record = cursor.execute("select * from server;").fetchone()
+    server_config = {key: None for key in SERVER_CONFIG_FIELDS}
+    if record:
+        server_config.update({key: record[key] for key in SERVER_CONFIG_FIELDS})
+    server_config["is_first_user"] = not has_users
+    return server_config
+
+
+def _load_users():
+    return {user["id"]: user for user in get_db().execute('SELECT * FROM user').fetchall()}
+
+
+def _get_server_snapshot():
+    # callers keep using the snapshot they got, even if it is invalidated by another thread meanwhile,
+    # which is safe as snapshots are complete when published and never modified afterwards
+    database_path = current_app.config['DATABASE']
+    stamp = _get_database_stamp(database_path)
+    cached = _server_config_cache.get(database_path)
+    if cached is None or cached["stamp"] != stamp:
+        with _server_config_lock:
+            cached = {"stamp": stamp, "config": _load_server_config(), "users": _load_users()}
+            _server_config_cache[database_path] = cached
+    return cached
+
+
+def get_server_config():
+    """ Snapshot of the server table and first-user flag, only reloaded after the database was written to """
+    return _get_server_snapshot()["config"]
+
+
+def get_user_by_id(user_id):
+    """ User row of user_id from the snapshot, which holds all users as there are only few of them """
+    return _get_server_snapshot()["users"].get(user_id)
+
+
+def invalidate_server_config():
+    _server_config_cache.pop(current_app.config['DATABASE'], None)
+
+
+def is_first_user():
+    return get_server_config()["is_first_user"]
+
+def get_server_url():
+    return get_server_config()["url"]
 
 def get_server_uuid():
-    server_uuid = None
-    db = get_db()
-    cursor = db.cursor()
-    record = cursor.execute("select server_uuid from server;").fetchone()
-    if record:  
-        server_uuid = record["server_uuid"]
-    return server_uuid
+    return get_server_config()["server_uuid"]
 
 def get_server_version():
-    server_version = None
-    db = get_db()
-    cursor = db.cursor()
-    record = cursor.execute("select server_version from server;").fetchone()
-    if record:  
-        server_version = record["server_version"]
-    return server_version
+    return get_server_config()["server_version"]
 
 def get_registration_token():
-    registration_token = None
-    db = get_db()
-    cursor = db.cursor()
-    record = cursor.execute("select registration_token from server;").fetchone()
-    if record:  
-        registration_token = record["registration_token"]
-    return registration_token
+    return get_server_config()["registration_token"]
 
 def get_operation_mode():
-    operation_mode = None
-    db = get_db()
-    cursor = db.cursor()
-    record = cursor.execute("select operation_mode from server;").fetchone()
-    if record:  
-        operation_mode = record["operation_mode"]
-    return operation_mode
+    return get_server_config()["operation_mode"]
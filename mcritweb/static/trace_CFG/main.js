@@ -1247,32 +1247,26 @@ function highlightUERs(UERtype){
 
   function loadWithDotGraphAndFunctionId(function_id) {
     isTraceSupplied = false;
-    // Send request for loop information; load when ready
-     d3.xhr("../fetchDotGraph/" + function_id).header("Content-Type", "text/plain")
+    // Send request for dot graph and loop information; load when ready
+     d3.xhr("../fetchCfg/" + function_id)
       .get(function(err, result){
-        dot_graph = result.responseText;
+        var cfg = JSON.parse(result.responseText);
+        dot_graph = cfg.dot_graph;
         dotFile = dot_graph.replace(/\\l/g, "\n");
         g = graphlibDot.parse(dotFile);
-        // Send request for loop information; load when ready
-        d3.xhr("../findLoops/")
-          .header("Content-Type", "text/plain")
-          .post(dotFile,
-            function(err, result){
-              // console.log("Response: ", result.responseText);
-              loopsObj = JSON.parse(result.responseText);
-              
-              loopify_dagre.init();
-              var modifiedDotFile = loopify_dagre.modifiedDotFile;
-              // console.log(modifiedDotFile);
-              graph_to_display = graphlibDot.parse(modifiedDotFile);
-    
-    
-              showGraph(isTraceSupplied);
-              loopify_dagre.addBackground();
-    
-              fnManip.init();
-              loopCollapser.init();
-            });
+        loopsObj = cfg.loops;
+
+        loopify_dagre.init();
+        var modifiedDotFile = loopify_dagre.modifiedDotFile;
+        // console.log(modifiedDotFile);
+        graph_to_display = graphlibDot.parse(modifiedDotFile);
+
+
+        showGraph(isTraceSupplied);
+        loopify_dagre.addBackground();
+
+        fnManip.init();
+        loopCollapser.init();
     });
 
 
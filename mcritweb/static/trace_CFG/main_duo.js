@@ -1248,33 +1248,27 @@ function highlightUERs(UERtype){
 
     function loadWithDotGraphAndFunctionIdA(function_id, node_colors) {
       isTraceSupplied = false;
-      // Send request for loop information; load when ready
-        d3.xhr(window.location.origin + "/explore/fetchDotGraph/" + function_id).header("Content-Type", "text/plain")
+      // Send request for dot graph and loop information; load when ready
+        d3.xhr(window.location.origin + "/explore/fetchCfg/" + function_id)
         .get(function(err, result){
-          dot_graph = result.responseText;
+          var cfg = JSON.parse(result.responseText);
+          dot_graph = cfg.dot_graph;
           dotFile_a = dot_graph.replace(/\\l/g, "\n");
           g_a = graphlibDot.parse(dotFile_a);
-          // Send request for loop information; load when ready
-          d3.xhr(window.location.origin + "/explore/findLoops/")
-            .header("Content-Type", "text/plain")
-            .post(dotFile_a,
-              function(err, result){
-                // console.log("Response: ", result.responseText);
-                loopsObj = JSON.parse(result.responseText);
-                
-                // loopify_dagre.init();
-                var modifiedDotFile_a = loopify_dagre.modifiedDotFile;
-                var modifiedDotFile_a = dotFile_a;
-                // console.log(modifiedDotFile);
-                graph_to_display_a = graphlibDot.parse(modifiedDotFile_a);
-      
-      
-                showGraph("a", node_colors);
-                // loopify_dagre.addBackground();
-      
-                fnManip.init();
-                // loopCollapser.init();
-              });
+          loopsObj = cfg.loops;
+
+          // loopify_dagre.init();
+          var modifiedDotFile_a = loopify_dagre.modifiedDotFile;
+          var modifiedDotFile_a = dotFile_a;
+          // console.log(modifiedDotFile);
+          graph_to_display_a = graphlibDot.parse(modifiedDotFile_a);
+
+
+          showGraph("a", node_colors);
+          // loopify_dagre.addBackground();
+
+          fnManip.init();
+          // loopCollapser.init();
       });
   
   
@@ -1283,33 +1277,27 @@ function highlightUERs(UERtype){
 
   function loadWithDotGraphAndFunctionIdB(function_id, node_colors) {
     isTraceSupplied = false;
-    // Send request for loop information; load when ready
-     d3.xhr(window.location.origin + "/explore/fetchDotGraph/" + function_id).header("Content-Type", "text/plain")
+    // Send request for dot graph and loop information; load when ready
+     d3.xhr(window.location.origin + "/explore/fetchCfg/" + function_id)
       .get(function(err, result){
-        dot_graph = result.responseText;
+        var cfg = JSON.parse(result.responseText);
+        dot_graph = cfg.dot_graph;
         dotFile_b = dot_graph.replace(/\\l/g, "\n");
         g_b = graphlibDot.parse(dotFile_b);
-        // Send request for loop information; load when ready
-        d3.xhr(window.location.origin + "/explore/findLoops/")
-          .header("Content-Type", "text/plain")
-          .post(dotFile_b,
-            function(err, result){
-              // console.log("Response: ", result.responseText);
-              loopsObj = JSON.parse(result.responseText);
-              
-              // loopify_dagre.init();
-              var modifiedDotFile_b = loopify_dagre.modifiedDotFile;
-              var modifiedDotFile_b = dotFile_b;
-              // console.log(modifiedDotFile);
-              graph_to_display_b = graphlibDot.parse(modifiedDotFile_b);
-    
-    
-              showGraph("b", node_colors);
-              // loopify_dagre.addBackground();
-    
-              fnManip.init();
-              // loopCollapser.init();
-            });
+        loopsObj = cfg.loops;
+
+        // loopify_dagre.init();
+        var modifiedDotFile_b = loopify_dagre.modifiedDotFile;
+        var modifiedDotFile_b = dotFile_b;
+        // console.log(modifiedDotFile);
+        graph_to_display_b = graphlibDot.parse(modifiedDotFile_b);
+
+
+        showGraph("b", node_colors);
+        // loopify_dagre.addBackground();
+
+        fnManip.init();
+        // loopCollapser.init();
     });
 
 
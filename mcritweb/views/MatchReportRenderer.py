@@ -2,21 +2,30 @@ import os
 import sys
 import json
 import math
+import logging
+import operator
+import itertools
 from collections import defaultdict
 
+import numpy as np
 from PIL import Image, ImageFont, ImageDraw
-from mcrit.client.McritClient import McritClient
 from mcrit.storage.MatchingResult import MatchingResult
 
-from mcritweb.views.utility import get_server_url
+from mcritweb.views.function_metrics import function_metrics_store
+from mcritweb.views.result_cache import deserialize_result
+from mcritweb.views.score_colors import MATCH_SCALE_50
 
 
 
 def load_cached_result(result_filepath):
     result_json = {}
     matching_result = None
-    with open(result_filepath, "r") as fin:
-        result_json = json.load(fin)
+    if result_filepath.endswith(".mcr"):
+        with open(result_filepath, "rb") as fin:
+            result_json = deserialize_result(fin.read())
+    else:
+        with open(result_filepath, "r") as fin:
+            result_json = json.load(fin)
     if result_json:
         matching_result = MatchingResult.fromDict(result_json)
     return matching_result
@@ -24,6 +33,9 @@ def load_cached_result(result_filepath):
 
 class MatchReportRenderer(object):
 
+    # columns collected per function match, in this order, see _aggregateMatches()
+    _match_columns = operator.attrgetter("function_id", "matched_family_id", "matched_sample_id", "matched_function_id", "matched_score", "match_is_pichash", "match_is_library", "num_bytes")
+
     frequency_color_map = {
         # white
         0 : (0xff, 0xff, 0xff),
@@ -46,24 +58,6 @@ class MatchReportRenderer(object):
         # violet
         7: (0xb4, 0x00, 0xff)
     }
-    matching_color_map_50 = {
-        # white
-        0: (0xff, 0xff, 0xff),
-        # dark blue
-        1: (0x00, 0x45, 0xba),
-        # blue
-        2: (0x00, 0x80, 0xff),
-        # light blue
-        3: (0x22, 0xfe, 0xfd),
-        # green
-        4: (0x1f, 0xfe, 0x28),
-        # yellow
-        5: (0xff, 0xff, 0x35),
-        # orange
-        6: (0xfe, 0x82, 0x25),
-        # red
-        7: (0xfd, 0x1a, 0x20),
-    }
     top_color_map = {
         "b": (0x10, 0x7f, 0xfc),
         "g": (0x1f, 0xfe, 0x28),
@@ -81,70 +75,92 @@ class MatchReportRenderer(object):
 
     def processReport(self, match_report):
         self.match_report = match_report
-        client = McritClient(mcrit_server= get_server_url())
         self.sample_info = self.match_report.reference_sample_entry
         self.sample_infos = {matched_sample.sample_id: matched_sample for matched_sample in self.match_report.sample_matches}
-        if client.isSampleId(self.sample_info.sample_id):
-            self.function_infos = {function_info.function_id: function_info for function_info in client.getFunctionsBySampleId(self.match_report.reference_sample_entry.sample_id)}
-        else:
-            # TODO: find a way to get function_infos
-            self.function_infos = {}
-        for match in self.match_report.function_matches:
-            # matches
-            if match.function_id not in self.matches_by_function_id:
-                self.matches_by_function_id[match.function_id] = []
-            self.matches_by_function_id[match.function_id].append(match)
-            # families
-            if match.function_id not in self.function_family_match_map:
-                self.function_family_match_map[match.function_id] = set([])
-            self.function_family_match_map[match.function_id].add(match.matched_family_id)
-            # samples
-            if match.function_id not in self.function_sample_match_map:
-                self.function_sample_match_map[match.function_id] = set([])
-            self.function_sample_match_map[match.function_id].add(match.matched_sample_id)
-            # libraries
-            if match.function_id not in self.function_library_match_map:
-                self.function_library_match_map[match.function_id] = set([])
-            if match.match_is_library:
-                self.function_library_match_map[match.function_id].add(match.matched_family_id)
+        # TODO: find a way to get function metrics for queries, which are not stored as samples in MCRIT
+        self.function_metrics = function_metrics_store.get(self.sample_info)
+        self._aggregateMatches()
         # this mapping to libraries remains regardless of report is filtered in any way
         for function_id, lib_mapping in self.match_report.library_matches.items():
             if lib_mapping:
                 self.function_library_global_map[function_id] = len(set([tup[0] for tup in lib_mapping]))
         # output stats
-        num_matchable_functions = sum([1 for _, function_info in self.function_infos.items() if function_info.num_instructions >= 10])
-        num_matched_functions = len(set([match.function_id for match in self.match_report.function_matches]))
-        print(f"Sample has {len(self.function_infos)} functions, {num_matchable_functions} matchable and {num_matched_functions} with matches.")
+        num_matchable_functions = int(np.count_nonzero(self.function_metrics.num_instructions >= 10))
+        num_matched_functions = int(np.count_nonzero(self.num_matches))
+        logging.debug("Sample has %d functions, %d matchable and %d with matches.", len(self.function_metrics), num_matchable_functions, num_matched_functions)
+
+    def _aggregateMatches(self):
+        """ Collect function matches as columns and aggregate them per function.
+
+        Functions are identified by their index in self.function_ids, which starts with the
+        functions in self.function_metrics (in their order), followed by all other matched functions.
+        All self.match_* arrays have one entry per function match, in the order of the report.
+        """
+        function_matches = self.match_report.function_matches
+        # one row per match, with the 8 columns of _match_columns:
+        # 0 function_id, 1 matched_family_id, 2 matched_sample_id, 3 matched_function_id,
+        # 4 matched_score, 5 match_is_pichash, 6 match_is_library, 7 num_bytes
+        columns = np.fromiter(itertools.chain.from_iterable(map(self._match_columns, function_matches)), dtype=np.float64, count=len(function_matches) * 8).reshape(-1, 8)
+        match_function_ids = columns[:, 0].astype(np.int64)
+        # index all functions: our own ones first, then matched functions we have no metrics for
+        own_function_ids = self.function_metrics.function_ids
+        other_function_ids = np.setdiff1d(match_function_ids, own_function_ids)
+        function_ids = np.concatenate([own_function_ids, other_function_ids])
+        self.function_ids = function_ids.tolist()
+        # map the function_id of each match to its function index, by binary search over the sorted ids
+        by_function_id = np.argsort(function_ids)
+        self.match_function = by_function_id[np.searchsorted(function_ids, match_function_ids, sorter=by_function_id)]
+        self.match_family_id = columns[:, 1].astype(np.int64)
+        self.match_sample_id = columns[:, 2].astype(np.int64)
+        self.match_function_id = columns[:, 3].astype(np.int64)
+        self.match_matched_score = columns[:, 4].copy()
+        # match_is_pichash is not necessarily 0/1, but a pichash match counts as one extra point
+        self.match_is_pichash = columns[:, 5].copy()
+        self.match_score = self.match_matched_score + (self.match_is_pichash != 0)
+        self.match_is_library = columns[:, 6].astype(bool)
+        self.match_num_bytes = columns[:, 7].copy()
+        num_functions = len(self.function_ids)
+        # number of matches per function index
+        self.num_matches = np.bincount(self.match_function, minlength=num_functions)
+        # distinct (function, family/sample) pairs, sorted by function and then by family/sample id
+        self.foreign_family_pairs = self._getDistinctPairs(self.match_family_id, self.match_family_id != self.sample_info.family_id)
+        self.foreign_sample_pairs = self._getDistinctPairs(self.match_sample_id, self.match_sample_id != self.sample_info.sample_id)
+        self.library_family_pairs = self._getDistinctPairs(self.match_family_id, self.match_is_library)
+        # number of distinct families/samples per function index, as each pair occurs once
+        self.num_foreign_families = np.bincount(self.foreign_family_pairs[0], minlength=num_functions)
+        self.num_foreign_samples = np.bincount(self.foreign_sample_pairs[0], minlength=num_functions)
+        self.num_library_families = np.bincount(self.library_family_pairs[0], minlength=num_functions)
+
+    def _getDistinctPairs(self, match_values, mask):
+        """ Answer the distinct (function index, value) pairs among the selected matches as two arrays """
+        # number the distinct values 0..num_values-1, so each (function index, value) pair fits into a single integer
+        values, value_codes = np.unique(match_values[mask], return_inverse=True)
+        num_values = max(len(values), 1)
+        pair_codes = np.sort(self.match_function[mask] * num_values + value_codes)
+        # after sorting, duplicates are adjacent and we only keep the first of each run
+        pair_codes = pair_codes[np.concatenate([[True], pair_codes[1:] != pair_codes[:-1]])] if len(pair_codes) else pair_codes
+        # decode the pairs again
+        return pair_codes // num_values, values[pair_codes % num_values]
+
+    def _getBestScores(self, mask=None):
+        """ Answer the best match score per function, considering only the selected matches """
+        best_scores = np.zeros(len(self.function_ids))
+        # unbuffered maximum, so functions with several matches keep the best of them (0 without matches)
+        if mask is None:
+            np.maximum.at(best_scores, self.match_function, self.match_score)
+        else:
+            np.maximum.at(best_scores, self.match_function[mask], self.match_score[mask])
+        return best_scores
 
     def __init__(self):
         self._function_visualization_width = 1
         self.match_report = None
         self.sample_info = None
         self.sample_infos = None
-        self.function_infos = None
-        self.function_family_match_map = {}
-        self.function_sample_match_map = {}
-        self.function_library_match_map = {}
+        self.function_metrics = None
         self.function_library_global_map = {}
-        self.matches_by_function_id = {}
-
-
-    def _mapConfidence(self, score):
-        if score > 100:
-            return self.matching_color_map_50[1]
-        elif score == 100:
-            return self.matching_color_map_50[2]
-        elif score >= 90:
-            return self.matching_color_map_50[3]
-        elif score >= 80:
-            return self.matching_color_map_50[4]
-        elif score >= 70:
-            return self.matching_color_map_50[5]
-        elif score >= 60:
-            return self.matching_color_map_50[6]
-        elif score >= 50:
-            return self.matching_color_map_50[7]
-        return self.frequency_color_map[0]
+        self.function_ids = []
+
 
     def _calculateLogScore(self, cluster_size):
         if cluster_size == 0:
@@ -163,99 +179,85 @@ class MatchReportRenderer(object):
             3: "FS",
             4: "FM"
         }
-        cluster_by_family_id = defaultdict(set)
         this_family_id = self.sample_info.family_id
-        for function_id, function_info in self.function_infos.items():
+        no_scores = np.zeros(len(self.function_ids))
+        best_scores = self._getBestScores().tolist()
+        best_non_family_scores = self._getBestScores(self.match_family_id != this_family_id).tolist()
+        best_target_family_scores = (self._getBestScores(self.match_family_id == filtered_family_id) if filtered_family_id is not None else no_scores).tolist()
+        best_target_sample_scores = (self._getBestScores(self.match_sample_id == filtered_sample_id) if filtered_sample_id is not None else no_scores).tolist()
+        num_matches = self.num_matches.tolist()
+        num_foreign_families = self.num_foreign_families.tolist()
+        num_foreign_samples = self.num_foreign_samples.tolist()
+        num_library_families = self.num_library_families.tolist()
+        for function_index, (function_id, num_instructions) in enumerate(zip(self.function_metrics.function_ids.tolist(), self.function_metrics.num_instructions.tolist())):
             family_matches_log_score = 0
             sample_matches_log_score = 0
-            best_non_family_score = 0
-            best_target_family_score = 0
-            best_target_sample_score = 0
-            best_score = 0
-            is_matchable = function_info.num_instructions >= 10
+            is_matchable = num_instructions >= 10
             library_match_class = " "
             num_library_families_matched = 0
-            # sample match info
-            if function_id in self.function_sample_match_map:
-                reduced_cluster = sorted(list(self.function_sample_match_map[function_id].difference(set([self.sample_info.sample_id]))))
-                sample_matches_log_score = self._calculateLogScore(len(reduced_cluster))
-            # library anf family match info
-            if function_id in self.function_family_match_map:
-                reduced_cluster = sorted(list(self.function_family_match_map[function_id].difference(set([this_family_id]))))
-                family_matches_log_score = self._calculateLogScore(len(reduced_cluster))
-                library_match_class = " "
-                num_library_families_matched = len(self.function_library_match_map[function_id])
+            function_matches_log_score = None
+            if num_matches[function_index]:
+                sample_matches_log_score = self._calculateLogScore(num_foreign_samples[function_index])
+                family_matches_log_score = self._calculateLogScore(num_foreign_families[function_index])
+                num_library_families_matched = num_library_families[function_index]
                 library_match_class = match_class_map[min(num_library_families_matched, 2)]
-                for family_id in reduced_cluster:
-                    cluster_by_family_id[family_id].add(function_id)
+                function_matches_log_score = int(math.log(num_matches[function_index], 2))
             if num_library_families_matched == 0 and function_id in self.function_library_global_map:
                 library_match_class = match_class_map[min(self.function_library_global_map[function_id], 2) + 2]
-            # function match info
-            function_matches_log_score = None
-            if function_id in self.matches_by_function_id:
-                function_matches_log_score = int(math.log(len(self.matches_by_function_id[function_id]), 2))
-                for match in self.matches_by_function_id[function_id]:
-                    is_same_family = this_family_id == match.matched_family_id
-                    if not is_same_family:
-                        best_non_family_score = max(best_non_family_score, match.matched_score + (1 if match.match_is_pichash else 0))
-                    if match.matched_family_id == filtered_family_id:
-                        best_target_family_score = max(best_target_family_score, match.matched_score + (1 if match.match_is_pichash else 0))
-                    if match.matched_sample_id == filtered_sample_id:
-                        best_target_sample_score = max(best_target_sample_score, match.matched_score + (1 if match.match_is_pichash else 0))
-                    best_score = max(best_score, match.matched_score + (1 if match.match_is_pichash else 0))
             output_map[function_id] = {
                 "is_matchable": is_matchable,
-                "best_score": best_score,
-                "best_non_family_score": best_non_family_score,
-                "best_target_family_score": best_target_family_score,
-                "best_target_sample_score": best_target_sample_score,
+                "best_score": best_scores[function_index],
+                "best_non_family_score": best_non_family_scores[function_index],
+                "best_target_family_score": best_target_family_scores[function_index],
+                "best_target_sample_score": best_target_sample_scores[function_index],
                 "function_matches_log_score": function_matches_log_score,
                 "family_matches_log_score": family_matches_log_score,
                 "sample_matches_log_score": sample_matches_log_score,
                 "library_match_class": library_match_class,
                 "most_common_cluster": [],
-                "num_instructions": function_info.num_instructions,
-                "num_instruction_blocks": round(function_info.num_instructions / instruction_block_size)
+                "num_instructions": num_instructions,
+                "num_instruction_blocks": round(num_instructions / instruction_block_size)
             }
-        # print(output_map)
+        # clusters are the functions matching a foreign family, ranked by size and then by first occurrence
+        pair_functions, pair_family_ids = self.foreign_family_pairs
+        is_own_function = pair_functions < len(self.function_metrics)
+        pair_functions, pair_family_ids = pair_functions[is_own_function], pair_family_ids[is_own_function]
+        family_ids, first_occurrences, cluster_sizes = np.unique(pair_family_ids, return_index=True, return_counts=True)
+        clusters = [(family_ids[index], cluster_sizes[index]) for index in np.argsort(first_occurrences)]
         cluster_index = 0
-        for family_id, function_ids in sorted(cluster_by_family_id.items(), key=lambda x: len(x[1]), reverse=True)[:num_top_cluster]:
-            # print(family_id, len(function_ids))
-            for function_id in function_ids:
-                output_map[function_id]["most_common_cluster"].append(cluster_index)
+        for family_id, _ in sorted(clusters, key=lambda x: x[1], reverse=True)[:num_top_cluster]:
+            for function_index in pair_functions[pair_family_ids == family_id]:
+                output_map[self.function_ids[function_index]]["most_common_cluster"].append(cluster_index)
             cluster_index += 1
         return output_map
 
     def _getSampleMatchScores(self):
         # TODO for some reason, we get match scores of 102 here? maybe related to how how match_is_pichash is used
-        this_family_id = self.sample_info.family_id
+        function_matches = self.match_report.function_matches
+        matches_by_function_index = defaultdict(list)
+        for match, function_index in zip(function_matches, self.match_function.tolist()):
+            matches_by_function_index[function_index].append(match)
+        num_foreign_families = self.num_foreign_families.tolist()
         adjusted_score_by_sample_id = defaultdict(int)
-        library_bytes_per_sample = 0
         matchable_binweight = 0
         best_individual_match = defaultdict(int)
         best_match_function_id = defaultdict(int)
-        for function_id, function_info in self.function_infos.items():
-            if function_info.num_instructions < 10:
+        for function_index, (function_id, num_instructions, binweight) in enumerate(zip(self.function_metrics.function_ids.tolist(), self.function_metrics.num_instructions.tolist(), self.function_metrics.binweights.tolist())):
+            if num_instructions < 10:
                 continue
-            if function_id in self.matches_by_function_id:
-                reduced_cluster = sorted(list(self.function_family_match_map[function_id].difference(set([this_family_id]))))
-                family_adjustment_value = 1 if len(reduced_cluster) < 3 else 1 + int(math.log(len(reduced_cluster), 2))
-                # no idea what/why this is here, num_bytes is undefined?
-                # if self.evaluated[function_id]["libraries"]:
-                #     library_bytes_per_sample += num_bytes
-                #    continue
-            matchable_binweight += function_info.binweight
+            num_families = num_foreign_families[function_index]
+            family_adjustment_value = 1 if num_families < 3 else 1 + int(math.log(num_families, 2))
+            matchable_binweight += binweight
             samples_seen = set()
-            if function_id in self.matches_by_function_id:
-                for match in self.matches_by_function_id[function_id]:
-                    score = (match.matched_score + match.match_is_pichash) / family_adjustment_value
-                    byte_score = score * match.num_bytes / 100
-                    if match.matched_sample_id not in samples_seen:
-                        samples_seen.add(match.matched_sample_id)
-                        adjusted_score_by_sample_id[match.matched_sample_id] += byte_score
-                    if byte_score > best_individual_match[match.matched_sample_id]:
-                        best_individual_match[match.matched_sample_id] = byte_score
-                        best_match_function_id[match.matched_sample_id] = f"{function_id}<->{match.matched_function_id} | conf: {match.matched_score + match.match_is_pichash}"
+            for match in matches_by_function_index[function_index]:
+                score = (match.matched_score + match.match_is_pichash) / family_adjustment_value
+                byte_score = score * match.num_bytes / 100
+                if match.matched_sample_id not in samples_seen:
+                    samples_seen.add(match.matched_sample_id)
+                    adjusted_score_by_sample_id[match.matched_sample_id] += byte_score
+                if byte_score > best_individual_match[match.matched_sample_id]:
+                    best_individual_match[match.matched_sample_id] = byte_score
+                    best_match_function_id[match.matched_sample_id] = f"{function_id}<->{match.matched_function_id} | conf: {match.matched_score + match.match_is_pichash}"
         for sample_id, score in sorted(adjusted_score_by_sample_id.items(), key=lambda x: x[1], reverse=True):
             print(f"{sample_id:>4}: {score / matchable_binweight * 100:>5.2f} - {score:>5.0f} -- {best_individual_match[sample_id]:>5.0f} -> {self.sample_infos[sample_id].family}--- {best_match_function_id[sample_id]}")
 
@@ -291,13 +293,6 @@ class MatchReportRenderer(object):
             for y in range(block_size):
                 pixels[x1 + x, y1 + y] = color
 
-    def drawFrame(self, pixels, x1, y1, x2, y2, block_size, color):
-        for xpixel in range(x1 - block_size, x2 + block_size):
-            for ypixel in range(y1 - block_size, y2 + block_size):
-                pixels[xpixel, ypixel] = color
-                if xpixel < x1 or xpixel >= x2 or ypixel < y1 or ypixel >= y2:
-                    pixels[xpixel, ypixel] = color
-
     def drawFamilyLegend(self, image, x, y):
         # TODO we can use this to draw boxes and scores
         draw = ImageDraw.Draw(image) 
@@ -310,6 +305,61 @@ class MatchReportRenderer(object):
         self.drawBlock(pixels, x + 1, y + 1, 11, self.frequency_color_map[0])
         # draw.text((diagram_x + num_columns * (block_size + 1) + 10, 5), text, fill=border_color_tuple, font=font, align ="left") 
 
+    def _getConfidenceScore(self, function_output, filtered_family_id=None, filtered_sample_id=None):
+        """ Answer the score of a function shown in the bottom diagram, based on filter preferences """
+        if filtered_sample_id is not None:
+            return function_output["best_score"]
+        if filtered_family_id is not None:
+            return function_output["best_target_family_score"]
+        return function_output["best_non_family_score"]
+
+    def _getFunctionColors(self, function_output, filtered_family_id=None, filtered_sample_id=None):
+        """ Answer the colors of a function in the top and library diagram """
+        top_color_tuple = (255, 255, 255)
+        # determine family color based on filter preferences
+        if filtered_family_id is None and filtered_sample_id is None:
+            if function_output["family_matches_log_score"] is not None:
+                if function_output["family_matches_log_score"] in self.frequency_color_map:
+                    top_color_tuple = self.frequency_color_map[function_output["family_matches_log_score"]]
+                else:
+                    top_color_tuple = self.frequency_color_map[max(self.frequency_color_map)]
+        elif filtered_family_id is not None:
+            if function_output["sample_matches_log_score"] is not None:
+                if function_output["sample_matches_log_score"] in self.frequency_color_map:
+                    top_color_tuple = self.frequency_color_map[function_output["sample_matches_log_score"]]
+                else:
+                    top_color_tuple = self.frequency_color_map[max(self.frequency_color_map)]
+        elif filtered_sample_id is not None:
+            if function_output["best_target_sample_score"] > 0:
+                top_color_tuple = self.frequency_color_map[1]
+        library_color_tuple = (255, 255, 255)
+        if function_output["library_match_class"]:
+            if function_output["library_match_class"] == "M":
+                library_color_tuple = (0xfd, 0x1a, 0x20)
+            elif function_output["library_match_class"] == "S":
+                library_color_tuple = (0x1f, 0xfe, 0x28)
+            elif function_output["library_match_class"] == "FM":
+                library_color_tuple = (0xfd, 0x8b, 0x8e)
+            elif function_output["library_match_class"] == "FS":
+                library_color_tuple = (0x91, 0xfe, 0x95)
+        return top_color_tuple, library_color_tuple
+
+    def _drawBlockColumns(self, canvas, x, y, stack_size, block_size, block_colors):
+        """ Paint a sequence of blocks column by column, top to bottom, with a 1 pixel gap between columns """
+        num_blocks = len(block_colors)
+        if num_blocks == 0:
+            return
+        num_full_columns, num_remaining_blocks = divmod(num_blocks, stack_size)
+        num_columns = num_full_columns + (1 if num_remaining_blocks else 0)
+        region = canvas[y:y + stack_size * block_size, x:x + num_columns * (block_size + 1)]
+        # view as (row, pixel row, column, pixel column, color) and skip the gap columns
+        blocks = region.reshape(stack_size, block_size, num_columns, block_size + 1, 3)[:, :, :, :block_size]
+        # block index i is at column i // stack_size, row i % stack_size
+        full_columns = block_colors[:num_full_columns * stack_size].reshape(num_full_columns, stack_size, 3).transpose(1, 0, 2)
+        blocks[:, :, :num_full_columns] = full_columns[:, None, :, None, :]
+        if num_remaining_blocks:
+            blocks[:num_remaining_blocks, :, num_full_columns] = block_colors[num_full_columns * stack_size:, None, None, :]
+
     def renderStackedDiagram(self, filtered_family_id=None, filtered_sample_id=None):
         background_color_tuple = (0xff, 0xff, 0xff)
         border_color_tuple = (0x22, 0x22, 0x22)
@@ -325,92 +375,47 @@ class MatchReportRenderer(object):
         stack_interval = 1
         stack_size = (math.ceil(int(num_blocks / (diagram_width / (block_size + 1))) / stack_interval) + 1) * stack_interval
         num_columns = int(num_blocks / stack_size) if num_blocks % stack_size == 0 else int(num_blocks / stack_size) + 1
-        print(f"stack size: {stack_size}, num columns: {num_columns}")
         window_size_x = 40 + diagram_width
         window_size_y = 40 + num_diagrams * stack_size * block_size + 20 * (num_diagrams - 1)
 
-        image = Image.new("RGB", (window_size_x, window_size_y), background_color_tuple)
-        pixels = image.load()
-        print(f"drawing diagram for {num_blocks} blocks, with stack size {stack_size} in {window_size_x}x{window_size_y} pixels.")
+        # we paint into an array (indexed y, x) and only convert it to an image once done
+        canvas = np.empty((window_size_y, window_size_x, 3), dtype=np.uint8)
+        canvas[:, :] = background_color_tuple
+        logging.debug("Drawing diagram for %d blocks, with stack size %d and %d columns in %dx%d pixels.", num_blocks, stack_size, num_columns, window_size_x, window_size_y)
         diagram_x = 20
         diagram_y = 20
         diagram_2_y = 20 + stack_size * block_size + 20
         diagram_3_y = 20 + stack_size * block_size + 20 + stack_size * block_size + 20
-        self.drawFrame(pixels, diagram_x - 1, diagram_y - 1, diagram_x + num_columns * (block_size + 1), 1 + diagram_y + stack_size * block_size, block_size, border_color_tuple)
-        self.drawFrame(pixels, diagram_x - 1, diagram_2_y - 1, diagram_x + num_columns * (block_size + 1), 1 + diagram_2_y + stack_size * block_size, block_size, border_color_tuple)
-        self.drawFrame(pixels, diagram_x - 1, diagram_3_y - 1, diagram_x + num_columns * (block_size + 1), 1 + diagram_3_y + stack_size * block_size, block_size, border_color_tuple)
-        block_index = 0
-        function_index = 0
+        for frame_y in [diagram_y, diagram_2_y, diagram_3_y]:
+            # frames are filled, the gaps between block columns remain in frame color
+            canvas[frame_y - 1 - block_size:1 + frame_y + stack_size * block_size + block_size, diagram_x - 1 - block_size:diagram_x + num_columns * (block_size + 1) + block_size] = border_color_tuple
+        # collect block colors in drawing order, matchable functions are separated by a block in border color
+        colors = []
+        counts = []
+        confidence_scores = []
         for function_id, function_output in sorted(output_map.items()):
-            color = self.frequency_color_map[0]
-            top_color_tuple = (255, 255, 255)
-            # determine confidence color based on filter preferences
-            bottom_color_tuple = self._mapConfidence(function_output["best_non_family_score"])
-            if filtered_family_id is not None:
-                bottom_color_tuple = self._mapConfidence(function_output["best_target_family_score"])
-            if filtered_sample_id is not None:
-                bottom_color_tuple = self._mapConfidence(function_output["best_score"])
-            # determine family color based on filter preferences
-            if filtered_family_id is None and filtered_sample_id is None:
-                if function_output["family_matches_log_score"] is not None:
-                    if function_output["family_matches_log_score"] in self.frequency_color_map:
-                        top_color_tuple = self.frequency_color_map[function_output["family_matches_log_score"]]
-                    else:
-                        top_color_tuple = self.frequency_color_map[max(self.frequency_color_map)]
-            elif filtered_family_id is not None:
-                if function_output["sample_matches_log_score"] is not None:
-                    if function_output["sample_matches_log_score"] in self.frequency_color_map:
-                        top_color_tuple = self.frequency_color_map[function_output["sample_matches_log_score"]]
-                    else:
-                        top_color_tuple = self.frequency_color_map[max(self.frequency_color_map)]
-            elif filtered_sample_id is not None:
-                if function_output["best_target_sample_score"] > 0:
-                    top_color_tuple = self.frequency_color_map[1]
-            library_color_tuple = (255, 255, 255)
-            if function_output["library_match_class"]:
-                if function_output["library_match_class"] == "M":
-                    library_color_tuple = (0xfd, 0x1a, 0x20)
-                elif function_output["library_match_class"] == "S":
-                    library_color_tuple = (0x1f, 0xfe, 0x28)
-                elif function_output["library_match_class"] == "FM":
-                    library_color_tuple = (0xfd, 0x8b, 0x8e)
-                elif function_output["library_match_class"] == "FS":
-                    library_color_tuple = (0x91, 0xfe, 0x95)
             if function_output["is_matchable"]:
-                if function_index:
-                    xindex = int(block_index / stack_size)
-                    yindex = block_index % stack_size
-                    x1 = diagram_x + xindex * (block_size + 1)
-                    y1 = diagram_y + yindex * block_size
-                    y2 = diagram_2_y + yindex * block_size
-                    y3 =  diagram_3_y + yindex * block_size
-                    self.drawBlock(pixels, x1, y1, block_size, border_color_tuple)
-                    self.drawBlock(pixels, x1, y2, block_size, border_color_tuple)
-                    self.drawBlock(pixels, x1, y3, block_size, border_color_tuple)
-                    block_index += 1
-                for index in range(function_output["num_instruction_blocks"]):
-                    xindex = int(block_index / stack_size)
-                    yindex = block_index % stack_size
-                    x1 = diagram_x + xindex * (block_size + 1)
-                    y1 = diagram_y + yindex * block_size
-                    y2 = diagram_2_y + yindex * block_size
-                    y3 = diagram_3_y + yindex * block_size
-                    self.drawBlock(pixels, x1, y1, block_size, top_color_tuple)
-                    self.drawBlock(pixels, x1, y2, block_size, library_color_tuple)
-                    self.drawBlock(pixels, x1, y3, block_size, bottom_color_tuple)
-                    block_index += 1
-                function_index += 1
-        for _ in range(num_blocks % stack_size):
-            xindex = int(block_index / stack_size)
-            yindex = block_index % stack_size
-            x1 = diagram_x + xindex * (block_size + 1)
-            y1 = diagram_y + yindex * block_size
-            self.drawBlock(pixels, x1, y1, block_size, border_color_tuple)
-            block_index += 1
-        return image
+                if counts:
+                    colors.append((border_color_tuple, ) * 3)
+                    counts.append(1)
+                    confidence_scores.append(None)
+                colors.append(self._getFunctionColors(function_output, filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id) + (border_color_tuple, ))
+                counts.append(function_output["num_instruction_blocks"])
+                confidence_scores.append(self._getConfidenceScore(function_output, filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id))
+        colors = np.array(colors, dtype=np.uint8).reshape(-1, 3, 3)
+        # confidence colors of all functions are mapped at once, separators keep the border color
+        is_function = np.array([score is not None for score in confidence_scores], dtype=bool)
+        if is_function.any():
+            colors[is_function, 2] = MATCH_SCALE_50.getRgbArray([score for score in confidence_scores if score is not None])
+        block_colors = np.repeat(colors, counts, axis=0)
+        top_block_colors = np.concatenate([block_colors[:, 0], np.array([border_color_tuple] * (num_blocks % stack_size), dtype=np.uint8).reshape(-1, 3)])
+        self._drawBlockColumns(canvas, diagram_x, diagram_y, stack_size, block_size, top_block_colors)
+        self._drawBlockColumns(canvas, diagram_x, diagram_2_y, stack_size, block_size, block_colors[:, 1])
+        self._drawBlockColumns(canvas, diagram_x, diagram_3_y, stack_size, block_size, block_colors[:, 2])
+        return Image.fromarray(canvas, "RGB")
 
     def getLibraryStats(self):
-        total_count = len(self.function_infos)
+        total_count = len(self.function_metrics)
         total_ins_count = 0
         single_count = 0
         single_ins_count = 0
@@ -418,27 +423,21 @@ class MatchReportRenderer(object):
         multi_ins_count = 0
         library_counts = defaultdict(int)
         library_ins_counts = defaultdict(int)
-        # TODO build a dict with function_id -> matched library family id?
-        function_library_match_map = {}
-        for match in self.match_report.function_matches:
-            if match.function_id not in function_library_match_map:
-                function_library_match_map[match.function_id] = set([])
-            if match.match_is_library:
-                function_library_match_map[match.function_id].add(match.matched_family_id)
-        for function_id, function_info in self.function_infos.items():
-            total_ins_count += function_info.num_instructions
-            if function_info.function_id in function_library_match_map:
-                if len(function_library_match_map[function_info.function_id]) == 0:
-                    continue
-                elif len(function_library_match_map[function_info.function_id]) == 1:
-                    single_count += 1
-                    single_ins_count += function_info.num_instructions
-                elif len(function_library_match_map[function_info.function_id]) > 1:
-                    multi_count += 1
-                    multi_ins_count += function_info.num_instructions
-                    for family_id in function_library_match_map[function_info.function_id]:
-                        library_counts[family_id] += 1
-                        library_ins_counts[family_id] += function_info.num_instructions
+        num_library_families = self.num_library_families.tolist()
+        library_family_ids_by_function = defaultdict(list)
+        for function_index, family_id in zip(*[values.tolist() for values in self.library_family_pairs]):
+            library_family_ids_by_function[function_index].append(family_id)
+        for function_index, num_instructions in enumerate(self.function_metrics.num_instructions.tolist()):
+            total_ins_count += num_instructions
+            if num_library_families[function_index] == 1:
+                single_count += 1
+                single_ins_count += num_instructions
+            elif num_library_families[function_index] > 1:
+                multi_count += 1
+                multi_ins_count += num_instructions
+                for family_id in library_family_ids_by_function[function_index]:
+                    library_counts[family_id] += 1
+                    library_ins_counts[family_id] += num_instructions
         return {
             "total_count": total_count,
             "total_ins_count": total_ins_count,
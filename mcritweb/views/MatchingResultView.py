@@ -0,0 +1,71 @@
+from mcrit.storage.MatchingResult import MatchingResult
+
+
+class MatchingResultView(object):
+    """ Read-only presentation of a (filtered) MatchingResult for the paginated result pages.
+
+    MatchingResult recomputes its aggregations on every call, only to slice a page out of them.
+    Here, aggregations, family groupings and sort orders are computed once and pages are served
+    as slices. Everything else is delegated to the wrapped MatchingResult, so the view can be
+    used in its place.
+    """
+
+    def __init__(self, matching_result: MatchingResult) -> None:
+        self.matching_result = matching_result
+        self._aggregated_function_matches = None
+        self._best_sample_matches_per_family = None
+        self._sample_matches = None
+        self._family_names_by_id = None
+        self._num_matched_function_ids = None
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the view itself
+        if name.startswith("__") or name == "matching_result":
+            raise AttributeError(name)
+        return getattr(self.matching_result, name)
+
+    @staticmethod
+    def _slice(entries, start=None, limit=None):
+        if start is not None:
+            entries = entries[start:]
+        if limit is not None:
+            entries = entries[:limit]
+        return entries
+
+    def getAggregatedFunctionMatches(self, start=None, limit=None):
+        if self._aggregated_function_matches is None:
+            self._aggregated_function_matches = self.matching_result.getAggregatedFunctionMatches()
+        return self._slice(self._aggregated_function_matches, start, limit)
+
+    def getBestSampleMatchesPerFamily(self, start=None, limit=None):
+        if self._best_sample_matches_per_family is None:
+            self._best_sample_matches_per_family = self.matching_result.getBestSampleMatchesPerFamily()
+        return self._slice(self._best_sample_matches_per_family, start, limit)
+
+    def getSampleMatches(self, start=None, limit=None):
+        if self._sample_matches is None:
+            self._sample_matches = self.matching_result.getSampleMatches()
+        return self._slice(self._sample_matches, start, limit)
+
+    def getFunctionsSlice(self, start, limit):
+        return self.matching_result.function_matches[start:start+limit]
+
+    def getFamilyNameByFamilyId(self, family_id):
+        if self._family_names_by_id is None:
+            family_names_by_id = {}
+            for sample_match in self.matching_result.sample_matches:
+                family_names_by_id.setdefault(sample_match.family_id, sample_match.family)
+            self._family_names_by_id = family_names_by_id
+        return self._family_names_by_id.get(family_id, "")
+
+    def getNumAggregatedFunctionMatches(self):
+        return len(self.getAggregatedFunctionMatches())
+
+    def getNumFamiliesMatched(self):
+        # families are grouped by name, just as when picking the best sample match per family
+        return len(self.getBestSampleMatchesPerFamily())
+
+    def getNumMatchedFunctionIds(self):
+        if self._num_matched_function_ids is None:
+            self._num_matched_function_ids = len(set([function_match.matched_function_id for function_match in self.matching_result.function_matches]))
+        return self._num_matched_function_ids
@@ -1,135 +1,17 @@
-class ScoreColorProvider(object):
-    
-    frequency_color_map = {
-        # white
-        0 : (0xff, 0xff, 0xff),
-        # dark blue
-        1: (0x00, 0x45, 0xba),
-        # blue
-        2: (0x10, 0x7f, 0xfc),
-        # light blue
-        3: (0x22, 0xfe, 0xfd),
-        # green
-        4: (0x1f, 0xfe, 0x28),
-        # green yellow: (0xc1, 0xfe. 0x2f)
-        # yellow
-        5: (0xff, 0xff, 0x35),
-        # light orange: (0xfe, 0xc1, 0x2c)
-        # orange
-        6: (0xfe, 0x82, 0x25),
-        # light red:
-        #6: (0xfd, 0x46, 0x21),
-        # red
-        7: (0xfd, 0x1a, 0x20),
-        # violet
-        8: (0xb4, 0x00, 0xff)
-    }
-
-    matching_color_map_100 = {
-        # white
-        0 : (0xff, 0xff, 0xff),
-        # blue
-        1: (0x00, 0x80, 0xff),
-        # cyan
-        2: (0x00, 0xff, 0xff),
-        # green
-        3: (0x00, 0xff, 0x00),
-        # lime
-        4: (0xc0, 0xff, 0x00),
-        # yellow
-        5: (0xff, 0xff, 0x00),
-        # orange
-        6: (0xff, 0xc0, 0x00),
-        # dark orange
-        7: (0xff, 0x80, 0x00),
-        # red-orange
-        8: (0xff, 0x40, 0x00),
-        # red
-        9: (0xff, 0x00, 0x00),
-        # light grey
-        10: (0x44, 0x44, 0x44)
-    }
+from mcritweb.views.score_colors import MATCH_SCALE_100, MATCH_SCALE_50, FREQUENCY_SCALE
 
-    matching_color_map_50 = {
-        # white
-        0: (0xff, 0xff, 0xff),
-        # dark blue
-        1: (0x00, 0x45, 0xba),
-        # blue
-        2: (0x00, 0x80, 0xff),
-        # light blue
-        3: (0x22, 0xfe, 0xfd),
-        # green
-        4: (0x1f, 0xfe, 0x28),
-        # yellow
-        5: (0xff, 0xff, 0x35),
-        # orange
-        6: (0xfe, 0x82, 0x25),
-        # red
-        7: (0xfd, 0x1a, 0x20),
-    }
 
-    def _tupleToHex(self, tup, opacity=1):
-        return "".join([f"{int(255 - opacity * (255 - e)):02x}" for e in tup])
+class ScoreColorProvider(object):
+    """ Background colors for scores in result tables, looked up from the shared color scales """
 
     def getMatchHexColorByScore100(self, score, opacity=1):
-        if score >= 90:
-            return self._tupleToHex(self.matching_color_map_100[1], opacity)
-        if score >= 80:
-            return self._tupleToHex(self.matching_color_map_100[2], opacity)
-        elif score >= 70:
-            return self._tupleToHex(self.matching_color_map_100[3], opacity)
-        elif score >= 60:
-            return self._tupleToHex(self.matching_color_map_100[4], opacity)
-        elif score >= 50:
-            return self._tupleToHex(self.matching_color_map_100[5], opacity)
-        elif score >= 40:
-            return self._tupleToHex(self.matching_color_map_100[6], opacity)
-        elif score >= 30:
-            return self._tupleToHex(self.matching_color_map_100[7], opacity)
-        elif score >= 20:
-            return self._tupleToHex(self.matching_color_map_100[8], opacity)
-        elif score >= 10:
-            return self._tupleToHex(self.matching_color_map_100[9], opacity)
-        elif score > 0:
-            return self._tupleToHex(self.matching_color_map_100[10], opacity)
-        return self._tupleToHex(self.frequency_color_map[0])
+        return MATCH_SCALE_100.getHex(score, opacity)
 
     def getMatchHexColorByScore50(self, score, opacity=1):
-        if score > 100:
-            return self._tupleToHex(self.matching_color_map_50[1], opacity)
-        elif score == 100:
-            return self._tupleToHex(self.matching_color_map_50[2], opacity)
-        elif score >= 90:
-            return self._tupleToHex(self.matching_color_map_50[3], opacity)
-        elif score >= 80:
-            return self._tupleToHex(self.matching_color_map_50[4], opacity)
-        elif score >= 70:
-            return self._tupleToHex(self.matching_color_map_50[5], opacity)
-        elif score >= 60:
-            return self._tupleToHex(self.matching_color_map_50[6], opacity)
-        elif score >= 50:
-            return self._tupleToHex(self.matching_color_map_50[7], opacity)
-        return self._tupleToHex(self.frequency_color_map[0])
+        return MATCH_SCALE_50.getHex(score, opacity)
 
     def getFrequencyHexColorByScore(self, score, opacity=1):
-        if score > 100:
-            return self._tupleToHex(self.frequency_color_map[1], opacity)
-        if score > 95:
-            return self._tupleToHex(self.frequency_color_map[2], opacity)
-        elif score >= 90:
-            return self._tupleToHex(self.frequency_color_map[3], opacity)
-        elif score >= 80:
-            return self._tupleToHex(self.frequency_color_map[4], opacity)
-        elif score >= 70:
-            return self._tupleToHex(self.frequency_color_map[5], opacity)
-        elif score >= 60:
-            return self._tupleToHex(self.frequency_color_map[6], opacity)
-        elif score >= 50:
-            return self._tupleToHex(self.frequency_color_map[7], opacity)
-        elif score >= 40:
-            return self._tupleToHex(self.frequency_color_map[8], opacity)
-        return self._tupleToHex(self.frequency_color_map[0])
+        return FREQUENCY_SCALE.getHex(score, opacity)
 
     def getMatchHexColorFromResult(self, match_result, score_type, scale=100, opacity=0.4):
         if score_type not in ["matched_percent_score_weighted", "matched_percent_frequency_weighted", "matched_percent_nonlib_score_weighted", "matched_percent_nonlib_frequency_weighted", "matched_score"]:
@@ -142,4 +24,4 @@ class ScoreColorProvider(object):
                 return self.getMatchHexColorByScore100(score, opacity=opacity)
 
     def __init__(self) -> None:
-        pass
\ No newline at end of file
+        pass
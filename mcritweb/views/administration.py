@@ -1,13 +1,23 @@
 import re
 from werkzeug.security import check_password_hash, generate_password_hash
-from flask import current_app, Blueprint, render_template, g, request, flash, redirect, url_for, session
+from flask import current_app, Blueprint, render_template, g, request, flash, redirect, url_for, session, jsonify
 
-from mcrit.client.McritClient import McritClient
-
-from mcritweb.views.utility import get_server_url
 from mcritweb import db
 from mcritweb.views.authentication import admin_required, login_required, multi_user
-from mcritweb.views.utility import get_server_url, set_server_url, get_mcritweb_version_from_setup
+from mcritweb.views.utility import get_client, get_server_url, set_server_url, get_mcritweb_version_from_setup
+from mcritweb.views.server_health import health_monitor
+from mcritweb.views.result_cache import result_cache
+from mcritweb.views.matching_result_cache import matching_result_cache
+from mcritweb.views.diagram_renderer import diagram_renderer
+from mcritweb.views.function_metrics import function_metrics_store
+from mcritweb.views.cfg_cache import cfg_cache
+from mcritweb.views.block_fingerprints import block_fingerprint_cache
+from mcritweb.views.upstream_fetcher import upstream_fetcher
+from mcritweb.views.job_cache import finished_job_cache
+from mcritweb.views.job_progress import job_progress_monitor
+from mcritweb.views.family_names import family_name_index
+from mcritweb.views.sample_cache import sample_cache
+from mcritweb.views.import_stream import import_manager
 
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -37,6 +47,7 @@ def change_username():
     if error is None:
         database.execute("UPDATE user SET username = ? WHERE id = ?",(new_username, user['id']),)
         database.commit()
+        db.invalidate_server_config()
         flash('Username successfully changed', category='success')
         return redirect(url_for('index'))
     flash(error, category='error')
@@ -65,6 +76,7 @@ def change_password():
     if error is None:
         database.execute("UPDATE user SET password = ? WHERE id = ?",(generate_password_hash(new_password), user['id']),)
         database.commit()
+        db.invalidate_server_config()
         flash('Password successfully changed', category='success') 
         return redirect(url_for('index'))
     flash(error, category='error')
@@ -98,6 +110,7 @@ def change_user_role(id, role, tab):
     database = db.get_db() 
     database.execute("UPDATE user SET role = ? WHERE id = ?",(role, id),)
     database.commit()
+    db.invalidate_server_config()
     return redirect(url_for('admin.users', tab=tab))
 
 
@@ -112,6 +125,7 @@ def delete_user(id, tab = None):
     database = db.get_db() 
     database.execute("DELETE FROM user WHERE id = ?",(id),)
     database.commit()
+    db.invalidate_server_config()
     return redirect(url_for('admin.users', tab=tab))
 
 
@@ -125,9 +139,21 @@ def server():
     operation_mode_str = "Multi-User" if operation_mode == "multi" else "Single-User"
     db_server_version = db.get_server_version()
     running_server_version = get_mcritweb_version_from_setup()
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     mcrit_version = client.getVersion()
-    return render_template('admin_server.html', current_url=get_server_url(), server_uuid=server_uuid, registration_token=registration_token, operation_mode=operation_mode_str, db_version=db_server_version, running_version=running_server_version, mcrit_version=mcrit_version)
+    return render_template('admin_server.html', current_url=get_server_url(), server_uuid=server_uuid, registration_token=registration_token, operation_mode=operation_mode_str, db_version=db_server_version, running_version=running_server_version, mcrit_version=mcrit_version, health=health_monitor.getStatistics(), result_cache_stats=result_cache.getStatistics(), matching_result_cache_stats=matching_result_cache.getStatistics())
+
+
+@bp.route('/server/health')
+@admin_required
+def server_health():
+    return jsonify({**health_monitor.getStatistics(), "upstream": upstream_fetcher.getStatistics(), "job_progress": job_progress_monitor.getStatistics(), "imports": import_manager.getStatistics()})
+
+
+@bp.route('/server/cache')
+@admin_required
+def server_cache():
+    return jsonify({"results": result_cache.getStatistics(), "matching_results": matching_result_cache.getStatistics(), "diagrams": diagram_renderer.getStatistics(), "function_metrics": function_metrics_store.getStatistics(), "cfg": cfg_cache.getStatistics(), "fingerprints": block_fingerprint_cache.getStatistics(), "jobs": finished_job_cache.getStatistics(), "family_names": family_name_index.getStatistics(), "samples": sample_cache.getStatistics()})
 
 
 @bp.route('/change_server' , methods=('GET', 'POST'))
@@ -147,10 +173,20 @@ def change_server():
 def reset_server():
     reset_confirmation = request.form.get('reset_server', '')
     if reset_confirmation and reset_confirmation == "RESET":
-        client = McritClient(mcrit_server=get_server_url())
+        client = get_client()
         client.respawn()
         from mcritweb.views.utility import ensure_local_data_paths
         ensure_local_data_paths(current_app, clear_data=True)
-        # TODO also clean all locally cached data.
+        result_cache.clear()
+        matching_result_cache.clear()
+        diagram_renderer.clear()
+        function_metrics_store.clear()
+        cfg_cache.clear()
+        block_fingerprint_cache.clear()
+        finished_job_cache.clear()
+        job_progress_monitor.clear()
+        family_name_index.clear()
+        sample_cache.clear()
+        db.invalidate_server_config()
         flash('A reset of MCRIT was successfully performed.', category='success')
         return redirect(url_for('index'))
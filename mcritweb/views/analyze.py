@@ -2,14 +2,14 @@ import re
 import os
 from hashlib import sha256
 from flask import Blueprint, render_template, request, redirect, session, url_for, current_app, json, flash
-from mcrit.client.McritClient import McritClient
 from mcrit.storage.SampleEntry import SampleEntry
 
 from mcritweb.views.authentication import visitor_required, contributor_required
-from mcritweb.views.utility import get_server_url, mcrit_server_required
+from mcritweb.views.utility import get_client, mcrit_server_required
 from mcritweb.views.pagination import Pagination
 from mcritweb.views.cursor_pagination import CursorPagination
 from mcritweb.views.cross_compare import score_to_color
+from mcritweb.views.sample_cache import sample_cache
 
 bp = Blueprint('analyze', __name__, url_prefix='/analyze')
 
@@ -18,7 +18,7 @@ bp = Blueprint('analyze', __name__, url_prefix='/analyze')
 @visitor_required
 @mcrit_server_required
 def blocks_family(family_id):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     job_id = client.requestUniqueBlocksForFamily(family_id)
     return redirect(url_for('data.job_by_id', job_id=job_id, refresh=3))
 
@@ -27,7 +27,7 @@ def blocks_family(family_id):
 @visitor_required
 @mcrit_server_required
 def blocks_sample(sample_id):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     job_id = client.requestUniqueBlocksForSamples([sample_id])
     return redirect(url_for('data.job_by_id', job_id=job_id, refresh=3))
 
@@ -41,7 +41,7 @@ def compare_submit_query():
 @visitor_required
 @mcrit_server_required
 def cross_compare():
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
 
     selected = request.args.get('samples', '').strip(',')
     cached = request.args.get('cache','').strip(',')
@@ -51,7 +51,7 @@ def cross_compare():
     selected_list = [int(x) for x in selected.split(',') if x != '']
 
     pagination_selected = Pagination(request, len(selected_list), limit=10, query_param="ps")
-    selected_dict = {x: client.getSampleById(x) for x in sorted(selected_list)[pagination_selected.start_index:pagination_selected.start_index+pagination_selected.limit]}
+    selected_dict = sample_cache.getSamples(client, sorted(selected_list)[pagination_selected.start_index:pagination_selected.start_index+pagination_selected.limit])
     invalid_ids = []
     for id, sample in selected_dict.items():
         if sample is None:
@@ -99,7 +99,7 @@ def cross_compare():
 @visitor_required
 @mcrit_server_required
 def start_cross_compare():
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
     selected = request.args.get('samples', '')
     rematch = request.args.get('rematch', '')
     try:
@@ -119,7 +119,7 @@ def start_cross_compare():
 @visitor_required
 @mcrit_server_required
 def compare():
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
 
     query = request.args.get('query', "")
     samples = []
@@ -147,7 +147,7 @@ def compare():
 @visitor_required
 @mcrit_server_required
 def compare_versus():
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
 
     parameters = {}
     for a_or_b in "ab":
@@ -175,7 +175,7 @@ def compare_versus():
 @visitor_required
 @mcrit_server_required
 def compare_all(sample_id_a):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     rematch = request.args.get('rematch', False)
     try:
         minhash_band_range = int(request.args.get('minhashBandRange', "2"))
@@ -191,7 +191,7 @@ def compare_all(sample_id_a):
 @visitor_required
 @mcrit_server_required
 def compare_vs(sample_id_a, sample_id_b):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     rematch = request.args.get('rematch', False)
     try:
         minhash_band_range = int(request.args.get('minhashBandRange', "2"))
@@ -207,7 +207,7 @@ def compare_vs(sample_id_a, sample_id_b):
 @mcrit_server_required
 @contributor_required
 def query():
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     if request.method == 'POST':
         f = request.files.get('file')
         if f is None:
@@ -237,4 +237,4 @@ def query():
         else:
             flash('Sample could not be disassembled!', category='error')
             return "", 400 # Bad Request
-    return render_template('query.html', families=[], show_submit_fields=False)
\ No newline at end of file
+    return render_template('query.html', show_submit_fields=False)
\ No newline at end of file
@@ -19,9 +19,7 @@ def set_is_first_user():
 @bp.before_app_request
 def set_operation_mode():
     if not g.first_user:
-        database = db.get_db()
-        operation_mode = database.execute('SELECT operation_mode FROM server',).fetchone()
-        g.operation_mode = operation_mode['operation_mode']
+        g.operation_mode = db.get_operation_mode()
 
 def multi_user(view):
     @functools.wraps(view)
@@ -85,6 +83,7 @@ def register():
                         (username, generate_password_hash(password), 'pending', datetime.now(), 'no login'),
                     )
                 database.commit()
+                db.invalidate_server_config()
             except database.IntegrityError:
                 error = f"User {username} is already registered."
             else:
@@ -127,6 +126,7 @@ def login():
             session['user_id'] = user['id']
             database.execute("UPDATE user SET last_login = ? WHERE id = ?",(datetime.now(), user['id']),)
             database.commit()
+            db.invalidate_server_config()
             return redirect(url_for('index'))
 
         flash(error, category='error')
@@ -141,9 +141,7 @@ def load_logged_in_user():
     if user_id is None:
         g.user = None
     else:
-        g.user = db.get_db().execute(
-            'SELECT * FROM user WHERE id = ?', (user_id,)
-        ).fetchone()
+        g.user = db.get_user_by_id(user_id)
 
 def login_required(view):
     @functools.wraps(view)
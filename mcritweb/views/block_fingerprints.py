@@ -0,0 +1,238 @@
+import os
+import struct
+import hashlib
+
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+from smda.intel.IntelInstructionEscaper import IntelInstructionEscaper
+
+from mcritweb.views.result_cache import ResultCache
+from mcritweb.views.utility import get_client, get_server_url
+from mcritweb.views.upstream_fetcher import upstream_fetcher
+
+
+# no match / base color: bleak red
+UNMATCHED_COLOR = "#FFA0A0"
+
+
+def _hash_to_int(data):
+    return struct.unpack("Q", hashlib.sha256(data).digest()[:8])[0]
+
+
+def create_block_fingerprints(function_entry, sample_entry):
+    """ Fingerprint all blocks of a function (with xcfg) in a single escaping pass over its instructions.
+
+    Per block, in block order, we derive:
+    + escaped_hashes: hash over escaped mnemonics and operands
+    + picblock_hashes: ad-hoc picblock hash over the escaped binary, regardless of block size
+    + tokens: mnemonic with escaped operands per instruction, symbolified for Levenshtein matching
+    """
+    smda_function = function_entry.toSmdaFunction()
+    lower_addr = sample_entry.base_addr
+    upper_addr = sample_entry.base_addr + sample_entry.binary_size
+    fingerprints = {
+        "offsets": [],
+        "escaped_hashes": [],
+        "picblock_hashes": [],
+        "tokens": [],
+        "picblockhashes": function_entry.picblockhashes,
+    }
+    for block in smda_function.getBlocks():
+        escaped_ins_seq = []
+        escaped_binary_seq = []
+        tokens = []
+        for instruction in block.getInstructions():
+            escaped_operands = IntelInstructionEscaper.escapeOperands(instruction)
+            escaped_ins_seq.append(IntelInstructionEscaper.escapeMnemonic(instruction.mnemonic) + " " + escaped_operands)
+            escaped_binary_seq.append(instruction.getEscapedBinary(IntelInstructionEscaper, escape_intraprocedural_jumps=True, lower_addr=lower_addr, upper_addr=upper_addr))
+            tokens.append(instruction.mnemonic + " " + escaped_operands)
+        fingerprints["offsets"].append(block.offset)
+        fingerprints["escaped_hashes"].append(_hash_to_int(";".join(escaped_ins_seq).encode("ascii")))
+        fingerprints["picblock_hashes"].append(_hash_to_int(bytes([ord(c) for c in "".join(escaped_binary_seq)])))
+        fingerprints["tokens"].append(tokens)
+    return fingerprints
+
+
+class BlockFingerprintCache(ResultCache):
+    """ Local cache for block fingerprints per server and function_id in instance/cache/fingerprints.
+
+    Function entries never change once a sample is indexed, so fingerprints stay valid
+    until the local cache is cleared with a server reset. As for CfgCache, the key is derived
+    from the server URL, so function_ids of different servers never share an entry.
+    """
+
+    def __init__(self, cache_path=None, max_bytes=256 * 1024 ** 2, max_entries=10000) -> None:
+        super().__init__(cache_path=cache_path, max_bytes=max_bytes, max_entries=max_entries)
+
+    def init_app(self, app):
+        self.cache_path = os.sep.join([app.instance_path, "cache", "fingerprints"])
+        self.max_bytes = app.config.get("FINGERPRINT_CACHE_MAX_BYTES", self.max_bytes)
+        self.max_entries = app.config.get("FINGERPRINT_CACHE_MAX_ENTRIES", self.max_entries)
+        self.clear()
+
+    def getFingerprints(self, function_id, sample_entry=None):
+        """ Answer the block fingerprints for function_id, only fetching from MCRIT on a miss, None for unknown functions """
+        key_material = f"{get_server_url()}|{int(function_id)}"
+        key = hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+        fingerprints = self.get(key)
+        if not fingerprints:
+            client = get_client()
+            function_entry = client.getFunctionById(function_id, with_xcfg=True)
+            if not function_entry:
+                return None
+            if sample_entry is None or sample_entry.sample_id != function_entry.sample_id:
+                sample_entry = client.getSampleById(function_entry.sample_id)
+            fingerprints = create_block_fingerprints(function_entry, sample_entry)
+            self.put(key, fingerprints)
+        return fingerprints
+
+
+block_fingerprint_cache = BlockFingerprintCache()
+
+
+def _get_hash_matches(hashes_a, hashes_b, color):
+    """ Color all blocks whose hash is found in both functions, hashes given as offset -> hash pairs """
+    node_colors = {"a": {}, "b": {}}
+    hashes_a = list(hashes_a)
+    hashes_b = list(hashes_b)
+    shared_hashes = set(block_hash for _, block_hash in hashes_a).intersection(block_hash for _, block_hash in hashes_b)
+    for side, hashes in (("a", hashes_a), ("b", hashes_b)):
+        for addr, block_hash in hashes:
+            if block_hash in shared_hashes:
+                node_colors[side][f"Node0x{addr:x}"] = color
+    return node_colors
+
+
+def get_full_picblock_matches(fingerprints_a, fingerprints_b):
+    return _get_hash_matches(
+        [(pbh["offset"], pbh["hash"]) for pbh in fingerprints_a["picblockhashes"]],
+        [(pbh["offset"], pbh["hash"]) for pbh in fingerprints_b["picblockhashes"]],
+        "#00DDFF"
+    )
+
+
+def get_all_picblock_matches(fingerprints_a, fingerprints_b):
+    return _get_hash_matches(
+        zip(fingerprints_a["offsets"], fingerprints_a["picblock_hashes"]),
+        zip(fingerprints_b["offsets"], fingerprints_b["picblock_hashes"]),
+        "#C0F4FF"
+    )
+
+
+def get_escaped_matches(fingerprints_a, fingerprints_b):
+    return _get_hash_matches(
+        zip(fingerprints_a["offsets"], fingerprints_a["escaped_hashes"]),
+        zip(fingerprints_b["offsets"], fingerprints_b["escaped_hashes"]),
+        "#00ff00"
+    )
+
+
+def _symbolify(tokens, alphabet):
+    """ Map tokens to symbols of an integer alphabet, encoded as code points so blocks are compared as strings """
+    symbols = []
+    for token in tokens:
+        symbol = alphabet.get(token)
+        if symbol is None:
+            symbol = len(alphabet)
+            # skip the surrogate range, which is not valid on its own in strings
+            symbol = chr(symbol if symbol < 0xD800 else symbol + 0x800)
+            alphabet[token] = symbol
+        symbols.append(symbol)
+    return "".join(symbols)
+
+
+def get_levenshtein_matches(fingerprints_a, fingerprints_b, unmatched_nodes, max_distance=3, max_cells=2 ** 24):
+    node_colors = {"a": {}, "b": {}}
+    # across all blocks in unmatched nodes, collect tokens and map to symbols
+    # token -> symbol, like "M REG, REG" -> 0
+    alphabet = {}
+    candidate_blocks = {"a": ([], []), "b": ([], [])}
+    for side, fingerprints in (("a", fingerprints_a), ("b", fingerprints_b)):
+        unmatched_offsets = set(unmatched_nodes[side])
+        offsets, symbolified_blocks = candidate_blocks[side]
+        for offset, tokens in zip(fingerprints["offsets"], fingerprints["tokens"]):
+            if offset in unmatched_offsets:
+                offsets.append(offset)
+                symbolified_blocks.append(_symbolify(tokens, alphabet))
+    offsets_a, symbolified_a = candidate_blocks["a"]
+    offsets_b, symbolified_b = candidate_blocks["b"]
+    if not offsets_a or not offsets_b:
+        return node_colors
+    # compute all distances up to max_distance in parallel, with pairs further apart cut off early in rapidfuzz,
+    # in slices of rows to bound the size of the distance matrix
+    pair_rows, pair_cols, pair_distances = [], [], []
+    num_rows = max(1, max_cells // len(symbolified_b))
+    for row_start in range(0, len(symbolified_a), num_rows):
+        distances = process.cdist(symbolified_a[row_start:row_start + num_rows], symbolified_b, scorer=Levenshtein.distance, score_cutoff=max_distance, dtype=np.int8, workers=-1)
+        rows, cols = np.nonzero(distances <= max_distance)
+        pair_rows.append(rows + row_start)
+        pair_cols.append(cols)
+        pair_distances.append(distances[rows, cols])
+    pair_distances = np.concatenate(pair_distances)
+    order = np.argsort(pair_distances, kind="stable")
+    pair_rows = np.concatenate(pair_rows)[order].tolist()
+    pair_cols = np.concatenate(pair_cols)[order].tolist()
+    pair_distances = pair_distances[order].tolist()
+    # greedy assignment by ascending distance, ties in order of blocks in a, then b
+    used_blocks = set()
+    for row, col, distance in zip(pair_rows, pair_cols, pair_distances):
+        block_a = offsets_a[row]
+        block_b = offsets_b[col]
+        if block_a not in used_blocks and block_b not in used_blocks:
+            node_colors["a"][f"Node0x{block_a:x}"] = distance
+            node_colors["b"][f"Node0x{block_b:x}"] = distance
+            used_blocks.add(block_a)
+            used_blocks.add(block_b)
+    # fix distances to colors
+    distance_to_color = {
+        99: UNMATCHED_COLOR,
+        0: "#40ff40",
+        1: "#c0ff80",
+        2: "#FFFF40",
+        3: "#FFCC40",
+    }
+    node_colors["a"] = {k: distance_to_color[v] for k, v in node_colors["a"].items()}
+    node_colors["b"] = {k: distance_to_color[v] for k, v in node_colors["b"].items()}
+    return node_colors
+
+
+def get_matches_node_colors(function_id_a, function_id_b, sample_entry_a=None, sample_entry_b=None):
+    fingerprints_a, fingerprints_b = upstream_fetcher.fetch(
+        lambda: block_fingerprint_cache.getFingerprints(function_id_a, sample_entry=sample_entry_a),
+        lambda: block_fingerprint_cache.getFingerprints(function_id_b, sample_entry=sample_entry_b),
+    )
+    if fingerprints_a is None or fingerprints_b is None:
+        return None
+    return get_fingerprint_node_colors(fingerprints_a, fingerprints_b)
+
+
+def get_fingerprint_node_colors(fingerprints_a, fingerprints_b):
+    """ Answer the node colors of both functions, fingerprints must not be None (unknown functions) """
+    # thresholded edit distance match over escaped instruction sequence: green to orange
+    node_colors = {"a": {}, "b": {}}
+    for offset in fingerprints_a["offsets"]:
+        node_colors["a"][f"Node0x{offset:x}"] = UNMATCHED_COLOR
+    for offset in fingerprints_b["offsets"]:
+        node_colors["b"][f"Node0x{offset:x}"] = UNMATCHED_COLOR
+    # escaped blocks matches
+    escaped_block_matches = get_escaped_matches(fingerprints_a, fingerprints_b)
+    node_colors["a"].update(escaped_block_matches["a"])
+    node_colors["b"].update(escaped_block_matches["b"])
+    # ad-hoc picblock match (small BB): bleak teal
+    smaller_picblock_matches = get_all_picblock_matches(fingerprints_a, fingerprints_b)
+    node_colors["a"].update(smaller_picblock_matches["a"])
+    node_colors["b"].update(smaller_picblock_matches["b"])
+    # override "full" picblocks with 4+ addresses
+    full_matches = get_full_picblock_matches(fingerprints_a, fingerprints_b)
+    node_colors["a"].update(full_matches["a"])
+    node_colors["b"].update(full_matches["b"])
+    # compare everything not colored by now using our adapted Levenshtein
+    unmatched_nodes = {
+        "a": [int(k[6:], 16) for k, v in node_colors["a"].items() if v == UNMATCHED_COLOR],
+        "b": [int(k[6:], 16) for k, v in node_colors["b"].items() if v == UNMATCHED_COLOR],
+    }
+    levenshtein_matches = get_levenshtein_matches(fingerprints_a, fingerprints_b, unmatched_nodes)
+    node_colors["a"].update(levenshtein_matches["a"])
+    node_colors["b"].update(levenshtein_matches["b"])
+    return node_colors
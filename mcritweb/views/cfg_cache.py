@@ -0,0 +1,104 @@
+import os
+import re
+import time
+import logging
+import hashlib
+import threading
+
+from flask import current_app
+
+import mcritweb.views.cfg_explorer_detector as cfg_explorer_detector
+from mcritweb.views.result_cache import ResultCache
+from mcritweb.views.utility import get_client, get_server_url
+
+
+# node statements as emitted by SmdaFunction.toDotGraph()
+DOT_NODE_RX = re.compile(r'^(?P<node>  Node0x(?P<offset>[0-9a-f]+) \[shape=record),label="', re.MULTILINE)
+
+
+def annotate_dot_graph(dot_graph, picblockhashes):
+    """ Add the picblock hash of each block as comment to its node, in a single pass over the DOT graph """
+    hash_by_offset = {pbh["offset"]: pbh["hash"] for pbh in picblockhashes}
+
+    def annotate_node(match):
+        block_hash = hash_by_offset.get(int(match.group("offset"), 16))
+        comment = f"0x{block_hash:x}" if block_hash is not None else ""
+        return f'{match.group("node")},comment="{comment}",label="'
+
+    return DOT_NODE_RX.sub(annotate_node, dot_graph)
+
+
+def create_dot_graph(function_entry):
+    """ DOT graph of a function, with the picblock hash of each block as node comment """
+    dot_graph = function_entry.toSmdaFunction().toDotGraph()
+    return annotate_dot_graph(dot_graph, function_entry.picblockhashes)
+
+
+def create_cfg_payload(function_entry):
+    """ DOT graph and loops of a function, as shown by the CFG explorer """
+    dot_graph = create_dot_graph(function_entry)
+    loops = []
+    try:
+        # the explorer expands line breaks in labels before parsing, which we mirror to find the same loops
+        loops = cfg_explorer_detector.find_loops(dot_graph.replace("\\l", "\n"))
+    except AssertionError:
+        # e.g. the entry block is a loop header, still show the graph itself
+        logging.warning("Failed to find loops for function %d.", function_entry.function_id)
+    return {"dot_graph": dot_graph, "loops": loops}
+
+
+class CfgCache(ResultCache):
+    """ Local cache for CFG explorer payloads in instance/cache/cfg.
+
+    Function entries never change once a sample is indexed, so payloads are cached by a key derived
+    from the server URL, the MCRIT and MCRITweb versions and the function_id. A change of either
+    version (or server) addresses a different entry, while stale entries age out of the LRU.
+    The MCRIT version is refreshed every version_ttl seconds.
+    """
+
+    def __init__(self, cache_path=None, max_bytes=512 * 1024 ** 2, max_entries=10000, version_ttl=300) -> None:
+        super().__init__(cache_path=cache_path, max_bytes=max_bytes, max_entries=max_entries)
+        self.version_ttl = version_ttl
+        self._version_lock = threading.Lock()
+        self._versions = {}
+
+    def init_app(self, app):
+        self.cache_path = os.sep.join([app.instance_path, "cache", "cfg"])
+        self.max_bytes = app.config.get("CFG_CACHE_MAX_BYTES", self.max_bytes)
+        self.max_entries = app.config.get("CFG_CACHE_MAX_ENTRIES", self.max_entries)
+        self.version_ttl = app.config.get("CFG_CACHE_VERSION_TTL", self.version_ttl)
+        self.clear()
+
+    def _getServerVersion(self, server_url):
+        with self._version_lock:
+            version, fetched_at = self._versions.get(server_url, (None, 0))
+        if version is None or time.time() - fetched_at > self.version_ttl:
+            version = get_client().getVersion()
+            with self._version_lock:
+                self._versions[server_url] = (version, time.time())
+        return version
+
+    def getKey(self, function_id):
+        server_url = get_server_url()
+        key_material = f"{server_url}|{self._getServerVersion(server_url)}|{current_app.config['MCRITWEB_VERSION']}|{function_id}"
+        return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    def getPayload(self, function_id, key=None):
+        """ Answer the CFG payload for function_id, only fetching from MCRIT on a miss, None for unknown functions """
+        key = key if key is not None else self.getKey(function_id)
+        payload = self.get(key)
+        if not payload:
+            function_entry = get_client().getFunctionById(function_id, with_xcfg=True)
+            if not function_entry:
+                return None
+            payload = create_cfg_payload(function_entry)
+            self.put(key, payload)
+        return payload
+
+    def clear(self):
+        super().clear()
+        with self._version_lock:
+            self._versions = {}
+
+
+cfg_cache = CfgCache()
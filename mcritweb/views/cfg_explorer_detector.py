@@ -24,53 +24,125 @@ SOFTWARE.
 
 import re
 import json
+from bisect import bisect_right
 import networkx as nwx
-from collections import namedtuple
-from functools import reduce
-from copy import copy
-
-
-def dominanators(graph, start):
-    '''
-    Compute all dominators using O(n^2) algorithm
-    '''
-    # Universal set of nodes
-    universal_set = set(graph.nodes())
-    # Set of nodes to iterate over
-    iter_set = universal_set - set([start])
-    # Initial set of dominator nodes
-    # if not the start node, then n is dominated by the universal set
-    # if the start node, then n is only dominated by n
-    doms = {
-        n: (
-            copy(universal_set)
-            if n != start
-            else set([start])
-        )
-        for n in graph.nodes()
-    }
-    # Iterative algorithm
+
+
+class IndexedGraph(object):
+    '''
+    Adjacency lists of a networkx graph over integer node indices, built once per analysis.
+    Predecessors are ordered by edge iteration order, i.e. exactly like the successors in graph.reverse(),
+    so traversals of this single reverse view visit nodes in the same order as traversals of a reversed copy.
+    '''
+
+    def __init__(self, graph):
+        self.names = list(graph.nodes())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.successors = [[self.index[succ] for succ in graph.successors(name)] for name in self.names]
+        self.predecessors = [[] for _ in self.names]
+        self.edges = []
+        for src, successors in enumerate(self.successors):
+            for tgt in successors:
+                self.predecessors[tgt].append(src)
+                self.edges.append((src, tgt))
+
+    def __len__(self):
+        return len(self.names)
+
+
+def reverse_postorder(indexed_graph, start):
+    '''
+    Nodes reachable from start in reverse postorder of an iterative depth-first search
+    '''
+    postorder = []
+    visited = [False] * len(indexed_graph)
+    visited[start] = True
+    stack = [(start, iter(indexed_graph.successors[start]))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if not visited[child]:
+                visited[child] = True
+                stack.append((child, iter(indexed_graph.successors[child])))
+                break
+        else:
+            stack.pop()
+            postorder.append(node)
+    postorder.reverse()
+    return postorder
+
+
+def immediate_dominators(indexed_graph, start):
+    '''
+    Compute immediate dominators with the algorithm of Cooper, Harvey and Kennedy,
+    "A Simple, Fast Dominance Algorithm" (2001), which converges in few passes over the reverse postorder.
+    Nodes not reachable from start have no immediate dominator (None).
+    '''
+    rpo = reverse_postorder(indexed_graph, start)
+    rpo_number = [None] * len(indexed_graph)
+    for number, node in enumerate(rpo):
+        rpo_number[node] = number
+    idom = [None] * len(indexed_graph)
+    idom[start] = start
+
+    def intersect(finger1, finger2):
+        while finger1 != finger2:
+            while rpo_number[finger1] > rpo_number[finger2]:
+                finger1 = idom[finger1]
+            while rpo_number[finger2] > rpo_number[finger1]:
+                finger2 = idom[finger2]
+        return finger1
+
     changed = True
     while changed:
         changed = False
-        for n in iter_set:
-            # Union of n and ...
-            new_doms = set([n]).union(
-                # ... intersection of all current dominators of n's predecessors
-                reduce(
-                    set.intersection,
-                    map(
-                        lambda pred: doms[pred],
-                        graph.predecessors(n)
-                    ),
-                    universal_set
-                )
-            )
-            # if changed, changed true and set doms
-            if new_doms != doms[n]:
+        for node in rpo[1:]:
+            new_idom = None
+            for pred in indexed_graph.predecessors[node]:
+                if idom[pred] is None:
+                    continue
+                new_idom = pred if new_idom is None else intersect(pred, new_idom)
+            if idom[node] != new_idom:
+                idom[node] = new_idom
                 changed = True
-                doms[n] = new_doms
-    return doms
+    return idom
+
+
+class DominatorTree(object):
+    '''
+    Answers dominance queries in O(1) using pre- and postorder numbers of the dominator tree.
+    As in the classic iterative formulation, where all dominator sets start out as the universal set,
+    nodes not reachable from the start node are considered to be dominated by every node.
+    '''
+
+    def __init__(self, indexed_graph, start):
+        idom = immediate_dominators(indexed_graph, start)
+        children = [[] for _ in range(len(indexed_graph))]
+        for node, parent in enumerate(idom):
+            if parent is not None and node != start:
+                children[parent].append(node)
+        self.preorder = [None] * len(indexed_graph)
+        self.postorder = [None] * len(indexed_graph)
+        counter = 0
+        self.preorder[start] = counter
+        stack = [(start, iter(children[start]))]
+        while stack:
+            node, node_children = stack[-1]
+            child = next(node_children, None)
+            counter += 1
+            if child is None:
+                stack.pop()
+                self.postorder[node] = counter
+            else:
+                self.preorder[child] = counter
+                stack.append((child, iter(children[child])))
+
+    def dominates(self, dominator, node):
+        if self.preorder[node] is None:
+            return True
+        if self.preorder[dominator] is None:
+            return False
+        return self.preorder[dominator] <= self.preorder[node] and self.postorder[node] <= self.postorder[dominator]
 
 
 def load_dot_file(file_path):
@@ -129,116 +201,94 @@ def get_roots(graph):
                 set(map(lambda twople: twople[1], graph.edges())))
 
 
-def compute_backedges(graph, dominators):
+def compute_backedges(indexed_graph, dominator_tree):
     '''
-    Compute the backedges of a graph, given already computed dominators
+    Compute the backedges of a graph (edges whose target dominates their source), in edge order
     '''
-    return list(
-        filter(
-            lambda src_tgt: src_tgt[1] in dominators[src_tgt[0]],
-            graph.edges()
-        )
-    )
-
-
-'''
-Collect list of loops.
-Returns a list of dictionaries, each with two entries:
-+ backedge: backedge that defines the loop
-+ nodes: collection of nodes that compose the entire loop
-'''
-
-'''
-compute_loops_from_backedges_WorkUnit
-Type that wraps a work unit for the compute_loops_from_backedges task.
-'''
-compute_loops_from_backedges_WorkUnit = namedtuple(
-    "compute_loops_from_backedges_WorkUnit", [
-        "backedge", "graph", "dominanators"])
+    return [(src, tgt) for src, tgt in indexed_graph.edges if dominator_tree.dominates(tgt, src)]
 
 
-def compute_loops_from_backedges(work_unit):
-    backedge = work_unit.backedge
-    graph = work_unit.graph
-    dominanators = work_unit.dominanators
-    return {
-        "backedge": backedge,
-        "nodes":
-        # Filter out nodes where the target of the backedge is not in its
-        # dominator set
-        list(filter(
-            lambda node: backedge[1] in dominanators[node],
-            getNodes(graph, backedge)
-        ))
-    }
-
-
-def getNodes(graph, backedge):
-    if backedge[0] == backedge[1]:
-        return [backedge[0]]
-    reverseGraph = graph.reverse()
-    # remove the header
-    reverseGraph.remove_node(backedge[1])
-    nodeList = list(nwx.dfs_preorder_nodes(reverseGraph, backedge[0]))
-    # nodeList = nwx.depth_first_search.dfs_tree(reverseGraph, backedge[0]).nodes()
-    nodeList.append(backedge[1])
-    return nodeList
+def get_loop_nodes(indexed_graph, backedge):
+    '''
+    Collect the natural loop of a backedge: all nodes reaching its source without passing its header,
+    in depth-first preorder over the reverse graph, followed by the header
+    '''
+    src, header = backedge
+    if src == header:
+        return [src]
+    visited = {header, src}
+    node_list = [src]
+    stack = [iter(indexed_graph.predecessors[src])]
+    while stack:
+        for child in stack[-1]:
+            if child not in visited:
+                visited.add(child)
+                node_list.append(child)
+                stack.append(iter(indexed_graph.predecessors[child]))
+                break
+        else:
+            stack.pop()
+    node_list.append(header)
+    return node_list
 
 
-def collect_loops(graph, backedges, dominanators):
+def collect_loops(indexed_graph, backedges, dominator_tree):
     '''
-    Farms out work to a pool of tasks to collect loops
+    Collect list of loops.
+    Returns a list of dictionaries, each with two entries:
+    + backedge: backedge that defines the loop
+    + nodes: collection of nodes that compose the entire loop
     '''
+    names = indexed_graph.names
     result = []
-    for entry in map(lambda backedge: compute_loops_from_backedges_WorkUnit(backedge=backedge, graph=graph, dominanators=dominanators), backedges):
-        loops = compute_loops_from_backedges(entry)
-        result.append(loops)
+    for backedge in backedges:
+        header = backedge[1]
+        loop_nodes = [node for node in get_loop_nodes(indexed_graph, backedge) if dominator_tree.dominates(header, node)]
+        result.append({
+            "backedge": (names[backedge[0]], names[header]),
+            "nodes": [names[node] for node in loop_nodes]
+        })
     return result
 
+
 def addParentInfo(loopsObj):
+    '''
+    Sort loops by size and link each to its enclosing loop in the loop-nesting forest:
+    the next larger loop containing its header becomes "parent", while loops of equal size
+    sharing the header are listed as "equal".
+    '''
     loopsObj.sort(key=lambda x: len(x["nodes"]))
-    for i in range(len(loopsObj)):
-        loopsObj[i]["parent"] = ""
-        for j in range(i + 1, len(loopsObj)):
-            header = loopsObj[i]["backedge"][1]
-            if header in loopsObj[j]["nodes"]:
-                if len(loopsObj[i]["nodes"]) == len(loopsObj[j]["nodes"]):
-                    if "equal" in loopsObj[i]:
-                        loopsObj[i]["equal"].append(j)
-                    else:
-                        loopsObj[i]["equal"] = [j]
-                else:
-                    loopsObj[i]["parent"] = j
-                    break
+    # for each node, the (ascending) indices of all loops containing it
+    loops_by_node = {}
+    for j, loop in enumerate(loopsObj):
+        for node in loop["nodes"]:
+            loops_by_node.setdefault(node, []).append(j)
+    for i, loop in enumerate(loopsObj):
+        loop["parent"] = ""
+        containing_loops = loops_by_node[loop["backedge"][1]]
+        for j in containing_loops[bisect_right(containing_loops, i):]:
+            if len(loop["nodes"]) == len(loopsObj[j]["nodes"]):
+                loop.setdefault("equal", []).append(j)
+            else:
+                loop["parent"] = j
+                break
 
 
-def run(dot_content):
-    # print(dot_content)
+def find_loops(dot_content):
     graph = parse_dot_to_graph(dot_content)
     roots = get_roots(graph)
     assert len(roots) == 1, "Must have exactly one root to perform analysis: {}".format(str(roots))
-    root = roots[0]
-    dominanator_dict = dominanators(graph, root)
-    backedges = compute_backedges(graph, dominanator_dict)
-    loops = collect_loops(graph, backedges, dominanator_dict)
+    indexed_graph = IndexedGraph(graph)
+    dominator_tree = DominatorTree(indexed_graph, indexed_graph.index[roots[0]])
+    backedges = compute_backedges(indexed_graph, dominator_tree)
+    loops = collect_loops(indexed_graph, backedges, dominator_tree)
     addParentInfo(loops)
-    return json.dumps(loops)
+    return loops
+
+
+def run(dot_content):
+    return json.dumps(find_loops(dot_content))
 
 
 def main(file_path):
-    dot_content = load_dot_file(file_path)
-    # print("dot_content", dot_content)
-    graph = parse_dot_to_graph(dot_content)
-    # print("graph", graph)
-    roots = get_roots(graph)
-    assert len(roots) == 1, "Must have exactly one root to perform analysis: {}".format(str(roots))
-    root = roots[0]
-    # print("root", root)
-    dominanator_dict = dominanators(graph, root)
-    # print("dominanator_dict", dominanator_dict)
-    backedges = compute_backedges(graph, dominanator_dict)
-    # print("backedges", backedges)
-    loops = collect_loops(graph, backedges, dominanator_dict)
-    # print("loops", loops)
-    addParentInfo(loops)
-    return json.dumps(loops)
+    return run(load_dot_file(file_path))
@@ -0,0 +1,106 @@
+import os
+import types
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from mcrit.client.McritClient import McritClient
+
+
+class PooledRequests(object):
+    """ Stand-in for the requests module as used by the methods of McritClient.
+
+    McritClient calls requests.get/post/put/delete directly, which opens a new connection per call.
+    The clients of the pool route these through a keep-alive session instead, one per thread and
+    process, so that sessions are never shared across threads or inherited across a fork.
+    """
+
+    def __init__(self, pool_maxsize=10) -> None:
+        self.pool_maxsize = pool_maxsize
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None or self._local.pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+            self._local.pid = os.getpid()
+        return session
+
+    def close(self):
+        session = getattr(self._local, "session", None)
+        if session is not None and self._local.pid == os.getpid():
+            session.close()
+        self._local.session = None
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.session.post(url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.session.put(url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.session.delete(url, **kwargs)
+
+    def __getattr__(self, name):
+        # everything else (exceptions, utils, ...) is served by the real module
+        return getattr(requests, name)
+
+
+def create_pooled_client_class(pooled_requests):
+    """ Derive a McritClient class whose methods call pooled_requests instead of the requests module.
+
+    McritClient offers no way to pass a session, so the subclass carries copies of its methods,
+    which look up globals in a namespace of their own where requests is pooled_requests.
+    McritClient and its module are left untouched, as are all other clients in the process.
+    """
+    namespace = None
+    methods = {}
+    for name, member in vars(McritClient).items():
+        if not isinstance(member, types.FunctionType):
+            continue
+        if namespace is None:
+            namespace = dict(member.__globals__)
+            namespace["requests"] = pooled_requests
+        method = types.FunctionType(member.__code__, namespace, member.__name__, member.__defaults__, member.__closure__)
+        method.__kwdefaults__ = member.__kwdefaults__
+        method.__doc__ = member.__doc__
+        method.__qualname__ = member.__qualname__
+        methods[name] = method
+    return type("PooledMcritClient", (McritClient,), methods)
+
+
+class McritClientPool(object):
+    """ Hands out one McritClient per server URL and process, backed by pooled HTTP sessions """
+
+    def __init__(self) -> None:
+        self.pooled_requests = PooledRequests()
+        self.client_class = create_pooled_client_class(self.pooled_requests)
+        self._lock = threading.Lock()
+        self._client = None
+
+    def init_app(self, app):
+        self.pooled_requests.pool_maxsize = app.config.get("MCRIT_CLIENT_POOL_SIZE", self.pooled_requests.pool_maxsize)
+
+    def getClient(self, server_url):
+        client = self._client
+        if client is None or client.mcrit_server != server_url:
+            with self._lock:
+                client = self.client_class(mcrit_server=server_url)
+                self._client = client
+        return client
+
+    def reset(self):
+        with self._lock:
+            self._client = None
+        self.pooled_requests.close()
+
+
+client_pool = McritClientPool()
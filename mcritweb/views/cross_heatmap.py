@@ -0,0 +1,45 @@
+import base64
+
+import numpy as np
+
+from mcritweb.views.cross_compare import SCORE_COLORS, score_to_color_indices
+
+
+def _encode_array(array):
+    """ Encode a NumPy array as base64 of its little endian bytes, to be read as typed array in the browser """
+    return base64.b64encode(array.astype(array.dtype.newbyteorder("<")).tobytes()).decode("ascii")
+
+
+def create_score_matrices(method_results, sample_ids):
+    """ Answer matching percent (float32) and match count (uint32) matrices for the samples in the given order """
+    keys = [str(sample_id) for sample_id in sample_ids]
+    matching_percent = method_results["matching_percent"]
+    matching_matches = method_results["matching_matches"]
+    scores = np.zeros((len(keys), len(keys)), dtype=np.float32)
+    matches = np.zeros((len(keys), len(keys)), dtype=np.uint32)
+    for row, key in enumerate(keys):
+        percent_row = matching_percent.get(key, {})
+        matches_row = matching_matches.get(key, {})
+        scores[row] = [percent_row.get(other_key, 0) for other_key in keys]
+        matches[row] = [matches_row.get(other_key, 0) for other_key in keys]
+    return scores, matches
+
+
+def create_heatmap_payload(method_results, samples, sample_to_job_id):
+    """ Answer the cross compare matrix of one method for drawing it as heatmap on a canvas.
+
+    Instead of one styled HTML element per cell, the page receives the matrices as typed arrays
+    plus a color index per cell into the shared palette, and tooltips are built from the same arrays.
+    """
+    sample_ids = [sample.sample_id for sample in samples]
+    scores, matches = create_score_matrices(method_results, sample_ids)
+    return {
+        "size": len(sample_ids),
+        "sample_ids": sample_ids,
+        "labels": [f"{sample.sample_id}: {sample.sha256[:8]} -- {sample.family} {sample.version} -- ({sample.statistics['num_functions']} func)" for sample in samples],
+        "job_ids": [sample_to_job_id.get(str(sample_id), "") for sample_id in sample_ids],
+        "palette": SCORE_COLORS,
+        "scores": _encode_array(scores),
+        "matches": _encode_array(matches),
+        "colors": _encode_array(score_to_color_indices(scores)),
+    }
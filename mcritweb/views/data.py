@@ -1,61 +1,56 @@
 import os
 import re
+import copy
 import datetime
 import hashlib
 from datetime import datetime
-from mcrit.client.McritClient import McritClient
 from mcrit.storage.MatchingResult import MatchingResult
 from mcrit.storage.MatchedFunctionEntry import MatchedFunctionEntry
 from mcrit.storage.FunctionEntry import FunctionEntry
 from mcrit.storage.SampleEntry import SampleEntry
-from flask import current_app, Blueprint, render_template, request, redirect, url_for, Response, flash, session, send_from_directory, json
+from flask import current_app, Blueprint, render_template, request, redirect, url_for, Response, flash, session, send_from_directory, json, jsonify
 
 from mcritweb.views.authentication import visitor_required, contributor_required
 from mcritweb.views.cross_compare import get_sample_to_job_id, score_to_color
-from mcritweb.views.utility import get_server_url, mcrit_server_required, parseBitnessFromFilename, parseBaseAddrFromFilename, get_matches_node_colors
+from mcritweb.views.utility import get_client, mcrit_server_required, parseBitnessFromFilename, parseBaseAddrFromFilename
+from mcritweb.views.block_fingerprints import block_fingerprint_cache, get_fingerprint_node_colors
+from mcritweb.views.upstream_fetcher import upstream_fetcher
+from mcritweb.views.job_cache import finished_job_cache
+from mcritweb.views.job_progress import job_progress_monitor
+from mcritweb.views.family_names import family_name_index
+from mcritweb.views.sample_cache import sample_cache
+from mcritweb.views.cross_heatmap import create_heatmap_payload
+from mcritweb.views.export_stream import EXPORT_FORMATS, iterate_chunks, iterate_sample_ids, parse_sample_ranges, stream_export
+from mcritweb.views.import_stream import import_manager
 from mcritweb.views.pagination import Pagination
-from mcritweb.views.MatchReportRenderer import MatchReportRenderer
+from mcritweb.views.result_cache import result_cache
+from mcritweb.views.matching_result_cache import matching_result_cache
+from mcritweb.views.diagram_renderer import diagram_renderer
 from mcritweb.views.ScoreColorProvider import ScoreColorProvider
 from mcritweb.views.analyze import query as analyze_query
 
 bp = Blueprint('data', __name__, url_prefix='/data')
 
+# job types whose results are presented as MatchingResult
+MATCHING_JOB_TYPES = ("getMatchesForSampleVs", "getMatchesForSample", "getMatchesForSmdaReport", "getMatchesForMappedBinary", "getMatchesForUnmappedBinary")
+
 ################################################################
 # Helper functions
 ################################################################
 
-def load_cached_result(app, job_id):
-    matching_result = {}
-    cache_path = os.sep.join([app.instance_path, "cache", "results"])
-    for filename in os.listdir(cache_path):
-        if job_id in filename and filename.endswith("json"):
-            with open(cache_path + os.sep + filename, "r") as fin:
-                matching_result = json.load(fin)
-    return matching_result
-
-
-def cache_result(app, job_info, matching_result):
-    # TODO potentially implement a cache control that manages maximum allowed cache size?
-    if job_info.result is not None:
-        cache_path = os.sep.join([app.instance_path, "cache", "results"])
-        timestamped_filename = datetime.utcnow().strftime(f"%Y%m%d-%H%M%S-{job_info.job_id}.json")
-        with open(cache_path + os.sep + timestamped_filename, "w") as fout:
-            json.dump(matching_result, fout, indent=1)
-
-
-def create_match_diagram(app, job_id, matching_result, filtered_family_id=None, filtered_sample_id=None):
-    cache_path = os.sep.join([app.instance_path, "cache", "diagrams"])
-    family_sample_suffix = ""
-    if filtered_family_id is not None:
-        family_sample_suffix = f"-famid_{filtered_family_id}"
-    elif filtered_sample_id is not None:
-        family_sample_suffix = f"-samid_{filtered_sample_id}"
-    output_path = cache_path + os.sep + job_id + family_sample_suffix + ".png"
-    if not os.path.isfile(output_path):
-        renderer = MatchReportRenderer()
-        renderer.processReport(matching_result)
-        image = renderer.renderStackedDiagram(filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id)
-        image.save(output_path)
+def create_match_diagram(job_id, matching_result, filtered_family_id=None, filtered_sample_id=None):
+    """ Answer True if the diagram is ready, otherwise it is rendered in the background """
+    return diagram_renderer.requestDiagram(job_id, matching_result, filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id)
+
+def _load_result_json(client, job_id, job_info):
+    # check if we have the respective report already locally cached
+    result_json = result_cache.get(job_id)
+    if not result_json:
+        # otherwise obtain result report from remote
+        result_json = client.getResultForJob(job_id)
+        if result_json and job_info is not None and job_info.result is not None:
+            result_cache.put(job_info.job_id, result_json)
+    return result_json
 
 # https://stackoverflow.com/a/39842765
 # https://stackoverflow.com/a/26972238
@@ -65,6 +60,13 @@ def diagram_file(filename):
     cache_path = os.sep.join([current_app.instance_path, "cache", "diagrams"])
     return send_from_directory(cache_path, filename)
 
+@bp.route('/diagram_status/<filename>')
+@visitor_required
+def diagram_status(filename):
+    if not diagram_renderer.isValidFilename(filename):
+        return jsonify({"status": "invalid"}), 400
+    return jsonify({"status": diagram_renderer.getStatus(filename)})
+
 def _parse_integer_query_param(request, query_param:str):
     """ Try to find query_param in the request and parse it as int """
     param = None
@@ -95,75 +97,88 @@ def _parse_checkbox_query_param(request, query_param:str):
 def import_view():
     if request.method == 'POST':
         f = request.files.get('file', '')
-        client = McritClient(mcrit_server=get_server_url())
-        session["last_import"] = client.addImportData(json.load(f))
+        if f:
+            # the upload is imported in the background, chunk by chunk, see import_complete for its progress
+            client = get_client()
+            session["last_import"] = import_manager.startImport(client, f)
     return render_template("import.html")
 
 @bp.route('/import_complete')
 @contributor_required
 def import_complete():
-    import_results = session.pop('last_import',{})
-    if import_results:
-        return render_template("import_complete.html", results=import_results)
-    else:
-        flash("This doesn't seem to be valid MCRIT data in JSON format", category='error')
+    import_status = import_manager.getStatus(session.get('last_import'))
+    if import_status is None or import_status["state"] == "failed":
+        session.pop('last_import', None)
+        flash(import_status["error"] if import_status and import_status["error"] else "This doesn't seem to be valid MCRIT data in JSON format", category='error')
         return render_template("import.html")
+    if import_status["state"] == "finished":
+        session.pop('last_import', None)
+    return render_template("import_complete.html", import_status=import_status, results=import_status["results"])
 
+@bp.route('/import_status/<import_id>')
+@contributor_required
+def import_status(import_id):
+    import_status = import_manager.getStatus(import_id)
+    if import_status is None:
+        return jsonify({"error": "unknown import"}), 404
+    return jsonify(import_status)
+
+
+def _export_response(client, sample_id_chunks, filename, parameters):
+    # exports are streamed chunk by chunk, so a full corpus is never held in memory
+    export_format = parameters.get("format", "json")
+    if export_format not in EXPORT_FORMATS:
+        export_format = "json"
+    is_gzip = parameters.get("gzip", "").lower() in ("1", "true", "on")
+    filename = f"{filename}.{export_format}" + (".gz" if is_gzip else "")
+    mimetype = "application/gzip" if is_gzip else ("application/x-ndjson" if export_format == "ndjson" else "application/json")
+    temp_path = os.sep.join([current_app.instance_path, "temp", "export"])
+    return Response(
+        stream_export(client, sample_id_chunks, export_format=export_format, is_gzip=is_gzip, temp_path=temp_path),
+        mimetype=mimetype,
+        headers={"Content-disposition":
+                "attachment; filename=" + filename})
 
 @bp.route('/export',methods=('GET', 'POST'))
 @mcrit_server_required
 @contributor_required
 def export_view():
     if request.method == 'POST':
-        requested_samples = request.form['samples']
-        client = McritClient(mcrit_server=get_server_url())
+        requested_samples = request.form['samples'].strip()
+        client = get_client()
+        chunk_size = current_app.config.get("EXPORT_CHUNK_SIZE", 10)
         if requested_samples == "":
-            export_file = json.dumps(client.getExportData())
-            return Response(
-                export_file,
-                mimetype='application/json',
-                headers={"Content-disposition":
-                        "attachment; filename=export_all_samples.json"})
-        # NOTE it might be nice to allow [<number>, <number>-<number>, ...] to enable 
-        # spans of consecutive sample_ids
-        elif re.match("^\d+(?:[\s]*,[\s]*\d+)*$", requested_samples):
-            sample_ids = [int(sample_id.strip()) for sample_id in requested_samples.split(',')]
-            export_file = json.dumps(client.getExportData(sample_ids))
-            return Response(
-                export_file,
-                mimetype='application/json',
-                headers={"Content-disposition":
-                        "attachment; filename=export_samples.json"})
-        else:
-            flash('Please use a comma-separated list of sample_ids in your export request.', category='error')
+            sample_id_chunks = iterate_chunks(iterate_sample_ids(client), chunk_size)
+            return _export_response(client, sample_id_chunks, "export_all_samples", request.form)
+        try:
+            ranges = parse_sample_ranges(requested_samples)
+        except ValueError:
+            flash('Please use a comma-separated list of sample_ids or ranges of sample_ids (e.g. 1, 5-10) in your export request.', category='error')
             return render_template("export.html")
+        if all(first == last for first, last in ranges):
+            sample_ids = [first for first, last in ranges]
+        else:
+            # only export samples that exist within the ranges
+            sample_ids = iterate_sample_ids(client, ranges=ranges)
+        return _export_response(client, iterate_chunks(sample_ids, chunk_size), "export_samples", request.form)
     return render_template("export.html")
 
 @bp.route('/specific_export/<type>/<item_id>')
 @mcrit_server_required
 @contributor_required
 def specific_export(type, item_id):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
+    chunk_size = current_app.config.get("EXPORT_CHUNK_SIZE", 10)
     if type == 'family':
         samples = client.getSamplesByFamilyId(item_id)
         sample_ids = [x.sample_id for x in samples.values()]
-        export_file = json.dumps(client.getExportData(sample_ids))
-        return Response(
-            export_file,
-            mimetype='application/json',
-            headers={"Content-disposition":
-                    "attachment; filename=export_family_"+str(item_id)+".json"})
+        return _export_response(client, iterate_chunks(sample_ids, chunk_size), "export_family_" + str(item_id), request.args)
     if type == 'samples':
         sample_ids = []
         sample_entry = client.getSampleById(item_id)
         if sample_entry:
             sample_ids.append(sample_entry.sample_id)
-        export_file = json.dumps(client.getExportData(sample_ids))
-        return Response(
-            export_file,
-            mimetype='application/json',
-            headers={"Content-disposition":
-                    "attachment; filename=export_samples.json"})
+        return _export_response(client, iterate_chunks(sample_ids, chunk_size), "export_samples", request.args)
 
 ################################################################
 # Direct Function Matching
@@ -173,19 +188,28 @@ def specific_export(type, item_id):
 @mcrit_server_required
 @visitor_required
 def match_functions(function_id_a, function_id_b):
-    client = McritClient(mcrit_server=get_server_url())
-    if client.isFunctionId(function_id_a) and client.isFunctionId(function_id_b):
+    client = get_client()
+    is_function_id_a, is_function_id_b = upstream_fetcher.fetch(
+        lambda: client.isFunctionId(function_id_a),
+        lambda: client.isFunctionId(function_id_b),
+    )
+    if is_function_id_a and is_function_id_b:
         match_info = client.getMatchFunctionVs(function_id_a, function_id_b)
         function_entry = FunctionEntry.fromDict(match_info["function_entry_a"])
-        print(function_entry)
-        print(function_entry.pichash)
-        pichash_matches_a = client.getMatchesForPicHash(function_entry.pichash, summary=True)
         sample_entry_a = SampleEntry.fromDict(match_info["sample_entry_a"])
         other_function_entry = FunctionEntry.fromDict(match_info["function_entry_b"])
         sample_entry_b = SampleEntry.fromDict(match_info["sample_entry_b"])
-        pichash_matches_b = client.getMatchesForPicHash(other_function_entry.pichash, summary=True)
+        pichash_matches_a, pichash_matches_b, fingerprints_a, fingerprints_b = upstream_fetcher.fetch(
+            lambda: client.getMatchesForPicHash(function_entry.pichash, summary=True),
+            lambda: client.getMatchesForPicHash(other_function_entry.pichash, summary=True),
+            lambda: block_fingerprint_cache.getFingerprints(function_id_a, sample_entry=sample_entry_a),
+            lambda: block_fingerprint_cache.getFingerprints(function_id_b, sample_entry=sample_entry_b),
+        )
+        if fingerprints_a is None or fingerprints_b is None:
+            flash("One of the functions could not be fetched from MCRIT.", category='error')
+            return render_template("index.html")
         matched_function_entry = MatchedFunctionEntry(match_info["match_entry"]["fid"], match_info["match_entry"]["num_bytes"], match_info["match_entry"]["offset"], match_info["match_entry"]["matches"])
-        node_colors = get_matches_node_colors(function_id_a, function_id_b)
+        node_colors = get_fingerprint_node_colors(fingerprints_a, fingerprints_b)
         return render_template(
             "result_compare_function_vs.html",
             entry_a=function_entry,
@@ -209,36 +233,20 @@ def match_functions(function_id_a, function_id_b):
 @visitor_required
 # TODO:  refactor, simplify
 def result(job_id):
-    client = McritClient(mcrit_server=get_server_url())
-    # check if we have the respective report already locally cached
-    result_json = load_cached_result(current_app, job_id)
-    job_info = client.getJobData(job_id)
-    if not result_json:
-        # otherwise obtain result report from remote
-            result_json = client.getResultForJob(job_id)
-            if result_json:
-                cache_result(current_app, job_info, result_json)
+    client = get_client()
+    job_info = finished_job_cache.getJob(client, job_id)
+    # parsed match reports are kept in memory, so we can skip loading the report altogether
+    if job_info is not None and job_info.parameters.startswith(MATCHING_JOB_TYPES) and job_id in matching_result_cache:
+        return result_matches_for_sample_or_query(job_info, lambda: _load_result_json(client, job_id, job_info))
+    result_json = _load_result_json(client, job_id, job_info)
     if result_json:
         score_color_provider = ScoreColorProvider()
         # TODO validation - only parse to matching_result if this data type is appropriate 
         # re-format result report for visualization and choose respective template
         if job_info is None:
             return render_template("result_invalid.html", job_id=job_id)
-        if job_info.parameters.startswith("getMatchesForSampleVs"):
-            matching_result = MatchingResult.fromDict(result_json)
-            return result_matches_for_sample_or_query(job_info, matching_result)
-        elif job_info.parameters.startswith("getMatchesForSample"):
-            matching_result = MatchingResult.fromDict(result_json)
-            return result_matches_for_sample_or_query(job_info, matching_result)
-        elif job_info.parameters.startswith("getMatchesForSmdaReport"):
-            matching_result = MatchingResult.fromDict(result_json)
-            return result_matches_for_sample_or_query(job_info, matching_result)
-        elif job_info.parameters.startswith("getMatchesForMappedBinary"):
-            matching_result = MatchingResult.fromDict(result_json)
-            return result_matches_for_sample_or_query(job_info, matching_result)
-        elif job_info.parameters.startswith("getMatchesForUnmappedBinary"):
-            matching_result = MatchingResult.fromDict(result_json)
-            return result_matches_for_sample_or_query(job_info, matching_result)
+        if job_info.parameters.startswith(MATCHING_JOB_TYPES):
+            return result_matches_for_sample_or_query(job_info, lambda: result_json)
         elif job_info.parameters.startswith("combineMatchesToCross"):
             return result_matches_for_cross(job_info, result_json)
         # NOTE: 'updateMinHashes' is the start of 'updateMinHashesForSample'.
@@ -294,7 +302,7 @@ def build_yara_rule(job_info, blocks_result, blocks_statistics):
     return yara_rule
 
 def result_unique_blocks(job_info, blocks_result: dict):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     payload_params = json.loads(job_info.payload["params"])
     sample_ids = payload_params["0"]
     sample_id = sample_ids[0]
@@ -351,7 +359,7 @@ def result_unique_blocks(job_info, blocks_result: dict):
     return render_template("result_unique_blocks.html", job_info=job_info, family_entry=family_entry, sample_id=sample_id, yara_rule=yara_rule, statistics=blocks_statistics, results=paginated_blocks, blkp=block_pagination, active_tab=active_tab)
 
 
-def result_matches_for_sample_or_query(job_info, matching_result: MatchingResult):
+def result_matches_for_sample_or_query(job_info, load_result_json):
     score_color_provider = ScoreColorProvider()
     filtered_sample_id = _parse_integer_query_param(request, "samid")
     filtered_family_id = _parse_integer_query_param(request, "famid")
@@ -362,68 +370,85 @@ def result_matches_for_sample_or_query(job_info, matching_result: MatchingResult
     filter_max_num_families = _parse_integer_query_param(request, "filter_max_num_families")
     filter_max_num_samples = _parse_integer_query_param(request, "filter_max_num_samples")
     filter_exclude_library = _parse_checkbox_query_param(request, "filter_exclude_library")
-    if filter_max_num_families:
-        matching_result.filterToFamilyCount(filter_max_num_families)
-    if filter_max_num_samples:
-        matching_result.filterToSampleCount(filter_max_num_samples)
-    if filter_min_score:
-        matching_result.filterToScore(filter_min_score)
-    if filter_exclude_library:
-        matching_result.excludeLibraryMatches(filter_exclude_library)
-
-    client = McritClient(mcrit_server=get_server_url())
+    generic_filters = (filter_max_num_families, filter_max_num_samples, filter_min_score, filter_exclude_library)
+
+    def apply_generic_filters(matching_result):
+        if filter_max_num_families:
+            matching_result.filterToFamilyCount(filter_max_num_families)
+        if filter_max_num_samples:
+            matching_result.filterToSampleCount(filter_max_num_samples)
+        if filter_min_score:
+            matching_result.filterToScore(filter_min_score)
+        if filter_exclude_library:
+            matching_result.excludeLibraryMatches()
+
+    def get_view(*filters, apply_filters=apply_generic_filters):
+        return matching_result_cache.getFilteredView(job_info.job_id, generic_filters + filters, load_result_json, apply_filters)
+
+    matching_result = get_view()
+    if matching_result is None:
+        return render_template("result_invalid.html", job_id=job_info.job_id)
+
+    client = get_client()
     if filtered_family_id is not None and client.isFamilyId(filtered_family_id):
-        matching_result.filterToFamilyId(filtered_family_id)
-        create_match_diagram(current_app, job_info.job_id, matching_result, filtered_family_id=filtered_family_id)
+        def apply_family_filter(matching_result):
+            apply_generic_filters(matching_result)
+            matching_result.filterToFamilyId(filtered_family_id)
+        matching_result = get_view("famid", filtered_family_id, apply_filters=apply_family_filter)
+        diagram_ready = create_match_diagram(job_info.job_id, matching_result, filtered_family_id=filtered_family_id)
         num_samples_matched = len(matching_result.sample_matches)
         sample_pagination = Pagination(request, num_samples_matched, limit=10, query_param="samp")
-        function_pagination = Pagination(request, len(matching_result.getAggregatedFunctionMatches()), query_param="funp")
-        return render_template("result_compare_family.html", famid=filtered_family_id, job_info=job_info, samp=sample_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
+        function_pagination = Pagination(request, matching_result.getNumAggregatedFunctionMatches(), query_param="funp")
+        return render_template("result_compare_family.html", diagram_ready=diagram_ready, famid=filtered_family_id, job_info=job_info, samp=sample_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
     elif filtered_sample_id is not None and client.isSampleId(filtered_sample_id):
-        matching_result.filterToSampleId(filtered_sample_id)
-        create_match_diagram(current_app, job_info.job_id, matching_result, filtered_sample_id=filtered_sample_id)
-        filtered_sample_entry = client.getSampleById(filtered_sample_id)
-        matching_result.other_sample_entry = filtered_sample_entry
+        def apply_sample_filter(matching_result):
+            apply_generic_filters(matching_result)
+            matching_result.filterToSampleId(filtered_sample_id)
+        matching_result = get_view("samid", filtered_sample_id, apply_filters=apply_sample_filter)
+        diagram_ready = create_match_diagram(job_info.job_id, matching_result, filtered_sample_id=filtered_sample_id)
         num_functions_matched = len(matching_result.function_matches)
         sample_pagination = Pagination(request, 1, limit=10, query_param="samp")
-        function_pagination = Pagination(request, len(matching_result.getAggregatedFunctionMatches()), query_param="funp")
-        return render_template("result_compare_sample.html", samid=filtered_sample_id, job_info=job_info, samp=sample_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
+        function_pagination = Pagination(request, matching_result.getNumAggregatedFunctionMatches(), query_param="funp")
+        # cached views are shared, so sample information only goes into a per-request copy
+        matching_result = copy.copy(matching_result)
+        filtered_sample_entry = client.getSampleById(filtered_sample_id)
+        matching_result.other_sample_entry = filtered_sample_entry
+        return render_template("result_compare_sample.html", diagram_ready=diagram_ready, samid=filtered_sample_id, job_info=job_info, samp=sample_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
     # treat family/sample part as if there was no filter
     elif filtered_function_id is not None and client.isFunctionId(filtered_function_id):
-        create_match_diagram(current_app, job_info.job_id, matching_result)
-        num_families_matched = len(set([sample.family for sample in matching_result.sample_matches]))
-        matching_result.filterToFunctionId(filtered_function_id)
-        num_functions_matched = len(set([function_match.matched_function_id for function_match in matching_result.function_matches]))
+        diagram_ready = create_match_diagram(job_info.job_id, matching_result)
+        num_families_matched = matching_result.getNumFamiliesMatched()
+        def apply_function_filter(matching_result):
+            apply_generic_filters(matching_result)
+            matching_result.filterToFunctionId(filtered_function_id)
+        matching_result = get_view("funid", filtered_function_id, apply_filters=apply_function_filter)
+        num_functions_matched = matching_result.getNumMatchedFunctionIds()
         family_pagination = Pagination(request, num_families_matched, limit=10, query_param="famp")
         function_pagination = Pagination(request, num_functions_matched, query_param="funp")
-        return render_template("result_compare_function.html", funid=filtered_function_id, job_info=job_info, famp=family_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
+        return render_template("result_compare_function.html", diagram_ready=diagram_ready, funid=filtered_function_id, job_info=job_info, famp=family_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
     elif job_info.parameters.startswith("getMatchesForSampleVs"):
-        # we need to slice function matches ourselves based on pagination
+        # we need to slice function matches ourselves based on pagination, on a per-request copy of the shared view
         function_pagination = Pagination(request, len(matching_result.function_matches), query_param="funp")
+        matching_result = copy.copy(matching_result)
         matching_result.function_matches = matching_result.function_matches[function_pagination.start_index:function_pagination.start_index+function_pagination.limit]
         return render_template("result_compare_vs.html", job_info=job_info, matching_result=matching_result, funp=function_pagination, scp=score_color_provider)
     else:
-        create_match_diagram(current_app, job_info.job_id, matching_result)
-        num_families_matched = len(set([sample.family for sample in matching_result.sample_matches]))
+        diagram_ready = create_match_diagram(job_info.job_id, matching_result)
+        num_families_matched = matching_result.getNumFamiliesMatched()
         family_pagination = Pagination(request, num_families_matched, limit=10, query_param="famp")
-        function_pagination = Pagination(request, len(matching_result.getAggregatedFunctionMatches()), query_param="funp")
-        return render_template("result_compare_all.html", job_info=job_info, famp=family_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
+        function_pagination = Pagination(request, matching_result.getNumAggregatedFunctionMatches(), query_param="funp")
+        return render_template("result_compare_all.html", diagram_ready=diagram_ready, job_info=job_info, famp=family_pagination, funp=function_pagination, matching_result=matching_result, scp=score_color_provider) 
 
 
-def result_matches_for_cross(job_info, result_json):
-    client = McritClient(mcrit_server=get_server_url())
-    samples = []
+def _get_cross_samples_by_method(client, result_json, custom_order):
+    """ Answer the samples of a cross compare ordered per method, or a reason why they can't be shown """
     sample_ids = [int(id) for id in next(iter(result_json.values()))["clustered_sequence"]]
-    for sample_id in sample_ids:
-        sample_entry = client.getSampleById(sample_id)
-        if sample_entry:
-            samples.append(sample_entry)
-        else:
-            reason = f"MCRIT was not able to retrieve information for all samples specified in the original job task. This might be a result of having deleted samples from the database since it was processed. Please consider starting a new job."
-            return render_template("result_corrupted.html", reason=reason, matching_result=job_info)
-    custom_order = request.args.get('custom','')
+    samples_by_id = sample_cache.getSamples(client, sample_ids)
+    if None in samples_by_id.values():
+        return None, f"MCRIT was not able to retrieve information for all samples specified in the original job task. This might be a result of having deleted samples from the database since it was processed. Please consider starting a new job."
+    samples = list(samples_by_id.values())
+    samples_by_str_id = {str(sample_id): sample for sample_id, sample in samples_by_id.items()}
     samples_by_method = {}
-    sample_indices = {}
     for method, method_results in result_json.items():
         if custom_order:
             order = custom_order.split(',')
@@ -434,20 +459,32 @@ def result_matches_for_cross(job_info, result_json):
         ordered_samples = []
         if order:
             for order_sample_id in order:
-                for sample in samples:
-                    if str(sample.sample_id) == str(order_sample_id):
-                        ordered_samples.append(sample)
-                        break
-                else:
-                    reason = f"MCRIT was not able to produce the chosen custom ordering, as some sample_ids are not part of the cross compare originally specified."
-                    return render_template("result_corrupted.html", reason=reason, matching_result=result_json)
+                if str(order_sample_id) not in samples_by_str_id:
+                    return None, f"MCRIT was not able to produce the chosen custom ordering, as some sample_ids are not part of the cross compare originally specified."
+                ordered_samples.append(samples_by_str_id[str(order_sample_id)])
         if ordered_samples != []:
             samples_by_method[method] = ordered_samples
         else:
             samples_by_method[method] = samples
-        sample_indices[method] = [x for index, x in enumerate([sample.sample_id for sample in samples_by_method[method]]) if (index+1) % 5 == 0]
+    return samples_by_method, None
+
+def result_matches_for_cross(job_info, result_json):
+    client = get_client()
+    custom_order = request.args.get('custom','')
+    samples_by_method, reason = _get_cross_samples_by_method(client, result_json, custom_order)
+    if samples_by_method is None:
+        return render_template("result_corrupted.html", reason=reason, matching_result=job_info)
+    sample_indices = {}
+    for method, samples in samples_by_method.items():
+        sample_indices[method] = [x for index, x in enumerate([sample.sample_id for sample in samples]) if (index+1) % 5 == 0]
+    # large matrices are drawn as heatmap in the browser instead of one HTML element per cell
+    num_samples = len(next(iter(samples_by_method.values())))
+    mode = request.args.get('mode', '')
+    is_heatmap = mode == "heatmap" or (mode != "table" and num_samples > current_app.config.get("CROSS_HEATMAP_MIN_SAMPLES", 50))
     return render_template('result_cross.html',
         is_corrupted=False,
+        is_heatmap=is_heatmap,
+        custom_order=custom_order,
         samples=samples_by_method,
         sample_indices = sample_indices,
         job_info=job_info,
@@ -457,6 +494,27 @@ def result_matches_for_cross(job_info, result_json):
         score_to_color=score_to_color,
     )
 
+@bp.route('/result/<job_id>/cross_heatmap/<method>')
+@mcrit_server_required
+@visitor_required
+def cross_heatmap(job_id, method):
+    client = get_client()
+    job_info = finished_job_cache.getJob(client, job_id)
+    if job_info is None or not job_info.parameters.startswith("combineMatchesToCross"):
+        return jsonify({"error": "not a cross compare job"}), 404
+    result_json = _load_result_json(client, job_id, job_info)
+    if not result_json or method not in result_json:
+        return jsonify({"error": "no result for this method"}), 404
+    samples_by_method, reason = _get_cross_samples_by_method(client, result_json, request.args.get('custom', ''))
+    if samples_by_method is None:
+        return jsonify({"error": reason}), 409
+    payload = create_heatmap_payload(result_json[method], samples_by_method[method], get_sample_to_job_id(job_info))
+    response = jsonify(payload)
+    # results of finished jobs never change
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    return response
+
 
 ################################################################
 # Listing Job information
@@ -470,7 +528,7 @@ def jobs():
     if request.method == 'POST':
         query = request.form['Search']
     # TODO how to get number of jobs?
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     active = request.args.get('active','')
     pagination_others = Pagination(request, client.getJobCount(query), query_param="p_o")
     pagination_vs1 = Pagination(request, client.getJobCount('Vs'), query_param="p_1")
@@ -492,7 +550,7 @@ def jobs():
 def job_by_id(job_id):
     auto_refresh = 0
     auto_forward = 0
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     suppress_processing_message = False
     FMT = '%Y-%m-%d-%H:%M:%S'
     try:
@@ -504,7 +562,7 @@ def job_by_id(job_id):
     except TypeError:
         pass
 
-    job_info = client.getJobData(job_id)
+    job_info = finished_job_cache.getJob(client, job_id)
     if auto_refresh and job_info and job_info.is_failed:
         auto_refresh = 0
         suppress_processing_message = True
@@ -521,15 +579,24 @@ def job_by_id(job_id):
             return redirect(url_for('data.result', job_id=job_id))
     if 'addBinarySample' in job_info.parameters and not suppress_processing_message and auto_refresh:
         flash('We received your sample, currently processing!', category='info')
-    child_jobs = sorted([client.getJobData(id) for id in job_info.all_dependencies], key=lambda x: x.number)
+    child_jobs = sorted(finished_job_cache.getJobs(client, job_info.all_dependencies), key=lambda x: x.number)
     return render_template('job_overview.html', job_info=job_info, auto_refresh=auto_refresh, child_jobs=child_jobs)
 
 
+@bp.route('/jobs/<job_id>/events')
+@mcrit_server_required
+@visitor_required
+def job_events(job_id):
+    # job progress is pushed as server-sent events, pages reload once the job is done
+    client = get_client()
+    return Response(job_progress_monitor.stream(client, job_id), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @bp.route('/jobs/<job_id>/delete')
 @mcrit_server_required
 @visitor_required
 def delete_job_by_id(job_id):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     job_data = client.getJobData(job_id)
     raise NotImplementedError("Implement me!")
 
@@ -575,7 +642,7 @@ def submit_or_query():
 @mcrit_server_required
 @contributor_required
 def submit():
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     if request.method == 'POST':
         f = request.files.get('file')
         if f is None:
@@ -600,10 +667,9 @@ def submit():
             with open(os.sep.join([current_app.instance_path, "cache", hash]), "wb") as fout:
                 fout.write(binary_content)
             job_id = client.addBinarySample(binary_content, filename=f.filename, family=family, version=version, is_dump=is_dump, base_addr=base_address, bitness=bitness)
+            family_name_index.invalidate()
             return url_for('data.job_by_id', job_id=job_id, refresh=3, forward=1), 202 # Accepted
         else:
             flash('Sample was already in database', category='warning')
             return url_for('explore.sample_by_id', sample_id=sample_entry.sample_id), 202 # Accepted
-    all_families = client.getFamilies()
-    family_names = [family_entry.family_name for family_entry in all_families.values()]
-    return render_template('submit.html', families=family_names, show_submit_fields=True)
+    return render_template('submit.html', show_submit_fields=True)
@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from mcritweb.views.MatchReportRenderer import MatchReportRenderer
+
+
+class DiagramRenderer(object):
+    """ Renders match diagrams in a worker pool, off the request path.
+
+    Requests for a diagram that is already being rendered are attached to the running job
+    instead of rendering it again. Across worker processes, a marker file in the temp folder
+    claims the diagram, and markers older than render_timeout are considered abandoned.
+    Images are written to a temporary file first and then moved into place, so concurrent
+    readers never see partial files.
+    """
+
+    def __init__(self, max_workers=2, render_timeout=600, max_failed=1000) -> None:
+        self.max_workers = max_workers
+        self.max_failed = max_failed
+        self.render_timeout = render_timeout
+        self.diagram_path = None
+        self.temp_path = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        # filename -> Future, for diagrams queued or being rendered
+        self._pending = {}
+        # filename -> error message, for the most recent diagrams that failed to render
+        self._failed = OrderedDict()
+        self.num_rendered = 0
+        self.num_deduplicated = 0
+
+    def init_app(self, app):
+        self.max_workers = app.config.get("DIAGRAM_RENDER_WORKERS", self.max_workers)
+        self.render_timeout = app.config.get("DIAGRAM_RENDER_TIMEOUT", self.render_timeout)
+        self.max_failed = app.config.get("DIAGRAM_RENDER_MAX_FAILED", self.max_failed)
+        self.diagram_path = os.sep.join([app.instance_path, "cache", "diagrams"])
+        self.temp_path = os.sep.join([app.instance_path, "temp", "diagrams"])
+
+    @staticmethod
+    def getFilename(job_id, filtered_family_id=None, filtered_sample_id=None):
+        family_sample_suffix = ""
+        if filtered_family_id is not None:
+            family_sample_suffix = f"-famid_{filtered_family_id}"
+        elif filtered_sample_id is not None:
+            family_sample_suffix = f"-samid_{filtered_sample_id}"
+        return job_id + family_sample_suffix + ".png"
+
+    @staticmethod
+    def isValidFilename(filename):
+        return os.path.basename(filename) == filename and filename.endswith(".png")
+
+    def _getExecutor(self):
+        # worker threads do not survive a fork, so we create the pool lazily per process
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mcrit-diagram")
+            self._pid = os.getpid()
+            self._pending = {}
+        return self._executor
+
+    def _getMarkerPath(self, filename):
+        return self.temp_path + os.sep + f"{filename}.pending"
+
+    def _isClaimed(self, filename):
+        try:
+            return time.time() - os.path.getmtime(self._getMarkerPath(filename)) < self.render_timeout
+        except OSError:
+            return False
+
+    def _claim(self, filename):
+        """ Try to claim rendering a diagram for this process, answer False if another process holds it """
+        marker_path = self._getMarkerPath(filename)
+        if os.path.isfile(marker_path) and not self._isClaimed(filename):
+            try:
+                os.remove(marker_path)
+            except OSError:
+                pass
+        try:
+            os.close(os.open(marker_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        return True
+
+    def _render(self, app, filename, matching_result, filtered_family_id, filtered_sample_id):
+        temp_filepath = self.temp_path + os.sep + f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # the renderer queries MCRIT for function information, which needs the server config
+            with app.app_context():
+                renderer = MatchReportRenderer()
+                renderer.processReport(matching_result)
+                image = renderer.renderStackedDiagram(filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id)
+            image.save(temp_filepath, format="PNG")
+            os.replace(temp_filepath, self.diagram_path + os.sep + filename)
+            with self._lock:
+                self.num_rendered += 1
+        except Exception as exc:
+            logging.exception("Failed to render diagram %s.", filename)
+            with self._lock:
+                self._failed[filename] = str(exc)
+                while len(self._failed) > self.max_failed:
+                    self._failed.popitem(last=False)
+            if os.path.isfile(temp_filepath):
+                os.remove(temp_filepath)
+        finally:
+            with self._lock:
+                self._pending.pop(filename, None)
+            try:
+                os.remove(self._getMarkerPath(filename))
+            except OSError:
+                pass
+
+    def requestDiagram(self, job_id, matching_result, filtered_family_id=None, filtered_sample_id=None):
+        """ Answer True if the diagram is available, otherwise schedule rendering it and answer False.
+
+        matching_result is read from a worker thread and must not be modified afterwards.
+        """
+        filename = self.getFilename(job_id, filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id)
+        if os.path.isfile(self.diagram_path + os.sep + filename):
+            return True
+        with self._lock:
+            executor = self._getExecutor()
+            if filename in self._pending or not self._claim(filename):
+                self.num_deduplicated += 1
+            else:
+                self._failed.pop(filename, None)
+                self._pending[filename] = executor.submit(self._render, current_app._get_current_object(), filename, matching_result, filtered_family_id, filtered_sample_id)
+        return False
+
+    def getStatus(self, filename):
+        """ Answer one of "ready", "pending", "failed" or "missing" for the diagram with the given filename """
+        if not self.isValidFilename(filename):
+            return "missing"
+        if os.path.isfile(self.diagram_path + os.sep + filename):
+            return "ready"
+        with self._lock:
+            if self._pid == os.getpid() and filename in self._pending:
+                return "pending"
+            if filename in self._failed:
+                return "failed"
+        if self._isClaimed(filename):
+            return "pending"
+        return "missing"
+
+    def clear(self):
+        with self._lock:
+            self._failed = OrderedDict()
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "num_pending": len(self._pending) if self._pid == os.getpid() else 0,
+                "num_failed": len(self._failed),
+                "num_rendered": self.num_rendered,
+                "num_deduplicated": self.num_deduplicated,
+                "max_workers": self.max_workers,
+            }
+
+
+diagram_renderer = DiagramRenderer()
@@ -1,13 +1,17 @@
 import time
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from mcrit.client.McritClient import McritClient
+import json
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify
 from mcrit.storage.FamilyEntry import FamilyEntry
 from mcrit.storage.SampleEntry import SampleEntry
 from mcrit.storage.FunctionEntry import FunctionEntry
 
 from mcritweb.views.authentication import visitor_required, contributor_required
-from mcritweb.views.utility import get_server_url, mcrit_server_required
+from mcritweb.views.utility import get_client, mcrit_server_required
 from mcritweb.views.cursor_pagination import CursorPagination
+from mcritweb.views.cfg_cache import cfg_cache
+from mcritweb.views.upstream_fetcher import upstream_fetcher
+from mcritweb.views.family_names import family_name_index
+from mcritweb.views.sample_cache import sample_cache
 
 import mcritweb.views.cfg_explorer_detector as cfg_explorer_detector
 
@@ -27,7 +31,7 @@ def modifyFamily():
         data = data.decode("utf-8")
         if not request.form.to_dict(flat=False):
             return None
-        client = McritClient(mcrit_server= get_server_url())
+        client = get_client()
         family_id = request.form.get("family_id", None)
         if family_id is None: 
             flash(f"No valid family_id received.", category="error")
@@ -47,6 +51,7 @@ def modifyFamily():
         # delete family
         if is_family_delete:
             job_id = client.deleteFamily(family_id, keep_samples=is_family_keeping_samples)
+            family_name_index.invalidate()
             flash(f"Job to delete family was scheduled.", category="info")
             return redirect(url_for('data.job_by_id', job_id=job_id, refresh=5))
         # check if sample_entry should be modified
@@ -58,10 +63,28 @@ def modifyFamily():
             new_is_library = None
         if any([item is not None for item in [new_family_name, new_is_library]]):
             job_id = client.modifyFamily(family_id, family_name=new_family_name, is_library=new_is_library)
+            family_name_index.invalidate()
             time.sleep(0.3)
         flash(f"Job to modify family was scheduled.", category="info")
     return redirect(url_for('explore.families'))
 
+@bp.route('/family_names')
+@mcrit_server_required
+@visitor_required
+def family_names():
+    # autocomplete for family fields, browsers revalidate cached answers by a hash of their content
+    query = request.args.get('query', "")
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+    except ValueError:
+        limit = 10
+    names = family_name_index.search(get_client(), query, limit=limit)
+    response = jsonify({"family_names": names})
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
 @bp.route('/families')
 @mcrit_server_required
 @visitor_required
@@ -70,19 +93,18 @@ def families():
     if family_id is not None:
         return redirect(url_for('explore.family_by_id', family_id=family_id, p=request.args.get('p')))
     query = request.args.get('query', "")
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
     families = []
     pagination = CursorPagination(request, default_sort="family_id")
-    results = client.search_families(query, **pagination.getSearchParams(), limit=50)
+    search_params = pagination.getSearchParams()
+    results = client.search_families(query, **search_params, limit=50)
     pagination.read_cursor_from_result(results)
     if results is None:
         flash(f"Ups, search for {query} in MCRIT's families failed!", category="error")
     else:
         for family_dict in results['search_results'].values():
             families.append(FamilyEntry.fromDict(family_dict))
-    all_families = client.getFamilies()
-    family_names = [family_entry.family_name for family_entry in all_families.values()]
-    return render_template("families.html", families=families, family_names=family_names, pagination=pagination, query=query)
+    return render_template("families.html", families=families, pagination=pagination, query=query)
 
 
 @bp.route('/modifySample', methods=['POST'])
@@ -94,7 +116,7 @@ def modifySample():
         data = data.decode("utf-8")
         if not request.form.to_dict(flat=False):
             return None
-        client = McritClient(mcrit_server= get_server_url())
+        client = get_client()
         sample_id = request.form.get("sample_id", None)
         if sample_id is None: 
             flash(f"No valid sample_id received.", category="error")
@@ -112,6 +134,7 @@ def modifySample():
         # delete sample
         if is_sample_delete:
             job_id = client.deleteSample(sample_id)
+            sample_cache.invalidate(sample_id)
             flash(f"Job to delete sample was scheduled.", category="info")
             return redirect(url_for('data.job_by_id', job_id=job_id, refresh=5))
         # check if sample_entry should be modified
@@ -126,6 +149,9 @@ def modifySample():
             new_is_library = None
         if any([item is not None for item in [new_family_name, new_version, new_is_library]]):
             client.modifySample(sample_id, family_name=new_family_name, version=new_version, is_library=new_is_library)
+            sample_cache.invalidate(sample_id)
+            if new_family_name is not None:
+                family_name_index.invalidate()
             time.sleep(0.3)
         flash(f"Job to modify sample was scheduled.", category="info")
     return redirect(url_for('explore.samples'))
@@ -140,20 +166,18 @@ def samples():
         return redirect(url_for('explore.sample_by_id', sample_id=sample_id, p=request.args.get('p')))
 
     query = request.args.get('query', "")
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
     samples = []
     pagination = CursorPagination(request, default_sort="sample_id")
-    results = client.search_samples(query, **pagination.getSearchParams(), limit=50)
+    search_params = pagination.getSearchParams()
+    results = client.search_samples(query, **search_params, limit=50)
     pagination.read_cursor_from_result(results)
     if results is None:
         flash(f"Ups, search for {query} in MCRIT's samples failed!", category="error")
     else:
         for sample_dict in results['search_results'].values():
             samples.append(SampleEntry.fromDict(sample_dict))
-
-    all_families = client.getFamilies()
-    family_names = [family_entry.family_name for family_entry in all_families.values()]
-    return render_template("samples.html", samples=samples, family_names=family_names, pagination=pagination, query=query)
+    return render_template("samples.html", samples=samples, pagination=pagination, query=query)
 
 
 @bp.route('/functions')
@@ -164,7 +188,7 @@ def functions():
     if not function_id is None:
         return redirect(url_for('explore.function_by_id', function_id=function_id, p=request.args.get('p')))
     query = request.args.get('query', "")
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
     functions = []
     pagination = CursorPagination(request, default_sort="function_id")
     results = client.search_functions(query, **pagination.getSearchParams(), limit=50)
@@ -185,24 +209,25 @@ def functions():
 @mcrit_server_required
 @visitor_required
 def family_by_id(family_id):
-    client = McritClient(mcrit_server= get_server_url())
-    family_info = client.getFamily(family_id, with_samples=False)
+    client = get_client()
+    original_query = request.args.get('query', "")
+    query = f"family_id:{family_id} {original_query}"
+    pagination = CursorPagination(request, default_sort="sample_id")
+    search_params = pagination.getSearchParams()
+    # the samples are only used if the family exists, but are fetched alongside it
+    family_info, results = upstream_fetcher.fetch(
+        lambda: client.getFamily(family_id, with_samples=False),
+        lambda: client.search_samples(query, **search_params, limit=50),
+    )
     if family_info:
-        original_query = request.args.get('query', "")
-        query = f"family_id:{family_id} {original_query}"
-        client = McritClient(mcrit_server= get_server_url())
         samples = []
-        pagination = CursorPagination(request, default_sort="sample_id")
-        results = client.search_samples(query, **pagination.getSearchParams(), limit=50)
         pagination.read_cursor_from_result(results)
         if results is None:
             flash(f"Ups, search for {query} in MCRIT's samples failed!", category="error")
         else:
             for sample_dict in results['search_results'].values():
                 samples.append(SampleEntry.fromDict(sample_dict))
-        all_families = client.getFamilies()
-        family_names = [family_entry.family_name for family_entry in all_families.values()]
-        return render_template("single_family.html", family=family_info, samples=samples, family_names=family_names, pagination=pagination, query=original_query)
+        return render_template("single_family.html", family=family_info, samples=samples, pagination=pagination, query=original_query)
     else:
         flash("The given Family ID doesn't exist", category='error')
         return redirect(url_for('explore.families'))
@@ -212,22 +237,29 @@ def family_by_id(family_id):
 @visitor_required
 @mcrit_server_required
 def sample_by_id(sample_id):
-    client = McritClient(mcrit_server= get_server_url())
-    sample_entry = client.getSampleById(sample_id)
-    if sample_entry:
-        if sample_id < 0:
+    client = get_client()
+    if sample_id < 0:
+        sample_entry = client.getSampleById(sample_id)
+        if sample_entry:
             return render_template("single_query_sample.html", entry=sample_entry)
+    else:
         original_query = request.args.get('query', "")
         query = f"sample_id:{sample_id} {original_query}"
-        client = McritClient(mcrit_server= get_server_url())
-        functions = []
         pagination = CursorPagination(request, default_sort="function_id")
-        results = client.search_functions(query, **pagination.getSearchParams(), limit=50)
+        search_params = pagination.getSearchParams()
+        # functions and jobs are only used if the sample exists, but are fetched alongside it
+        sample_entry, results, jobs = upstream_fetcher.fetch(
+            lambda: client.getSampleById(sample_id),
+            lambda: client.search_functions(query, **search_params, limit=50),
+            lambda: client.getQueueData(filter=sample_id),
+        )
+    if sample_entry:
+        functions = []
+        filtered_jobs = []
         pagination.read_cursor_from_result(results)
         if results is None:
             flash(f"Ups, search for {query} in MCRIT's functions failed!", category="error")
         else:
-            jobs = client.getQueueData(filter=sample_id)
             filtered_jobs = [job for job in jobs if '('+str(sample_id)+')' in job.parameters or '('+str(sample_id)+',' in job.parameters or ','+str(sample_id)+',' in job.parameters or ','+str(sample_id)+')' in job.parameters]
             for function_dict in results['search_results'].values():
                 functions.append(FunctionEntry.fromDict(function_dict))
@@ -241,11 +273,13 @@ def sample_by_id(sample_id):
 @visitor_required
 @mcrit_server_required
 def function_by_id(function_id):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     function_entry = client.getFunctionById(function_id)
     if function_entry:
-        sample_entry = client.getSampleById(function_entry.sample_id)
-        pichash_match_summary = client.getMatchesForPicHash(function_entry.pichash, summary=True)
+        sample_entry, pichash_match_summary = upstream_fetcher.fetch(
+            lambda: client.getSampleById(function_entry.sample_id),
+            lambda: client.getMatchesForPicHash(function_entry.pichash, summary=True),
+        )
         return render_template("single_function.html", entry=function_entry, sample_entry=sample_entry, pichash_match_summary=pichash_match_summary)
     else:
         flash("The given Function ID doesn't exist", category="error")
@@ -256,22 +290,30 @@ def function_by_id(function_id):
 @visitor_required
 @mcrit_server_required
 def fetchDotGraph(function_id):
-    client = McritClient(mcrit_server=get_server_url())
-    function_entry = client.getFunctionById(function_id, with_xcfg=True)
-    if function_entry:
-        smda_function = function_entry.toSmdaFunction()
-        dot_graph = smda_function.toDotGraph()
-        # TODO can possibly do this fixup in a better place
-        pbh_by_offset = {pbh["offset"]: pbh for pbh in function_entry.picblockhashes}
-        for smda_block in smda_function.getBlocks():
-            needle = f',label="{smda_block.offset:x}'
-            replacement = f',comment=""{needle}'
-            if smda_block.offset in pbh_by_offset:
-                replacement = f',comment="0x{pbh_by_offset[smda_block.offset]["hash"]:x}"{needle}'
-            dot_graph = dot_graph.replace(needle, replacement)
-        return dot_graph
+    cfg_payload = cfg_cache.getPayload(function_id)
+    if cfg_payload:
+        return cfg_payload["dot_graph"]
     return ""
 
+# helper for @bp.route('/functions/<int:function_id>'), dot graph and loops in one cached payload
+@bp.route('/fetchCfg/<int(signed=True):function_id>', methods=['GET'])
+@visitor_required
+@mcrit_server_required
+def fetchCfg(function_id):
+    key = cfg_cache.getKey(function_id)
+    # payloads are immutable per key, so browsers only need to revalidate
+    if key in request.if_none_match:
+        response = Response(status=304)
+    else:
+        cfg_payload = cfg_cache.getPayload(function_id, key=key)
+        if not cfg_payload:
+            return Response(json.dumps({}), status=404, mimetype="application/json")
+        response = Response(json.dumps(cfg_payload), mimetype="application/json")
+    response.set_etag(key)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 # helper for @bp.route('/functions/<int:function_id>')
 @bp.route('/findLoops/', methods=['GET', 'POST'])
 @visitor_required
@@ -290,7 +332,7 @@ def findLoops():
 @visitor_required
 @mcrit_server_required
 def getPicBlockMatches(picblockhash):
-    client = McritClient(mcrit_server=get_server_url())
+    client = get_client()
     return client.getMatchesForPicBlockHash(int(picblockhash, 16), summary=True)
 
 ##############################################################
@@ -301,7 +343,7 @@ def getPicBlockMatches(picblockhash):
 @visitor_required
 @mcrit_server_required
 def statistics():
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
     stats = client.getStatus()
     return render_template("statistics.html", stats=stats)
 
@@ -322,14 +364,31 @@ def search():
         types = request.args["type"].split(",")
     if not query:
         return render_template("search.html", search_types=types)
-    client = McritClient(mcrit_server= get_server_url())
+    client = get_client()
 
-    #TODO: show id/sha matches in extra place
-    families = []
+    # run the searches for all requested types concurrently
     family_pagination = None
+    sample_pagination = None
+    function_pagination = None
+    search_calls = []
     if 'family' in types:
         family_pagination = CursorPagination(request, query_param_prefix="family", default_sort="family_id")
-        results = client.search_families(query, **family_pagination.getSearchParams(), limit=15)
+        family_search_params = family_pagination.getSearchParams()
+        search_calls.append(lambda: client.search_families(query, **family_search_params, limit=15))
+    if 'sample' in types:
+        sample_pagination = CursorPagination(request, query_param_prefix="sample", default_sort="sample_id")
+        sample_search_params = sample_pagination.getSearchParams()
+        search_calls.append(lambda: client.search_samples(query, **sample_search_params, limit=15))
+    if 'function' in types:
+        function_pagination = CursorPagination(request, query_param_prefix="function", default_sort="function_id")
+        function_search_params = function_pagination.getSearchParams()
+        search_calls.append(lambda: client.search_functions(query, **function_search_params, limit=15))
+    search_results = iter(upstream_fetcher.fetch(*search_calls))
+
+    #TODO: show id/sha matches in extra place
+    families = []
+    if 'family' in types:
+        results = next(search_results)
         family_pagination.read_cursor_from_result(results)
         if results is None:
             flash(f"Ups, search for {query} in MCRIT's families failed!", category="error")
@@ -343,10 +402,8 @@ def search():
                 families.append(family) 
 
     samples = []
-    sample_pagination = None
     if 'sample' in types:
-        sample_pagination = CursorPagination(request, query_param_prefix="sample", default_sort="sample_id")
-        results = client.search_samples(query, **sample_pagination.getSearchParams(), limit=15)
+        results = next(search_results)
         sample_pagination.read_cursor_from_result(results)
         if results is None:
             flash(f"Ups, search for {query} in MCRIT's samples failed!", category="error")
@@ -361,10 +418,8 @@ def search():
                 samples.append(SampleEntry.fromDict(sample_dict))
 
     functions = []
-    function_pagination = None
     if 'function' in types:
-        function_pagination = CursorPagination(request, query_param_prefix="function", default_sort="function_id")
-        results = client.search_functions(query, **function_pagination.getSearchParams(), limit=15)
+        results = next(search_results)
         function_pagination.read_cursor_from_result(results)
         if results is None:
             flash(f"Ups, search for {query} in MCRIT's functions failed!", category="error")
@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import zlib
+import tempfile
+
+
+EXPORT_FORMATS = ("json", "ndjson")
+
+_RANGE_PATTERN = re.compile(r"^\s*(\d+)\s*(?:-\s*(\d+)\s*)?$")
+
+
+def parse_sample_ranges(text):
+    """ Parse sample_ids given as "1, 5-10, 42" into a list of inclusive (first, last) ranges, raise ValueError if malformed """
+    ranges = []
+    for part in text.split(","):
+        match = _RANGE_PATTERN.match(part)
+        if not match:
+            raise ValueError(f"Invalid sample_id or range: {part.strip()}")
+        first = int(match.group(1))
+        last = int(match.group(2)) if match.group(2) is not None else first
+        if last < first:
+            raise ValueError(f"Invalid range: {part.strip()}")
+        ranges.append((first, last))
+    return ranges
+
+
+def iterate_sample_ids(client, page_size=500, ranges=None):
+    """ Iterate the ids of all samples in MCRIT, page by page, optionally only those within the given ranges """
+    start = 0
+    while True:
+        samples = client.getSamples(start=start, limit=page_size)
+        if not samples:
+            return
+        for sample_entry in samples.values():
+            if ranges is None or any(first <= sample_entry.sample_id <= last for first, last in ranges):
+                yield sample_entry.sample_id
+        if len(samples) < page_size:
+            return
+        start += page_size
+
+
+def iterate_chunks(sample_ids, chunk_size):
+    chunk = []
+    for sample_id in sample_ids:
+        chunk.append(sample_id)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SpooledSection(object):
+    """ A section of a merged export, whose "sha256": entry pairs are collected in a single temporary file """
+
+    def __init__(self, temp_path=None) -> None:
+        self._file = tempfile.TemporaryFile(dir=temp_path)
+        self.num_entries = 0
+
+    def add(self, entries):
+        for key, entry in entries.items():
+            if self.num_entries:
+                self._file.write(b", ")
+            self._file.write(f"{json.dumps(key)}: {json.dumps(entry)}".encode("utf-8"))
+            self.num_entries += 1
+
+    def iterEncoded(self, block_size=1024 ** 2):
+        yield b"{"
+        self._file.seek(0)
+        while True:
+            block = self._file.read(block_size)
+            if not block:
+                break
+            yield block
+        yield b"}"
+
+    def close(self):
+        self._file.close()
+
+
+class ExportMerger(object):
+    """ Merges MCRIT export documents of consecutive sample chunks into a single document.
+
+    The sample_entries and function_entries of all chunks (the latter possibly compressed strings)
+    are spooled to one temporary file per section, so only one chunk is ever held in memory.
+    The family_mapping is small and merged in memory, the counters in content are recomputed
+    for the merged document and all other values, e.g. the config, are taken from the first chunk.
+    """
+
+    SPOOLED_SECTIONS = ("sample_entries", "function_entries")
+
+    def __init__(self, temp_path=None) -> None:
+        self.temp_path = temp_path
+        self._document = {}
+        self._family_mapping = {}
+        self._num_samples = 0
+        self._num_functions = 0
+
+    def add(self, export_data):
+        for key, value in export_data.items():
+            if key in self.SPOOLED_SECTIONS:
+                if key not in self._document:
+                    self._document[key] = SpooledSection(temp_path=self.temp_path)
+                self._document[key].add(value)
+            elif key == "family_mapping":
+                self._document.setdefault(key, self._family_mapping)
+                self._family_mapping.update(value)
+            else:
+                self._document.setdefault(key, value)
+        content = export_data.get("content", {})
+        self._num_samples += content.get("num_samples", 0)
+        self._num_functions += content.get("num_functions", 0)
+
+    def getContent(self):
+        content = dict(self._document.get("content", {}))
+        content["num_samples"] = self._num_samples
+        content["num_functions"] = self._num_functions
+        content["num_families"] = len(self._family_mapping)
+        return content
+
+    def iterEncoded(self):
+        """ Yield the merged document as JSON, in encoded blocks """
+        yield b"{"
+        for index, (key, value) in enumerate(self._document.items()):
+            yield (", " if index else "").encode("utf-8") + json.dumps(key).encode("utf-8") + b": "
+            if isinstance(value, SpooledSection):
+                yield from value.iterEncoded()
+            elif key == "content":
+                yield json.dumps(self.getContent()).encode("utf-8")
+            else:
+                yield json.dumps(value).encode("utf-8")
+        yield b"}"
+
+    def close(self):
+        for value in self._document.values():
+            if isinstance(value, SpooledSection):
+                value.close()
+        self._document = {}
+
+
+def stream_export(client, sample_id_chunks, export_format="json", is_gzip=False, temp_path=None):
+    """ Generate an export of the given chunks of sample_ids, fetching one chunk from MCRIT at a time.
+
+    NDJSON exports have one MCRIT export document per chunk and line and are sent as they arrive.
+    JSON exports are merged into one document compatible with a single export, which can only be
+    sent once all chunks are collected; until then, a line break per chunk keeps the connection busy.
+    """
+    compressor = zlib.compressobj(wbits=31) if is_gzip else None
+
+    def emit(data, flush=False):
+        if compressor is None:
+            return data
+        compressed = compressor.compress(data)
+        if flush:
+            compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+        return compressed
+
+    if temp_path is not None:
+        os.makedirs(temp_path, exist_ok=True)
+    if export_format == "ndjson":
+        for sample_ids in sample_id_chunks:
+            yield emit((json.dumps(client.getExportData(sample_ids)) + "\n").encode("utf-8"), flush=True)
+    else:
+        merger = ExportMerger(temp_path=temp_path)
+        try:
+            has_chunks = False
+            for sample_ids in sample_id_chunks:
+                merger.add(client.getExportData(sample_ids))
+                has_chunks = True
+                # leading whitespace is valid JSON
+                yield emit(b"\n", flush=True)
+            if not has_chunks:
+                merger.add(client.getExportData([]))
+            # the document is encoded in many small pieces, which we send in larger blocks
+            buffer = bytearray()
+            for block in merger.iterEncoded():
+                buffer += block
+                if len(buffer) >= 64 * 1024:
+                    yield emit(bytes(buffer))
+                    buffer.clear()
+            yield emit(bytes(buffer))
+        finally:
+            merger.close()
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,95 @@
+import time
+import bisect
+import threading
+
+
+class FamilyNameIndex(object):
+    """ Sorted family names of the MCRIT server, for autocompleting family fields.
+
+    Pages used to fetch all families and inline their names, only for the autocomplete.
+    Instead, fields now ask the family_names endpoint for the names matching what was typed,
+    which are served from here. Names are refetched after ttl seconds, when a view changed
+    families (e.g. by modifying, deleting or submitting) and once a job is first seen finished,
+    as the change of queued jobs only becomes visible in MCRIT then.
+    """
+
+    def __init__(self, ttl=60) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._server_url = None
+        self._names = []
+        self._lowercase_names = []
+        self._fetched_at = None
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get("FAMILY_NAMES_TTL", self.ttl)
+        self.clear()
+
+    def _isValid(self, server_url):
+        return self._fetched_at is not None and server_url == self._server_url and time.time() - self._fetched_at < self.ttl
+
+    def _refresh(self, client):
+        families = client.getFamilies()
+        names = sorted({family_entry.family_name for family_entry in families.values() if family_entry.family_name}, key=str.lower) if families else []
+        with self._lock:
+            self._server_url = client.mcrit_server
+            self._names = names
+            self._lowercase_names = [name.lower() for name in names]
+            self._fetched_at = time.time()
+
+    def ensureFresh(self, client):
+        with self._lock:
+            is_valid = self._isValid(client.mcrit_server)
+            if is_valid:
+                self.num_hits += 1
+            else:
+                self.num_misses += 1
+        if not is_valid:
+            self._refresh(client)
+
+    def search(self, client, query, limit=10):
+        """ Answer up to limit family names starting with query, followed by those only containing it """
+        self.ensureFresh(client)
+        query = query.lower()
+        with self._lock:
+            names = self._names
+            lowercase_names = self._lowercase_names
+        start = bisect.bisect_left(lowercase_names, query)
+        matches = []
+        for index in range(start, len(names)):
+            if len(matches) >= limit or not lowercase_names[index].startswith(query):
+                break
+            matches.append(names[index])
+        if len(matches) < limit:
+            for name, lowercase_name in zip(names, lowercase_names):
+                if query in lowercase_name and not lowercase_name.startswith(query):
+                    matches.append(name)
+                    if len(matches) >= limit:
+                        break
+        return matches
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+    def clear(self):
+        with self._lock:
+            self._server_url = None
+            self._names = []
+            self._lowercase_names = []
+            self._fetched_at = None
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "num_names": len(self._names),
+                "fetched_at": self._fetched_at,
+                "ttl": self.ttl,
+                "num_hits": self.num_hits,
+                "num_misses": self.num_misses,
+            }
+
+
+family_name_index = FamilyNameIndex()
@@ -0,0 +1,137 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from mcritweb.views.utility import get_client, get_server_url
+
+
+class FunctionMetrics(object):
+    """ The few per-function fields needed for rendering a sample's match diagram, as arrays in server order """
+
+    def __init__(self, function_ids=None, num_instructions=None, binweights=None) -> None:
+        self.function_ids = np.array(function_ids if function_ids is not None else [], dtype=np.int64)
+        self.num_instructions = np.array(num_instructions if num_instructions is not None else [], dtype=np.int64)
+        self.binweights = np.array(binweights if binweights is not None else [], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.function_ids)
+
+    @classmethod
+    def fromFunctionEntries(cls, function_entries):
+        return cls(
+            [function_entry.function_id for function_entry in function_entries],
+            [function_entry.num_instructions for function_entry in function_entries],
+            [function_entry.binweight for function_entry in function_entries],
+        )
+
+    def toArray(self):
+        return np.stack([self.function_ids, self.num_instructions, self.binweights])
+
+    @classmethod
+    def fromArray(cls, array):
+        return cls(array[0], array[1], array[2])
+
+
+class FunctionMetricsStore(object):
+    """ Caches FunctionMetrics per server and sample, in memory and in instance/cache/function_metrics.
+
+    Fetching all function entries of a sample is the largest request when rendering diagrams,
+    so we only do it once per sample and keep the metrics we need. The functions of a sample
+    never change, so entries stay valid until the local cache is cleared with a server reset.
+    Entries are kept apart per server URL, as sample_ids of different servers are unrelated, and
+    keyed by sample_id and sha256, so a sample_id reused after MCRIT was reset elsewhere never
+    matches the entry of the sample it had before.
+    """
+
+    def __init__(self, cache_path=None, max_entries=64) -> None:
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def init_app(self, app):
+        self.cache_path = os.sep.join([app.instance_path, "cache", "function_metrics"])
+        self.max_entries = app.config.get("FUNCTION_METRICS_CACHE_ENTRIES", self.max_entries)
+        self.clear()
+
+    def _getPath(self, server_url, sample_id, sha256):
+        server_dir = hashlib.sha256(server_url.encode("utf-8")).hexdigest()[:16]
+        return os.sep.join([self.cache_path, server_dir, f"{int(sample_id)}_{sha256}.npy"])
+
+    def _remember(self, key, function_metrics):
+        with self._lock:
+            self._entries[key] = function_metrics
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, server_url, sample_id, sha256):
+        try:
+            return FunctionMetrics.fromArray(np.load(self._getPath(server_url, sample_id, sha256)))
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _save(self, server_url, sample_id, sha256, function_metrics):
+        path = self._getPath(server_url, sample_id, sha256)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "wb") as fout:
+                np.save(fout, function_metrics.toArray())
+            os.replace(temp_path, path)
+        except OSError:
+            logging.exception("Failed to cache function metrics for sample %s.", sample_id)
+
+    def _fetch(self, sample_id):
+        function_entries = get_client().getFunctionsBySampleId(sample_id)
+        if function_entries is None:
+            return None
+        return FunctionMetrics.fromFunctionEntries(function_entries)
+
+    def get(self, sample_entry):
+        """ Answer the FunctionMetrics for sample_entry, empty if the sample is not known to MCRIT (e.g. a query) """
+        sample_id = sample_entry.sample_id
+        sha256 = (sample_entry.sha256 or "").lower()
+        if not re.fullmatch("[0-9a-f]{64}", sha256):
+            # without a sha256 we cannot tell reused sample_ids apart, so we do not cache at all
+            return self._fetch(sample_id) or FunctionMetrics()
+        server_url = get_server_url()
+        key = (server_url, sample_id, sha256)
+        with self._lock:
+            function_metrics = self._entries.get(key)
+            if function_metrics is not None:
+                self._entries.move_to_end(key)
+                self.num_hits += 1
+                return function_metrics
+            self.num_misses += 1
+        function_metrics = self._load(server_url, sample_id, sha256)
+        if function_metrics is None:
+            function_metrics = self._fetch(sample_id)
+            if function_metrics is None:
+                return FunctionMetrics()
+            self._save(server_url, sample_id, sha256, function_metrics)
+        self._remember(key, function_metrics)
+        return function_metrics
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "num_entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "num_hits": self.num_hits,
+                "num_misses": self.num_misses,
+            }
+
+
+function_metrics_store = FunctionMetricsStore()
@@ -0,0 +1,251 @@
+import os
+import re
+import gzip
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import ijson
+
+from mcritweb.views.export_stream import iterate_chunks
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_upload(path):
+    """ Open an upload, which may be gzipped, answer the raw file (for progress) and the stream to read """
+    raw_file = open(path, "rb")
+    if raw_file.read(2) == GZIP_MAGIC:
+        raw_file.seek(0)
+        return raw_file, gzip.GzipFile(fileobj=raw_file)
+    raw_file.seek(0)
+    return raw_file, raw_file
+
+
+def has_multiple_lines(stream, block_size=1024 ** 2):
+    """ Answer if there is content after the first non-blank line, without holding more than a block in memory """
+    is_in_first_line = False
+    is_after_first_line = False
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            return False
+        if not is_in_first_line:
+            block = block.lstrip()
+            if not block:
+                continue
+            is_in_first_line = True
+        if not is_after_first_line:
+            if b"\n" not in block:
+                continue
+            is_after_first_line = True
+            block = block[block.index(b"\n") + 1:]
+        if block.strip():
+            return True
+
+
+def iterate_document_batches(path, batch_size=10):
+    """ Split a single MCRIT export document into documents of up to batch_size samples each.
+
+    The document is parsed incrementally with ijson, so only one batch of sample and function
+    entries is held in memory. The small sections are read first, then sample entries and function
+    entries are read side by side from two streams, as they are exported in the same order.
+    """
+    with contextlib.ExitStack() as stack:
+
+        def open_stream():
+            raw_file, stream = open_upload(path)
+            stack.callback(raw_file.close)
+            return raw_file, stream
+
+        header = {}
+        for key in ["content", "config", "family_mapping"]:
+            header[key] = next(ijson.items(open_stream()[1], key, use_float=True), None)
+            if header[key] is None:
+                raise ValueError("This doesn't seem to be valid MCRIT data in JSON format")
+        raw_file, stream = open_stream()
+        sample_entries = ijson.kvitems(stream, "sample_entries", use_float=True)
+        function_entries = ijson.kvitems(open_stream()[1], "function_entries", use_float=True)
+        # function entries read ahead of their sample entries, which only grows if the order differs
+        pending_function_entries = {}
+        for batch in iterate_chunks(sample_entries, batch_size):
+            batch_sample_entries = dict(batch)
+            for sha256, function_entry in function_entries:
+                pending_function_entries[sha256] = function_entry
+                if all(sha256 in pending_function_entries for sha256 in batch_sample_entries):
+                    break
+            batch_family_ids = {str(sample_entry["family_id"]) for sample_entry in batch_sample_entries.values()}
+            document = {
+                "content": {**header["content"], "num_samples": len(batch_sample_entries)},
+                "config": header["config"],
+                "family_mapping": {family_id: family for family_id, family in header["family_mapping"].items() if family_id in batch_family_ids},
+                "sample_entries": batch_sample_entries,
+                "function_entries": {sha256: pending_function_entries.pop(sha256) for sha256 in batch_sample_entries if sha256 in pending_function_entries},
+            }
+            yield document, raw_file.tell()
+
+
+def iterate_import_documents(path, batch_size=10):
+    """ Iterate the MCRIT export documents of an upload, which may be gzipped, with the number of bytes read so far.
+
+    NDJSON uploads (see export_stream) are parsed one line, i.e. one chunk of samples, at a time.
+    Single documents, as exported by MCRIT or previous versions, are split into batches of samples.
+    """
+    with contextlib.ExitStack() as stack:
+        raw_file, stream = open_upload(path)
+        stack.callback(raw_file.close)
+        is_ndjson = has_multiple_lines(stream)
+        if is_ndjson:
+            raw_file, stream = open_upload(path)
+            stack.callback(raw_file.close)
+            is_first_line = True
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    document = json.loads(line)
+                except json.JSONDecodeError:
+                    # never fall back once documents of this upload were imported
+                    if not is_first_line:
+                        raise
+                    # a document spread over lines, e.g. pretty printed
+                    is_ndjson = False
+                    break
+                is_first_line = False
+                yield document, raw_file.tell()
+    if not is_ndjson:
+        yield from iterate_document_batches(path, batch_size=batch_size)
+
+
+def merge_import_results(results, batch_results):
+    """ Add up the counters MCRIT reports per imported batch, other values are taken from the last batch """
+    for key, value in batch_results.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(results.get(key, 0), (int, float)):
+            results[key] = results.get(key, 0) + value
+        else:
+            results[key] = value
+    return results
+
+
+class ImportManager(object):
+    """ Imports uploaded exports into MCRIT in the background, one chunk of samples at a time.
+
+    Uploads are stored in instance/temp/import and read incrementally by a worker, which only
+    parses the next chunk (or batch of batch_size samples) once MCRIT has taken the previous one,
+    so memory is bounded by the size of a chunk. Progress is written to a status file per import
+    after every chunk, so any worker process can report it.
+    """
+
+    def __init__(self, max_workers=1, batch_size=10) -> None:
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.temp_path = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.num_imports = 0
+        self.num_batches = 0
+
+    def init_app(self, app):
+        self.max_workers = app.config.get("IMPORT_WORKERS", self.max_workers)
+        self.batch_size = app.config.get("IMPORT_BATCH_SIZE", self.batch_size)
+        self.temp_path = os.sep.join([app.instance_path, "temp", "import"])
+
+    def _getExecutor(self):
+        # worker threads do not survive a fork, so we create the pool lazily per process
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mcrit-import")
+            self._pid = os.getpid()
+        return self._executor
+
+    def _getPath(self, import_id, extension):
+        if not isinstance(import_id, str) or not re.match("^[0-9a-f]{32}$", import_id):
+            raise ValueError("Invalid import_id")
+        return self.temp_path + os.sep + f"{import_id}.{extension}"
+
+    def _writeStatus(self, status):
+        status_path = self._getPath(status["import_id"], "json")
+        temp_filepath = status_path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_filepath, "w") as fout:
+            json.dump(status, fout)
+        os.replace(temp_filepath, status_path)
+
+    def _run(self, client, status):
+        upload_path = self._getPath(status["import_id"], "upload")
+        status["state"] = "running"
+        self._writeStatus(status)
+        try:
+            for document, num_bytes_read in iterate_import_documents(upload_path, batch_size=self.batch_size):
+                batch_results = client.addImportData(document)
+                if not batch_results:
+                    raise ValueError("MCRIT did not accept the data of chunk %d" % (status["num_batches"] + 1))
+                merge_import_results(status["results"], batch_results)
+                del document
+                status["num_batches"] += 1
+                status["num_bytes_read"] = num_bytes_read
+                self._writeStatus(status)
+                with self._lock:
+                    self.num_batches += 1
+            status["state"] = "finished"
+        except (json.JSONDecodeError, ijson.JSONError, UnicodeDecodeError, gzip.BadGzipFile):
+            status["state"] = "failed"
+            status["error"] = "This doesn't seem to be valid MCRIT data in JSON format"
+        except Exception as exc:
+            logging.exception("Failed to import %s.", status["import_id"])
+            status["state"] = "failed"
+            status["error"] = str(exc)
+        finally:
+            status["finished_at"] = time.time()
+            self._writeStatus(status)
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+
+    def startImport(self, client, file_storage):
+        """ Store the uploaded file and schedule importing it, answer the import_id to follow its progress """
+        import_id = uuid.uuid4().hex
+        os.makedirs(self.temp_path, exist_ok=True)
+        upload_path = self._getPath(import_id, "upload")
+        file_storage.save(upload_path)
+        status = {
+            "import_id": import_id,
+            "filename": file_storage.filename,
+            "state": "queued",
+            "started_at": time.time(),
+            "finished_at": None,
+            "num_batches": 0,
+            "num_bytes_read": 0,
+            "num_bytes": os.path.getsize(upload_path),
+            "results": {},
+            "error": None,
+        }
+        self._writeStatus(status)
+        with self._lock:
+            self.num_imports += 1
+            self._getExecutor().submit(self._run, client, status)
+        return import_id
+
+    def getStatus(self, import_id):
+        """ Answer the status of an import as dict, None if it is unknown """
+        try:
+            with open(self._getPath(import_id, "json"), "r") as fin:
+                return json.load(fin)
+        except (ValueError, OSError):
+            return None
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "num_imports": self.num_imports,
+                "num_batches": self.num_batches,
+            }
+
+
+import_manager = ImportManager()
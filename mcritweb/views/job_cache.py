@@ -0,0 +1,86 @@
+import threading
+import functools
+from collections import OrderedDict
+
+from mcritweb.views.upstream_fetcher import upstream_fetcher
+
+
+class FinishedJobCache(object):
+    """ In-process LRU cache of finished jobs, which never change again.
+
+    Job overview pages of large jobs (e.g. cross compares) list over a thousand child jobs and are
+    refreshed every few seconds while running. With finished children served from here, a refresh
+    only polls the jobs still queued or in progress, concurrently through the upstream fetcher.
+    Callbacks registered with addFinishedListener are called with every job first seen finished,
+    so caches of data changed by jobs can be invalidated once the change is visible in MCRIT.
+    """
+
+    def __init__(self, max_entries=10000) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._finished_listeners = []
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("JOB_CACHE_MAX_ENTRIES", self.max_entries)
+        self.clear()
+
+    def _lookup(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                self.num_misses += 1
+                return None
+            self._jobs.move_to_end(job_id)
+            self.num_hits += 1
+            return job
+
+    def addFinishedListener(self, callback):
+        self._finished_listeners.append(callback)
+
+    def _remember(self, jobs):
+        finished_jobs = []
+        with self._lock:
+            for job in jobs:
+                if job is not None and job.is_finished:
+                    if job.job_id not in self._jobs:
+                        finished_jobs.append(job)
+                    self._jobs[job.job_id] = job
+                    self._jobs.move_to_end(job.job_id)
+            while len(self._jobs) > self.max_entries:
+                self._jobs.popitem(last=False)
+        for job in finished_jobs:
+            for callback in self._finished_listeners:
+                callback(job)
+
+    def getJob(self, client, job_id):
+        """ Answer the Job for job_id, only asking MCRIT if it is not known to be finished """
+        return self.getJobs(client, [job_id])[0]
+
+    def getJobs(self, client, job_ids):
+        """ Answer the Jobs for all job_ids in order, fetching those not known to be finished concurrently """
+        jobs = [self._lookup(job_id) for job_id in job_ids]
+        missing_indices = [index for index, job in enumerate(jobs) if job is None]
+        fetched_jobs = upstream_fetcher.fetch(*[functools.partial(client.getJobData, job_ids[index]) for index in missing_indices])
+        for index, job in zip(missing_indices, fetched_jobs):
+            jobs[index] = job
+        self._remember(fetched_jobs)
+        return jobs
+
+    def clear(self):
+        with self._lock:
+            self._jobs = OrderedDict()
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "num_entries": len(self._jobs),
+                "max_entries": self.max_entries,
+                "num_hits": self.num_hits,
+                "num_misses": self.num_misses,
+            }
+
+
+finished_job_cache = FinishedJobCache()
@@ -0,0 +1,171 @@
+import os
+import time
+import json
+import queue
+import logging
+import threading
+
+from flask import current_app
+
+from mcritweb.views.job_cache import finished_job_cache
+
+
+class JobWatch(object):
+    """ State of a single watched job, owned by its poller thread """
+
+    def __init__(self, job_id) -> None:
+        self.job_id = job_id
+        self.subscribers = []
+        # job_id -> state, for the job and all of its children as last seen
+        self.states = {}
+        # the last event sent, once the job is done
+        self.final_event = None
+        # when the last subscriber left, pollers outlive their subscribers briefly for reconnects
+        self.idle_since = time.time()
+        self.thread = None
+
+
+class JobProgressMonitor(object):
+    """ Pushes progress of running jobs to all browsers watching them, as server-sent events.
+
+    Instead of reloading the whole job overview every few seconds, pages subscribe to an event
+    stream. One poller thread per job and process asks MCRIT for the job and its children every
+    poll_interval seconds, no matter how many pages are watching. Finished children are served
+    by the finished job cache. Once the job is finished or failed, a final event is sent and the
+    poller stops, as it does when no subscriber came back within idle_timeout seconds.
+
+    Each stream only delivers a single event, at most stream_timeout seconds after connecting, and
+    then ends, so it never holds a request worker for long (e.g. of sync gunicorn workers).
+    Browsers reconnect on their own after the retry interval we announce, which is poll_interval,
+    and then immediately receive the states of the last poll.
+    """
+
+    def __init__(self, poll_interval=3, stream_timeout=5, idle_timeout=10) -> None:
+        self.poll_interval = poll_interval
+        self.stream_timeout = stream_timeout
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._watches = {}
+        self._pid = None
+        self.num_polls = 0
+        self.num_events = 0
+
+    def init_app(self, app):
+        self.poll_interval = app.config.get("JOB_PROGRESS_POLL_INTERVAL", self.poll_interval)
+        self.stream_timeout = app.config.get("JOB_PROGRESS_STREAM_TIMEOUT", self.stream_timeout)
+        self.idle_timeout = app.config.get("JOB_PROGRESS_IDLE_TIMEOUT", self.idle_timeout)
+
+    @staticmethod
+    def getState(job):
+        return {
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "is_failed": job.is_failed,
+            "progress": job.progress if job.started_at else 0,
+        }
+
+    def _publish(self, watch, event, data):
+        with self._lock:
+            if event == "done":
+                watch.final_event = (event, data)
+            subscribers = list(watch.subscribers)
+            self.num_events += len(subscribers)
+        for subscriber in subscribers:
+            subscriber.put((event, data))
+
+    def _poll(self, client, watch):
+        job = finished_job_cache.getJob(client, watch.job_id)
+        if job is None:
+            self._publish(watch, "done", {"is_failed": True})
+            return False
+        jobs = [job] + finished_job_cache.getJobs(client, job.all_dependencies)
+        states = {job.job_id: self.getState(job) for job in jobs if job is not None}
+        changed_states = {job_id: state for job_id, state in states.items() if watch.states.get(job_id) != state}
+        with self._lock:
+            self.num_polls += 1
+            watch.states = states
+        if job.finished_at is not None or job.is_failed:
+            # pages reload once done, so there is no need to send the final progress first
+            self._publish(watch, "done", {"is_failed": job.is_failed})
+            return False
+        if changed_states:
+            self._publish(watch, "progress", {"jobs": changed_states})
+        return True
+
+    def _run(self, app, client, watch):
+        with app.app_context():
+            is_running = True
+            while is_running:
+                try:
+                    is_running = self._poll(client, watch)
+                except Exception as exc:
+                    # MCRIT may be briefly unreachable, we simply try again with the next poll
+                    logging.warning("Polling progress of job %s failed: %s", watch.job_id, exc)
+                with self._lock:
+                    is_idle = not watch.subscribers and time.time() - watch.idle_since > self.idle_timeout
+                    if not is_running or is_idle:
+                        if self._watches.get(watch.job_id) is watch:
+                            del self._watches[watch.job_id]
+                        return
+                time.sleep(self.poll_interval)
+
+    def subscribe(self, client, job_id):
+        """ Answer a queue receiving (event, data) tuples for job_id, starting a poller if needed """
+        subscriber = queue.Queue()
+        with self._lock:
+            # poller threads do not survive a fork, so we forget all watches of the parent process
+            if self._pid != os.getpid():
+                self._watches = {}
+                self._pid = os.getpid()
+            watch = self._watches.get(job_id)
+            if watch is None:
+                watch = JobWatch(job_id)
+                self._watches[job_id] = watch
+                watch.thread = threading.Thread(target=self._run, args=(current_app._get_current_object(), client, watch), name="mcrit-job-progress", daemon=True)
+                watch.thread.start()
+            elif watch.final_event is not None:
+                subscriber.put(watch.final_event)
+            elif watch.states:
+                # reconnecting streams get the states of the last poll right away
+                subscriber.put(("progress", {"jobs": watch.states}))
+            watch.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, job_id, subscriber):
+        with self._lock:
+            watch = self._watches.get(job_id)
+            if watch is not None and subscriber in watch.subscribers:
+                watch.subscribers.remove(subscriber)
+                if not watch.subscribers:
+                    watch.idle_since = time.time()
+
+    def stream(self, client, job_id):
+        """ Generate the server-sent events for job_id, ending after the first event or stream_timeout seconds """
+        subscriber = self.subscribe(client, job_id)
+        try:
+            yield f"retry: {int(self.poll_interval * 1000)}\n\n"
+            try:
+                event, data = subscriber.get(timeout=self.stream_timeout)
+            except queue.Empty:
+                return
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            self.unsubscribe(job_id, subscriber)
+
+    def clear(self):
+        with self._lock:
+            for watch in self._watches.values():
+                watch.subscribers = []
+            self._watches = {}
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "num_watched_jobs": len(self._watches),
+                "num_subscribers": sum(len(watch.subscribers) for watch in self._watches.values()),
+                "num_polls": self.num_polls,
+                "num_events": self.num_events,
+            }
+
+
+job_progress_monitor = JobProgressMonitor()
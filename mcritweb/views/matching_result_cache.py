@@ -0,0 +1,114 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from mcrit.storage.MatchingResult import MatchingResult
+
+from mcritweb.views.MatchingResultView import MatchingResultView
+
+
+class MatchingResultCache(object):
+    """ In-process LRU cache of parsed MatchingResults and of filtered views derived from them.
+
+    Views are MatchingResultViews of shallow copies of the parsed result: MatchingResult filters only
+    ever rebind their match lists, so views share the entry objects with the original and only cost
+    their lists and precomputed aggregations.
+    Memory use is estimated per entry and bounded by max_bytes.
+    """
+
+    # rough per-object footprint of the parsed entries, used to estimate memory use
+    bytes_per_function_match = 600
+    bytes_per_sample_match = 2000
+    # list reference plus share of the aggregations precomputed by the view
+    bytes_per_view_match = 160
+
+    def __init__(self, max_bytes=512 * 1024 ** 2) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # (job_id, filter_key) -> {"result": MatchingResult, "size": int}, filter_key None is the unfiltered original
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get("MATCHING_RESULT_CACHE_MAX_BYTES", self.max_bytes)
+        self.clear()
+
+    def _estimateSize(self, matching_result, is_view):
+        if is_view:
+            return (len(matching_result.function_matches) + len(matching_result.sample_matches)) * self.bytes_per_view_match
+        return len(matching_result.function_matches) * self.bytes_per_function_match + len(matching_result.sample_matches) * self.bytes_per_sample_match
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.num_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.num_hits += 1
+            return entry["result"]
+
+    def _put(self, key, matching_result):
+        size = self._estimateSize(matching_result, is_view=key[1] is not None)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)["size"]
+            self._entries[key] = {"result": matching_result, "size": size}
+            self._total_bytes += size
+            while len(self._entries) > 1 and self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted["size"]
+                self.num_evictions += 1
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return (job_id, None) in self._entries
+
+    def getMatchingResult(self, job_id, load_result_json):
+        """ Answer the parsed, unfiltered MatchingResult for job_id, only calling load_result_json() on a miss """
+        matching_result = self._get((job_id, None))
+        if matching_result is None:
+            result_json = load_result_json()
+            if not result_json:
+                return None
+            matching_result = MatchingResult.fromDict(result_json)
+            self._put((job_id, None), matching_result)
+        return matching_result
+
+    def getFilteredView(self, job_id, filter_key, load_result_json, apply_filters):
+        """ Answer a MatchingResultView for job_id, with apply_filters() applied once per filter_key.
+
+        Views are shared between requests and must not be modified after apply_filters.
+        """
+        view = self._get((job_id, filter_key))
+        if view is None:
+            matching_result = self.getMatchingResult(job_id, load_result_json)
+            if matching_result is None:
+                return None
+            filtered_result = copy.copy(matching_result)
+            apply_filters(filtered_result)
+            view = MatchingResultView(filtered_result)
+            self._put((job_id, filter_key), view)
+        return view
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._total_bytes = 0
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "num_entries": len(self._entries),
+                "num_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "num_hits": self.num_hits,
+                "num_misses": self.num_misses,
+                "num_evictions": self.num_evictions,
+            }
+
+
+matching_result_cache = MatchingResultCache()
@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import zlib
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+
+
+# cache file header, files of other formats (e.g. the former marshal one) are treated as cache misses
+RESULT_FORMAT_MAGIC = b"MCRWRC2"
+# fixed, so results cached by one Python version can be read by all others we support
+RESULT_PICKLE_PROTOCOL = 4
+
+
+def serialize_result(result_json):
+    """ Compact binary representation of a result report: zlib compressed pickle of the dict """
+    return RESULT_FORMAT_MAGIC + zlib.compress(pickle.dumps(result_json, protocol=RESULT_PICKLE_PROTOCOL), 1)
+
+
+def deserialize_result(data):
+    """ Only use on files written by serialize_result() to our own cache, as unpickling runs arbitrary code """
+    if not data.startswith(RESULT_FORMAT_MAGIC):
+        raise ValueError("Unknown result cache format.")
+    return pickle.loads(zlib.decompress(data[len(RESULT_FORMAT_MAGIC):]))
+
+
+class ResultCache(object):
+    """ Local cache for job results in instance/cache/results with a job_id -> file index.
+
+    Results are stored in the compact format of serialize_result(), which is several times smaller
+    than the JSON received from MCRIT and much faster to load. Results cached as JSON by earlier
+    versions are still read and converted on first access.
+
+    Entries are evicted least-recently-used first once max_bytes or max_entries is exceeded.
+    The file mtime doubles as last access time, so the LRU order survives restarts and is
+    shared between worker processes, which each keep their own index.
+    """
+
+    # results cached by earlier versions were named "%Y%m%d-%H%M%S-<job_id>.json"
+    legacy_filename_rx = re.compile(r"^\d{8}-\d{6}-(?P<job_id>.+)\.json$")
+    filename_rx = re.compile(r"^(?P<job_id>[^./\\]+)\.(json|mcr)$")
+
+    def __init__(self, cache_path=None, max_bytes=2 * 1024 ** 3, max_entries=1000) -> None:
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._index = None
+        self._total_bytes = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+    def init_app(self, app):
+        self.cache_path = os.sep.join([app.instance_path, "cache", "results"])
+        self.max_bytes = app.config.get("RESULT_CACHE_MAX_BYTES", self.max_bytes)
+        self.max_entries = app.config.get("RESULT_CACHE_MAX_ENTRIES", self.max_entries)
+        self.clear()
+
+    def _getPath(self, job_id):
+        return self.cache_path + os.sep + f"{job_id}.mcr"
+
+    def _parseJobId(self, filename):
+        for rx in [self.legacy_filename_rx, self.filename_rx]:
+            match = rx.match(filename)
+            if match:
+                return match.group("job_id")
+        return None
+
+    def _ensureIndex(self):
+        if self._index is not None:
+            return
+        entries = []
+        for filename in os.listdir(self.cache_path):
+            job_id = self._parseJobId(filename)
+            if job_id is None:
+                continue
+            try:
+                stat = os.stat(self.cache_path + os.sep + filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, job_id, self.cache_path + os.sep + filename, stat.st_size))
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        for _, job_id, path, size in sorted(entries):
+            if job_id in self._index:
+                # only keep the most recent copy of results cached multiple times
+                self._removeEntry(job_id)
+            self._index[job_id] = {"path": path, "size": size}
+            self._total_bytes += size
+        self._evict()
+
+    def _removeEntry(self, job_id):
+        entry = self._index.pop(job_id)
+        self._total_bytes -= entry["size"]
+        try:
+            os.remove(entry["path"])
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._index and (self._total_bytes > self.max_bytes or len(self._index) > self.max_entries):
+            job_id = next(iter(self._index))
+            logging.info("Evicting cached result for job %s.", job_id)
+            self._removeEntry(job_id)
+            self.num_evictions += 1
+
+    def _lookup(self, job_id):
+        """ Answer the path of the cached result for job_id and mark it as recently used """
+        with self._lock:
+            self._ensureIndex()
+            entry = self._index.get(job_id)
+            if entry is None:
+                # may have been cached by another worker in the meantime
+                path = self._getPath(job_id)
+                if self._parseJobId(os.path.basename(path)) != job_id or not os.path.isfile(path):
+                    return None
+                entry = {"path": path, "size": os.path.getsize(path)}
+                self._index[job_id] = entry
+                self._total_bytes += entry["size"]
+            self._index.move_to_end(job_id)
+            try:
+                os.utime(entry["path"])
+            except OSError:
+                # evicted by another worker
+                self._index.pop(job_id)
+                self._total_bytes -= entry["size"]
+                return None
+            return entry["path"]
+
+    def get(self, job_id):
+        result_json = {}
+        path = self._lookup(job_id)
+        if path is not None:
+            try:
+                if path.endswith(".json"):
+                    with open(path, "r") as fin:
+                        result_json = json.load(fin)
+                    # convert to the compact format so we only pay for parsing JSON once
+                    self.put(job_id, result_json)
+                else:
+                    with open(path, "rb") as fin:
+                        result_json = deserialize_result(fin.read())
+            except (OSError, ValueError, EOFError, TypeError, zlib.error, pickle.UnpicklingError):
+                result_json = {}
+        with self._lock:
+            if result_json:
+                self.num_hits += 1
+            else:
+                self.num_misses += 1
+        return result_json
+
+    def put(self, job_id, result_json):
+        path = self._getPath(job_id)
+        if self._parseJobId(os.path.basename(path)) != job_id:
+            return
+        # write to a temporary file first, so concurrent readers never see partial results
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as fout:
+            fout.write(serialize_result(result_json))
+        os.replace(temp_path, path)
+        with self._lock:
+            self._ensureIndex()
+            if job_id in self._index:
+                previous_entry = self._index.pop(job_id)
+                self._total_bytes -= previous_entry["size"]
+                if previous_entry["path"] != path:
+                    try:
+                        os.remove(previous_entry["path"])
+                    except OSError:
+                        # already removed by another worker
+                        pass
+            size = os.path.getsize(path)
+            self._index[job_id] = {"path": path, "size": size}
+            self._total_bytes += size
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._total_bytes = 0
+
+    def getStatistics(self):
+        with self._lock:
+            self._ensureIndex()
+            return {
+                "num_entries": len(self._index),
+                "num_bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "num_hits": self.num_hits,
+                "num_misses": self.num_misses,
+                "num_evictions": self.num_evictions,
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,83 @@
+import time
+import functools
+import threading
+
+from mcritweb.views.upstream_fetcher import upstream_fetcher
+
+
+class SampleEntryCache(object):
+    """ Short-lived in-process cache of SampleEntries, for views resolving many samples at once.
+
+    Cross compares show up to hundreds of samples, which MCRIT only hands out one at a time.
+    Entries not cached are fetched concurrently through the upstream fetcher, whose pool bounds
+    the fan-out. Samples can be modified or deleted, so entries expire after ttl seconds and
+    unknown samples are not cached at all.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (server_url, sample_id) -> (SampleEntry, fetched_at)
+        self._entries = {}
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get("SAMPLE_CACHE_TTL", self.ttl)
+        self.max_entries = app.config.get("SAMPLE_CACHE_MAX_ENTRIES", self.max_entries)
+        self.clear()
+
+    def _lookup(self, server_url, sample_id, now):
+        entry = self._entries.get((server_url, sample_id))
+        if entry is None or now - entry[1] > self.ttl:
+            self.num_misses += 1
+            return None
+        self.num_hits += 1
+        return entry[0]
+
+    def _remember(self, server_url, sample_entries, now):
+        with self._lock:
+            if len(self._entries) + len(sample_entries) > self.max_entries:
+                self._entries = {key: entry for key, entry in self._entries.items() if now - entry[1] <= self.ttl}
+            for sample_id, sample_entry in sample_entries.items():
+                if sample_entry is not None and len(self._entries) < self.max_entries:
+                    self._entries[(server_url, sample_id)] = (sample_entry, now)
+
+    def getSample(self, client, sample_id):
+        """ Answer the SampleEntry for sample_id, None if it does not exist """
+        return self.getSamples(client, [sample_id])[sample_id]
+
+    def getSamples(self, client, sample_ids):
+        """ Answer a dict of sample_id to SampleEntry (None if it does not exist), in order of sample_ids """
+        server_url = client.mcrit_server
+        now = time.time()
+        with self._lock:
+            sample_entries = {sample_id: self._lookup(server_url, sample_id, now) for sample_id in sample_ids}
+        missing_ids = [sample_id for sample_id, sample_entry in sample_entries.items() if sample_entry is None]
+        fetched_entries = dict(zip(missing_ids, upstream_fetcher.fetch(*[functools.partial(client.getSampleById, sample_id) for sample_id in missing_ids])))
+        sample_entries.update(fetched_entries)
+        self._remember(server_url, fetched_entries, now)
+        return sample_entries
+
+    def invalidate(self, sample_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == sample_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "num_entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "num_hits": self.num_hits,
+                "num_misses": self.num_misses,
+            }
+
+
+sample_cache = SampleEntryCache()
@@ -0,0 +1,129 @@
+import math
+import bisect
+
+import numpy as np
+
+
+def _above(threshold):
+    """ Lower bound for scores strictly greater than threshold """
+    return math.nextafter(threshold, math.inf)
+
+
+class ColorScale(object):
+    """ Maps scores to colors of a palette, by the lower bounds at which each color starts.
+
+    Scores below the first threshold get colors[0], scores from thresholds[i] on get colors[i + 1].
+    Hex strings are looked up from tables per opacity, which are only computed once, and arrays of
+    scores are mapped in one go for rendering whole tables, matrices or diagrams.
+    """
+
+    def __init__(self, thresholds, colors) -> None:
+        assert len(colors) == len(thresholds) + 1
+        self.thresholds = list(thresholds)
+        self.colors = [tuple(color) for color in colors]
+        self.rgb_table = np.array(self.colors, dtype=np.uint8)
+        # opacity -> hex string per color
+        self._hex_tables = {}
+
+    @staticmethod
+    def toHex(color, opacity=1):
+        # blend with white, as for backgrounds drawn with the given opacity
+        return "".join([f"{int(255 - opacity * (255 - e)):02x}" for e in color])
+
+    def getHexTable(self, opacity=1):
+        hex_table = self._hex_tables.get(opacity)
+        if hex_table is None:
+            hex_table = [self.toHex(color, opacity) for color in self.colors]
+            self._hex_tables[opacity] = hex_table
+        return hex_table
+
+    def getIndex(self, score):
+        return bisect.bisect_right(self.thresholds, score)
+
+    def getIndices(self, scores):
+        """ Answer the palette index for each score of an array, as uint8 array """
+        return np.searchsorted(self.thresholds, np.asarray(scores), side="right").astype(np.uint8)
+
+    def getRgb(self, score):
+        return self.colors[self.getIndex(score)]
+
+    def getRgbArray(self, scores):
+        """ Answer an (n, 3) uint8 array of RGB colors for an array of n scores """
+        return self.rgb_table[self.getIndices(scores)]
+
+    def getHex(self, score, opacity=1):
+        return self.getHexTable(opacity)[self.getIndex(score)]
+
+    def getHexArray(self, scores, opacity=1):
+        """ Answer an array of hex color strings for an array of scores """
+        return np.array(self.getHexTable(opacity))[self.getIndices(scores)]
+
+
+WHITE = (0xff, 0xff, 0xff)
+
+# match percentages on a 0-100 scale, as used for sample matches
+MATCH_SCALE_100 = ColorScale(
+    [_above(0), 10, 20, 30, 40, 50, 60, 70, 80, 90],
+    [
+        WHITE,
+        (0x44, 0x44, 0x44),  # light grey
+        (0xff, 0x00, 0x00),  # red
+        (0xff, 0x40, 0x00),  # red-orange
+        (0xff, 0x80, 0x00),  # dark orange
+        (0xff, 0xc0, 0x00),  # orange
+        (0xff, 0xff, 0x00),  # yellow
+        (0xc0, 0xff, 0x00),  # lime
+        (0x00, 0xff, 0x00),  # green
+        (0x00, 0xff, 0xff),  # cyan
+        (0x00, 0x80, 0xff),  # blue
+    ],
+)
+
+# function match scores, which start at 50 and exceed 100 for pichash matches
+MATCH_SCALE_50 = ColorScale(
+    [50, 60, 70, 80, 90, 100, _above(100)],
+    [
+        WHITE,
+        (0xfd, 0x1a, 0x20),  # red
+        (0xfe, 0x82, 0x25),  # orange
+        (0xff, 0xff, 0x35),  # yellow
+        (0x1f, 0xfe, 0x28),  # green
+        (0x22, 0xfe, 0xfd),  # light blue
+        (0x00, 0x80, 0xff),  # blue
+        (0x00, 0x45, 0xba),  # dark blue
+    ],
+)
+
+# frequency weighted scores
+FREQUENCY_SCALE = ColorScale(
+    [40, 50, 60, 70, 80, 90, _above(95), _above(100)],
+    [
+        WHITE,
+        (0xb4, 0x00, 0xff),  # violet
+        (0xfd, 0x1a, 0x20),  # red
+        (0xfe, 0x82, 0x25),  # orange
+        (0xff, 0xff, 0x35),  # yellow
+        (0x1f, 0xfe, 0x28),  # green
+        (0x22, 0xfe, 0xfd),  # light blue
+        (0x10, 0x7f, 0xfc),  # blue
+        (0x00, 0x45, 0xba),  # dark blue
+    ],
+)
+
+# cells of cross compare matrices, on a dark background
+CROSS_COMPARE_SCALE = ColorScale(
+    [_above(0), 10, 20, 30, 40, 50, 60, 70, 80, 90],
+    [
+        (0x22, 0x22, 0x22),  # dark grey / background
+        (0x44, 0x44, 0x44),  # light grey
+        (0xff, 0x00, 0x00),  # red
+        (0xff, 0x40, 0x00),  # red-orange
+        (0xff, 0x80, 0x00),  # dark orange
+        (0xff, 0xc0, 0x00),  # orange
+        (0xff, 0xff, 0x00),  # yellow
+        (0xc0, 0xff, 0x00),  # lime
+        (0x00, 0xff, 0x00),  # green
+        (0x00, 0xff, 0xff),  # cyan
+        (0x00, 0x80, 0xff),  # dark blue
+    ],
+)
@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import threading
+
+import requests
+
+
+class ServerHealthMonitor(object):
+    """ Tracks reachability of the MCRIT server with a background prober.
+
+    Views only read the recorded state, so a page load no longer costs an extra round-trip.
+    After failure_threshold consecutive failed probes the circuit opens and requests are
+    rejected right away, until a probe of the backing off prober succeeds again. If the recorded
+    state of a closed circuit is older than ttl seconds (e.g. the server URL changed or the prober
+    stalled), a single caller does a synchronous probe as a fallback.
+    """
+
+    def __init__(self, probe_interval=5, ttl=30, failure_threshold=2, probe_timeout=5, max_backoff=60) -> None:
+        self.probe_interval = probe_interval
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.probe_timeout = probe_timeout
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._fallback_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._url = None
+        self._resetState()
+
+    def _resetState(self):
+        self.is_circuit_open = False
+        self.last_probe_at = None
+        self.last_success_at = None
+        self.last_latency_ms = None
+        self.consecutive_failures = 0
+        self.num_probes = 0
+        self.num_failures = 0
+        self.num_rejected = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def init_app(self, app):
+        self.probe_interval = app.config.get("MCRIT_HEALTH_PROBE_INTERVAL", self.probe_interval)
+        self.ttl = app.config.get("MCRIT_HEALTH_TTL", self.ttl)
+        self.failure_threshold = app.config.get("MCRIT_HEALTH_FAILURE_THRESHOLD", self.failure_threshold)
+        self.probe_timeout = app.config.get("MCRIT_HEALTH_PROBE_TIMEOUT", self.probe_timeout)
+        self.max_backoff = app.config.get("MCRIT_HEALTH_MAX_BACKOFF", self.max_backoff)
+
+    def _ensureProber(self):
+        # threads do not survive a fork (e.g. gunicorn pre-loading), so we (re)start lazily per process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="mcrit-health-prober", daemon=True)
+            self._thread.start()
+
+    def _getSleepInterval(self):
+        if not self.is_circuit_open:
+            return self.probe_interval
+        # back off exponentially while the server stays unreachable
+        exponent = min(self.consecutive_failures - self.failure_threshold, 8)
+        return min(self.probe_interval * 2 ** max(0, exponent), self.max_backoff)
+
+    def _run(self):
+        while True:
+            time.sleep(self._getSleepInterval())
+            url = self._url
+            if url is not None:
+                self.probe(url)
+
+    def probe(self, url):
+        start = time.time()
+        is_success = False
+        try:
+            response = requests.get(f"{url}/", timeout=self.probe_timeout)
+            is_success = response.status_code < 500
+        except Exception:
+            pass
+        latency_ms = (time.time() - start) * 1000
+        with self._lock:
+            if url != self._url:
+                # server URL changed while we were probing, result is meaningless
+                return is_success
+            self.num_probes += 1
+            self.last_probe_at = time.time()
+            self.last_latency_ms = latency_ms
+            self.total_latency_ms += latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+            if is_success:
+                if self.is_circuit_open:
+                    logging.info("MCRIT server %s reachable again, closing circuit.", url)
+                self.last_success_at = self.last_probe_at
+                self.consecutive_failures = 0
+                self.is_circuit_open = False
+            else:
+                self.num_failures += 1
+                self.consecutive_failures += 1
+                if not self.is_circuit_open and self.consecutive_failures >= self.failure_threshold:
+                    logging.warning("MCRIT server %s unreachable after %d probes, opening circuit.", url, self.consecutive_failures)
+                    self.is_circuit_open = True
+        return is_success
+
+    def isAvailable(self, url):
+        """ Answer if the MCRIT server at url is considered reachable, based on the recorded state """
+        self._ensureProber()
+        if url != self._url:
+            with self._lock:
+                self._url = url
+                self._resetState()
+        # while the circuit is open, only the prober decides when to retry, according to its backoff
+        if not self.is_circuit_open and self._isStale():
+            # without any recorded state we have to wait for the probe, otherwise others keep the recorded state
+            if self._fallback_lock.acquire(blocking=self.last_probe_at is None):
+                try:
+                    if self._isStale():
+                        self.probe(url)
+                finally:
+                    self._fallback_lock.release()
+        # a single failed probe does not open the circuit, only a full open circuit or no success ever does
+        is_available = not self.is_circuit_open and self.last_success_at is not None
+        if not is_available:
+            with self._lock:
+                self.num_rejected += 1
+        return is_available
+
+    def _isStale(self):
+        return self.last_probe_at is None or time.time() - self.last_probe_at > self.ttl
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "url": self._url,
+                "is_circuit_open": self.is_circuit_open,
+                "last_probe_at": self.last_probe_at,
+                "last_success_at": self.last_success_at,
+                "last_latency_ms": self.last_latency_ms,
+                "avg_latency_ms": self.total_latency_ms / self.num_probes if self.num_probes else None,
+                "max_latency_ms": self.max_latency_ms,
+                "consecutive_failures": self.consecutive_failures,
+                "num_probes": self.num_probes,
+                "num_failures": self.num_failures,
+                "num_rejected": self.num_rejected,
+            }
+
+
+health_monitor = ServerHealthMonitor()
@@ -0,0 +1,75 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+
+class UpstreamFetcher(object):
+    """ Issues independent MCRIT calls of a request concurrently, so a page waits for the slowest call only.
+
+    Views declare their calls as callables and receive the results in the same order, exceptions
+    are raised in the requesting thread. Calls run in an app context on a shared pool per process,
+    while the requesting thread takes the first call itself. Each worker thread uses its own
+    keep-alive session from the client pool. Calls issued from within a worker are run one after
+    another, so nested fan-outs can never wait for a pool that is busy with their parents.
+    """
+
+    def __init__(self, max_workers=8) -> None:
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = None
+        self._pid = None
+        self.num_batches = 0
+        self.num_calls = 0
+        self.num_sequential = 0
+
+    def init_app(self, app):
+        self.max_workers = app.config.get("UPSTREAM_FETCH_WORKERS", self.max_workers)
+
+    def _getExecutor(self):
+        # worker threads do not survive a fork, so we create the pool lazily per process
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mcrit-upstream")
+            self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, app, call):
+        self._local.is_worker = True
+        with app.app_context():
+            return call()
+
+    def fetch(self, *calls):
+        """ Run all callables concurrently and answer their results as list, in order """
+        is_sequential = len(calls) < 2 or self.max_workers < 1 or getattr(self._local, "is_worker", False)
+        with self._lock:
+            self.num_batches += 1
+            self.num_calls += len(calls)
+            if is_sequential:
+                self.num_sequential += 1
+        if is_sequential:
+            return [call() for call in calls]
+        app = current_app._get_current_object()
+        with self._lock:
+            executor = self._getExecutor()
+        futures = [executor.submit(self._run, app, call) for call in calls[1:]]
+        try:
+            first_result = calls[0]()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return [first_result] + [future.result() for future in futures]
+
+    def getStatistics(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "num_batches": self.num_batches,
+                "num_calls": self.num_calls,
+                "num_sequential": self.num_sequential,
+            }
+
+
+upstream_fetcher = UpstreamFetcher()
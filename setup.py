@@ -14,6 +14,7 @@ setup(
         "fastcluster"
         "networkx",
         "mcrit",
-        "levenshtein"
+        "levenshtein",
+        "ijson"
     ],
 )
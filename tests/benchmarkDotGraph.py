@@ -0,0 +1,84 @@
+#!/usr/bin/python
+"""
+Benchmark for annotating CFG explorer DOT graphs with picblock hashes on synthetic large functions.
+
+usage: python tests/benchmarkDotGraph.py [num_blocks ...]
+"""
+
+import sys
+import time
+import random
+
+import context
+from mcrit.storage.FunctionEntry import FunctionEntry
+
+from mcritweb.views.cfg_cache import annotate_dot_graph, create_cfg_payload
+
+
+def create_function_entry(num_blocks, seed=0, base_addr=0x401000):
+    """ Synthetic function with a fallthrough chain of blocks, nested back edges and a few forward jumps """
+    rng = random.Random(seed)
+    offset = base_addr
+    block_offsets = []
+    blocks = {}
+    for _ in range(num_blocks):
+        block_offsets.append(offset)
+        instructions = []
+        for _ in range(rng.randrange(2, 9)):
+            instructions.append([offset, "8b45f8", "mov", "eax, dword ptr [ebp - 8]"])
+            offset += 3
+        blocks[str(block_offsets[-1])] = instructions
+    blockrefs = {}
+    for index, block_offset in enumerate(block_offsets[:-1]):
+        targets = {block_offsets[index + 1]}
+        roll = rng.random()
+        if roll < 0.2:
+            targets.add(block_offsets[max(1, index - rng.randrange(0, 8))])
+        elif roll < 0.25 and index + 2 < num_blocks:
+            targets.add(block_offsets[index + 2])
+        blockrefs[str(block_offset)] = sorted(targets)
+    xcfg = {
+        "offset": base_addr, "blocks": blocks, "apirefs": {}, "blockrefs": blockrefs, "inrefs": [], "outrefs": {},
+        "metadata": {"binweight": offset - base_addr, "characteristics": "", "confidence": 1.0, "function_name": "", "strongly_connected_components": [], "tfidf": 0, "pic_hash": 0}
+    }
+    picblockhashes = [{"offset": block_offset, "hash": rng.randrange(2 ** 63), "size": 4} for block_offset in block_offsets if rng.random() < 0.8]
+    return FunctionEntry.fromDict({
+        "function_id": 1, "family_id": 1, "sample_id": 1, "architecture": "intel", "function_name": "", "matches": 0,
+        "pichash": 0, "picblockhashes": picblockhashes, "minhash": "", "minhash_shingle_composition": {},
+        "num_blocks": num_blocks, "num_instructions": sum(len(block) for block in blocks.values()),
+        "binweight": offset - base_addr, "offset": base_addr, "xcfg": xcfg
+    })
+
+
+def annotate_dot_graph_per_block(dot_graph, smda_function, picblockhashes):
+    """ Previous implementation, replacing the node label of one block at a time on the full DOT graph """
+    pbh_by_offset = {pbh["offset"]: pbh for pbh in picblockhashes}
+    for smda_block in smda_function.getBlocks():
+        needle = f',label="{smda_block.offset:x}'
+        replacement = f',comment=""{needle}'
+        if smda_block.offset in pbh_by_offset:
+            replacement = f',comment="0x{pbh_by_offset[smda_block.offset]["hash"]:x}"{needle}'
+        dot_graph = dot_graph.replace(needle, replacement)
+    return dot_graph
+
+
+def measure(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def main(block_counts):
+    print(f"{'blocks':>8} {'dot [kB]':>9} {'smda+dot':>9} {'per-block':>10} {'single-pass':>12} {'payload':>9}  identical")
+    for num_blocks in block_counts:
+        function_entry = create_function_entry(num_blocks)
+        smda_function, smda_time = measure(function_entry.toSmdaFunction)
+        dot_graph, dot_time = measure(smda_function.toDotGraph)
+        per_block, per_block_time = measure(annotate_dot_graph_per_block, dot_graph, smda_function, function_entry.picblockhashes)
+        single_pass, single_pass_time = measure(annotate_dot_graph, dot_graph, function_entry.picblockhashes)
+        _, payload_time = measure(create_cfg_payload, function_entry)
+        print(f"{num_blocks:>8} {len(dot_graph) / 1024:>9.1f} {smda_time + dot_time:>8.3f}s {per_block_time:>9.3f}s {single_pass_time:>11.4f}s {payload_time:>8.3f}s  {per_block == single_pass}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [500, 1000, 2000, 5000])
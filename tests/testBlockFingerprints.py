@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+import random
+import logging
+
+import unittest
+
+from mcritweb.views.block_fingerprints import UNMATCHED_COLOR, _symbolify, get_levenshtein_matches
+
+
+LOG = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logging.disable(logging.CRITICAL)
+
+
+DISTANCE_COLORS = ["#40ff40", "#c0ff80", "#FFFF40", "#FFCC40"]
+
+
+def create_fingerprints(seed, num_blocks=40, num_tokens=300):
+    """ Blocks of function a drawn from num_tokens distinct tokens, blocks of function b as copies with up to 5 edits """
+    rng = random.Random(seed)
+    token_pool = [f"mnem{index} REG, CONST" for index in range(num_tokens)]
+    blocks_a = [[rng.choice(token_pool) for _ in range(rng.randint(2, 10))] for _ in range(num_blocks)]
+    blocks_b = []
+    for block in blocks_a:
+        block = list(block)
+        for _ in range(rng.randint(0, 5)):
+            position = rng.randrange(len(block) + 1)
+            edit = rng.choice(["insert", "delete", "substitute"])
+            if edit == "insert" or position == len(block):
+                block.insert(position, rng.choice(token_pool))
+            elif edit == "delete":
+                del block[position]
+            else:
+                block[position] = rng.choice(token_pool)
+        blocks_b.append(block)
+    rng.shuffle(blocks_b)
+    fingerprints_a = {"offsets": [0x1000 + 0x10 * index for index in range(num_blocks)], "tokens": blocks_a}
+    fingerprints_b = {"offsets": [0x8000 + 0x10 * index for index in range(num_blocks)], "tokens": blocks_b}
+    return fingerprints_a, fingerprints_b
+
+
+def token_distance(tokens_a, tokens_b):
+    """ Levenshtein distance of two token sequences, computed on the tokens themselves """
+    previous_row = list(range(len(tokens_b) + 1))
+    for index_a, token_a in enumerate(tokens_a, 1):
+        row = [index_a]
+        for index_b, token_b in enumerate(tokens_b, 1):
+            row.append(min(previous_row[index_b] + 1, row[index_b - 1] + 1, previous_row[index_b - 1] + (token_a != token_b)))
+        previous_row = row
+    return previous_row[-1]
+
+
+def match_with_tokens(fingerprints_a, fingerprints_b, max_distance=3):
+    """ Greedy assignment of all block pairs by ascending distance, ties in order of blocks in a, then b """
+    pairs = []
+    for row, tokens_a in enumerate(fingerprints_a["tokens"]):
+        for col, tokens_b in enumerate(fingerprints_b["tokens"]):
+            distance = token_distance(tokens_a, tokens_b)
+            if distance <= max_distance:
+                pairs.append((distance, row, col))
+    node_colors = {"a": {}, "b": {}}
+    used_rows, used_cols = set(), set()
+    for distance, row, col in sorted(pairs):
+        if row not in used_rows and col not in used_cols:
+            node_colors["a"][f"Node0x{fingerprints_a['offsets'][row]:x}"] = DISTANCE_COLORS[distance]
+            node_colors["b"][f"Node0x{fingerprints_b['offsets'][col]:x}"] = DISTANCE_COLORS[distance]
+            used_rows.add(row)
+            used_cols.add(col)
+    return node_colors
+
+
+class BlockFingerprintsTestSuite(unittest.TestCase):
+
+    def testSymbolify(self):
+        alphabet = {}
+        tokens = [f"token{index}" for index in range(300)]
+        symbolified = _symbolify(tokens + tokens[:5], alphabet)
+        self.assertEqual(len(symbolified), 305)
+        self.assertEqual(len(set(symbolified[:300])), 300)
+        self.assertEqual(symbolified[300:], symbolified[:5])
+        self.assertEqual(len(alphabet), 300)
+
+    def testSymbolifySkipsSurrogates(self):
+        alphabet = {f"token{index}": chr(index if index < 0xD800 else index + 0x800) for index in range(0xD7FF)}
+        symbolified = _symbolify(["last token before", "first token after"], alphabet)
+        self.assertEqual([ord(symbol) for symbol in symbolified], [0xD7FF, 0xE000])
+        # symbols have to be encodable, i.e. no lone surrogates
+        symbolified.encode("utf-8")
+
+    def testLevenshteinMatchesWithManyTokens(self):
+        for seed in range(3):
+            fingerprints_a, fingerprints_b = create_fingerprints(seed)
+            unmatched_nodes = {"a": fingerprints_a["offsets"], "b": fingerprints_b["offsets"]}
+            node_colors = get_levenshtein_matches(fingerprints_a, fingerprints_b, unmatched_nodes)
+            expected = match_with_tokens(fingerprints_a, fingerprints_b)
+            self.assertTrue(expected["a"])
+            self.assertEqual(node_colors, expected)
+            self.assertNotIn(UNMATCHED_COLOR, node_colors["a"].values())
+
+    def testLevenshteinMatchesInRowSlices(self):
+        fingerprints_a, fingerprints_b = create_fingerprints(7)
+        # only some blocks are candidates, the others were matched by hashes before
+        unmatched_nodes = {"a": fingerprints_a["offsets"][::2], "b": fingerprints_b["offsets"][1:]}
+        node_colors = get_levenshtein_matches(fingerprints_a, fingerprints_b, unmatched_nodes)
+        num_candidates_b = len(unmatched_nodes["b"])
+        # one row per slice, several rows per slice with a partial last one, and more cells than needed
+        for max_cells in [1, 3 * num_candidates_b, 7 * num_candidates_b, 10 ** 6]:
+            self.assertEqual(get_levenshtein_matches(fingerprints_a, fingerprints_b, unmatched_nodes, max_cells=max_cells), node_colors, f"max_cells {max_cells}")
+        candidates_a = {key: [value for offset, value in zip(fingerprints_a["offsets"], fingerprints_a[key]) if offset in unmatched_nodes["a"]] for key in ["offsets", "tokens"]}
+        candidates_b = {key: [value for offset, value in zip(fingerprints_b["offsets"], fingerprints_b[key]) if offset in unmatched_nodes["b"]] for key in ["offsets", "tokens"]}
+        self.assertEqual(node_colors, match_with_tokens(candidates_a, candidates_b))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+
+import json
+import logging
+
+import unittest
+
+from mcritweb.views.cfg_explorer_detector import run
+
+
+LOG = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logging.disable(logging.CRITICAL)
+
+
+def create_dot_graph(edges, nodes=()):
+    """ DOT graph in the layout of the CFG explorer, with node declarations and edges on separate lines """
+    lines = ["digraph G {"]
+    for node in nodes:
+        lines.append(f'{node} [shape=box,label="{node}"];')
+    for src, tgt in edges:
+        lines.append(f"{src} -> {tgt};")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+class CfgExplorerDetectorTestSuite(unittest.TestCase):
+
+    def assertLoops(self, edges, expected, nodes=()):
+        self.assertEqual(json.loads(run(create_dot_graph(edges, nodes=nodes))), expected)
+
+    def testWithoutLoops(self):
+        self.assertLoops([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")], [], nodes=["a", "b", "c", "d"])
+
+    def testNestedLoops(self):
+        self.assertLoops(
+            [("a", "b"), ("b", "c"), ("c", "d"), ("d", "c"), ("d", "e"), ("e", "b"), ("e", "f")],
+            [
+                {"backedge": ["d", "c"], "nodes": ["d", "c"], "parent": 1},
+                {"backedge": ["e", "b"], "nodes": ["e", "d", "c", "b"], "parent": ""},
+            ]
+        )
+
+    def testSelfLoop(self):
+        self.assertLoops([("a", "b"), ("b", "b"), ("b", "c")], [{"backedge": ["b", "b"], "nodes": ["b"], "parent": ""}])
+
+    def testSelfLoopInNestedLoops(self):
+        self.assertLoops(
+            [("a", "b"), ("b", "c"), ("c", "c"), ("c", "d"), ("d", "c"), ("d", "e"), ("e", "b"), ("e", "f")],
+            [
+                {"backedge": ["c", "c"], "nodes": ["c"], "parent": 1},
+                {"backedge": ["d", "c"], "nodes": ["d", "c"], "parent": 2},
+                {"backedge": ["e", "b"], "nodes": ["e", "d", "c", "b"], "parent": ""},
+            ]
+        )
+
+    def testMultipleRoots(self):
+        # roots are joined by a super root, which must not show up in any loop
+        self.assertLoops(
+            [("a", "c"), ("b", "c"), ("c", "d"), ("d", "c"), ("d", "e")],
+            [{"backedge": ["d", "c"], "nodes": ["d", "c"], "parent": ""}]
+        )
+
+    def testEqualSizeLoops(self):
+        self.assertLoops(
+            [("a", "b"), ("b", "c"), ("c", "b"), ("b", "d"), ("d", "b"), ("b", "e")],
+            [
+                {"backedge": ["c", "b"], "nodes": ["c", "b"], "parent": "", "equal": [1]},
+                {"backedge": ["d", "b"], "nodes": ["d", "b"], "parent": ""},
+            ]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
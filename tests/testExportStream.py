@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+import json
+import logging
+
+import unittest
+
+from mcritweb.views.export_stream import iterate_chunks, stream_export
+
+
+LOG = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logging.disable(logging.CRITICAL)
+
+
+class MockClient():
+    """ Answers export data laid out as MCRIT does, with compressed function entries """
+
+    def __init__(self, num_samples, num_families) -> None:
+        self.num_samples = num_samples
+        self.num_families = num_families
+
+    def getExportData(self, sample_ids):
+        sample_entries = {}
+        function_entries = {}
+        family_mapping = {}
+        for sample_id in sample_ids:
+            sha256 = f"{sample_id:064x}"
+            family_id = sample_id % self.num_families
+            family_mapping[family_id] = f"family_{family_id}"
+            sample_entries[sha256] = {"sample_id": sample_id, "sha256": sha256, "family_id": family_id}
+            function_entries[sha256] = f"compressed_functions_{sample_id}"
+        return {
+            "content": {
+                "num_samples": len(sample_entries),
+                "num_functions": 3 * len(sample_entries),
+                "num_families": len(family_mapping),
+                "is_compressed": True,
+            },
+            "config": {"shingle_size": 4},
+            "family_mapping": family_mapping,
+            "sample_entries": sample_entries,
+            "function_entries": function_entries,
+        }
+
+
+class ExportStreamTestSuite(unittest.TestCase):
+
+    def testMergedJsonExport(self):
+        client = MockClient(num_samples=25, num_families=4)
+        chunks = iterate_chunks(range(client.num_samples), 10)
+        export = json.loads(b"".join(stream_export(client, chunks)))
+        self.assertEqual(export["content"]["num_samples"], 25)
+        self.assertEqual(export["content"]["num_functions"], 75)
+        self.assertEqual(export["content"]["num_families"], 4)
+        self.assertTrue(export["content"]["is_compressed"])
+        self.assertEqual(export["config"], {"shingle_size": 4})
+        self.assertEqual(len(export["family_mapping"]), 4)
+        self.assertEqual(len(export["sample_entries"]), 25)
+        self.assertEqual(len(export["function_entries"]), 25)
+        self.assertEqual(export["function_entries"][f"{24:064x}"], "compressed_functions_24")
+
+    def testEmptyJsonExport(self):
+        client = MockClient(num_samples=0, num_families=1)
+        export = json.loads(b"".join(stream_export(client, iterate_chunks([], 10))))
+        self.assertEqual(export["content"]["num_samples"], 0)
+        self.assertEqual(export["sample_entries"], {})
+        self.assertEqual(export["function_entries"], {})
+
+    def testNdjsonExport(self):
+        client = MockClient(num_samples=25, num_families=4)
+        chunks = iterate_chunks(range(client.num_samples), 10)
+        lines = b"".join(stream_export(client, chunks, export_format="ndjson")).splitlines()
+        self.assertEqual([json.loads(line)["content"]["num_samples"] for line in lines], [10, 10, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
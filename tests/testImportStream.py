@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+import os
+import gzip
+import json
+import logging
+import tempfile
+
+import unittest
+
+from mcritweb.views.export_stream import iterate_chunks, stream_export
+from mcritweb.views.import_stream import iterate_import_documents
+
+from testExportStream import MockClient
+
+
+LOG = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logging.disable(logging.CRITICAL)
+
+
+class ImportStreamTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def writeUpload(self, data, compress=False):
+        path = os.path.join(self.temp_dir.name, "upload")
+        with open(path, "wb") as fout:
+            fout.write(gzip.compress(data) if compress else data)
+        return path
+
+    def assertImportsExport(self, documents, export):
+        sample_entries = {}
+        function_entries = {}
+        for document in documents:
+            self.assertEqual(document["config"], export["config"])
+            self.assertEqual(set(document["sample_entries"]), set(document["function_entries"]))
+            for sample_entry in document["sample_entries"].values():
+                self.assertIn(str(sample_entry["family_id"]), document["family_mapping"])
+            sample_entries.update(document["sample_entries"])
+            function_entries.update(document["function_entries"])
+        self.assertEqual(sample_entries, export["sample_entries"])
+        self.assertEqual(function_entries, export["function_entries"])
+
+    def testSingleDocumentBatches(self):
+        client = MockClient(num_samples=25, num_families=4)
+        data = b"".join(stream_export(client, iterate_chunks(range(client.num_samples), 25)))
+        export = json.loads(data)
+        for upload in [data, json.dumps(export, indent=1).encode("utf-8")]:
+            for compress in [False, True]:
+                path = self.writeUpload(upload, compress=compress)
+                documents = [document for document, _ in iterate_import_documents(path, batch_size=10)]
+                self.assertEqual([document["content"]["num_samples"] for document in documents], [10, 10, 5])
+                self.assertImportsExport(documents, export)
+
+    def testNdjsonDocuments(self):
+        client = MockClient(num_samples=25, num_families=4)
+        data = b"".join(stream_export(client, iterate_chunks(range(client.num_samples), 10), export_format="ndjson"))
+        export = json.loads(b"".join(stream_export(client, iterate_chunks(range(client.num_samples), 25))))
+        path = self.writeUpload(data, compress=True)
+        progress = [num_bytes_read for _, num_bytes_read in iterate_import_documents(path, batch_size=3)]
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(progress[-1], os.path.getsize(path))
+        documents = [document for document, _ in iterate_import_documents(path)]
+        self.assertImportsExport(documents, export)
+
+    def testBrokenNdjsonLine(self):
+        client = MockClient(num_samples=25, num_families=4)
+        data = b"".join(stream_export(client, iterate_chunks(range(client.num_samples), 10), export_format="ndjson"))
+        path = self.writeUpload(data + b"{\"content\": \n")
+        documents = iterate_import_documents(path)
+        for _ in range(3):
+            next(documents)
+        # once documents were imported, a broken line must not lead to importing everything again
+        with self.assertRaises(json.JSONDecodeError):
+            next(documents)
+
+
+if __name__ == '__main__':
+    unittest.main()
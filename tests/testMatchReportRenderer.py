@@ -0,0 +1,210 @@
+#!/usr/bin/python
+
+import math
+import random
+import logging
+from types import SimpleNamespace
+from collections import defaultdict
+
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from mcritweb.views.function_metrics import FunctionMetrics
+from mcritweb.views.MatchReportRenderer import MatchReportRenderer
+from mcritweb.views.score_colors import MATCH_SCALE_50
+
+
+LOG = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logging.disable(logging.CRITICAL)
+
+
+def create_report(seed, num_functions=30, num_matches=400):
+    """ Synthetic report for sample 1 of family 1, with matches of own and foreign functions """
+    rng = random.Random(seed)
+    own_function_ids = list(range(100, 100 + num_functions))
+    function_metrics = FunctionMetrics(
+        own_function_ids,
+        [rng.choice([3, 12, 40, 95]) for _ in own_function_ids],
+        [rng.randint(10, 500) for _ in own_function_ids],
+    )
+    function_matches = []
+    for _ in range(num_matches):
+        matched_family_id = rng.randint(1, 6)
+        function_matches.append(SimpleNamespace(
+            # a few matches of functions we have no metrics for
+            function_id=rng.choice(own_function_ids + [900, 901]),
+            matched_family_id=matched_family_id,
+            matched_sample_id=matched_family_id * 10 + rng.randint(0, 3),
+            matched_function_id=rng.randint(1000, 2000),
+            matched_score=rng.choice([50.0, 63.5, 80.0, 99.0, 100.0]),
+            match_is_pichash=rng.choice([0, 0, 1, 2]),
+            match_is_library=rng.random() < 0.2,
+            num_bytes=rng.randint(10, 300),
+        ))
+    report = SimpleNamespace(
+        reference_sample_entry=SimpleNamespace(sample_id=1, family_id=1),
+        function_matches=function_matches,
+        sample_matches=[],
+        library_matches={},
+    )
+    return report, function_metrics
+
+
+def create_renderer(report, function_metrics):
+    renderer = MatchReportRenderer()
+    renderer.match_report = report
+    renderer.sample_info = report.reference_sample_entry
+    renderer.sample_infos = {}
+    renderer.function_metrics = function_metrics
+    renderer._aggregateMatches()
+    return renderer
+
+
+def aggregate_with_dicts(report, filtered_family_id, filtered_sample_id):
+    """ The aggregation as previously done per function_id with dicts of sets """
+    this_family_id = report.reference_sample_entry.family_id
+    this_sample_id = report.reference_sample_entry.sample_id
+    matches_by_function_id = defaultdict(list)
+    family_map = defaultdict(set)
+    sample_map = defaultdict(set)
+    library_map = defaultdict(set)
+    for match in report.function_matches:
+        matches_by_function_id[match.function_id].append(match)
+        family_map[match.function_id].add(match.matched_family_id)
+        sample_map[match.function_id].add(match.matched_sample_id)
+        if match.match_is_library:
+            library_map[match.function_id].add(match.matched_family_id)
+    aggregation = {}
+    for function_id, matches in matches_by_function_id.items():
+        scores = defaultdict(int)
+        for match in matches:
+            score = match.matched_score + (1 if match.match_is_pichash else 0)
+            scores["best_score"] = max(scores["best_score"], score)
+            if match.matched_family_id != this_family_id:
+                scores["best_non_family_score"] = max(scores["best_non_family_score"], score)
+            if match.matched_family_id == filtered_family_id:
+                scores["best_target_family_score"] = max(scores["best_target_family_score"], score)
+            if match.matched_sample_id == filtered_sample_id:
+                scores["best_target_sample_score"] = max(scores["best_target_sample_score"], score)
+        aggregation[function_id] = {
+            "num_matches": len(matches),
+            "num_foreign_families": len(family_map[function_id] - {this_family_id}),
+            "num_foreign_samples": len(sample_map[function_id] - {this_sample_id}),
+            "num_library_families": len(library_map[function_id]),
+            **scores,
+        }
+    return aggregation
+
+
+def render_with_pixels(renderer, filtered_family_id=None, filtered_sample_id=None):
+    """ The stacked diagram as previously painted pixel by pixel, block by block """
+    border_color_tuple = (0x22, 0x22, 0x22)
+    output_map = renderer._calculateOutputMap(filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id)
+    num_matchable = sum([1 for item in output_map.values() if item["is_matchable"]])
+    num_blocks = sum([item["num_instruction_blocks"] for item in output_map.values() if item["is_matchable"]]) + num_matchable - 1
+    diagram_width = 2400
+    block_size = 9
+    stack_size = math.ceil(int(num_blocks / (diagram_width / (block_size + 1)))) + 1
+    num_columns = int(num_blocks / stack_size) if num_blocks % stack_size == 0 else int(num_blocks / stack_size) + 1
+    image = Image.new("RGB", (40 + diagram_width, 40 + 3 * stack_size * block_size + 40), (0xff, 0xff, 0xff))
+    pixels = image.load()
+    diagram_ys = [20, 20 + stack_size * block_size + 20, 20 + 2 * (stack_size * block_size + 20)]
+    for diagram_y in diagram_ys:
+        for x in range(19 - block_size, 20 + num_columns * (block_size + 1) + block_size):
+            for y in range(diagram_y - 1 - block_size, 1 + diagram_y + stack_size * block_size + block_size):
+                pixels[x, y] = border_color_tuple
+
+    def draw_block(block_index, diagram_index, color):
+        x1 = 20 + int(block_index / stack_size) * (block_size + 1)
+        y1 = diagram_ys[diagram_index] + (block_index % stack_size) * block_size
+        for x in range(block_size):
+            for y in range(block_size):
+                pixels[x1 + x, y1 + y] = color
+
+    block_index = 0
+    for function_id, function_output in sorted(output_map.items()):
+        if not function_output["is_matchable"]:
+            continue
+        if block_index:
+            for diagram_index in range(3):
+                draw_block(block_index, diagram_index, border_color_tuple)
+            block_index += 1
+        top_color_tuple, library_color_tuple = renderer._getFunctionColors(function_output, filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id)
+        bottom_color_tuple = MATCH_SCALE_50.getRgb(renderer._getConfidenceScore(function_output, filtered_family_id=filtered_family_id, filtered_sample_id=filtered_sample_id))
+        for _ in range(function_output["num_instruction_blocks"]):
+            draw_block(block_index, 0, top_color_tuple)
+            draw_block(block_index, 1, library_color_tuple)
+            draw_block(block_index, 2, bottom_color_tuple)
+            block_index += 1
+    for _ in range(num_blocks % stack_size):
+        draw_block(block_index, 0, border_color_tuple)
+        block_index += 1
+    return np.asarray(image)
+
+
+class MatchReportRendererTestSuite(unittest.TestCase):
+
+    def testAggregateMatches(self):
+        filtered_family_id = 3
+        filtered_sample_id = 42
+        for seed in range(5):
+            report, function_metrics = create_report(seed)
+            renderer = create_renderer(report, function_metrics)
+            expected = aggregate_with_dicts(report, filtered_family_id, filtered_sample_id)
+            self.assertEqual(renderer.function_ids[:len(function_metrics)], function_metrics.function_ids.tolist())
+            self.assertEqual(sorted(renderer.function_ids), sorted(set(function_metrics.function_ids.tolist()) | set(expected)))
+            best_scores = {
+                "best_score": renderer._getBestScores(),
+                "best_non_family_score": renderer._getBestScores(renderer.match_family_id != 1),
+                "best_target_family_score": renderer._getBestScores(renderer.match_family_id == filtered_family_id),
+                "best_target_sample_score": renderer._getBestScores(renderer.match_sample_id == filtered_sample_id),
+            }
+            for function_index, function_id in enumerate(renderer.function_ids):
+                function_expected = expected.get(function_id, {})
+                self.assertEqual(renderer.num_matches[function_index], function_expected.get("num_matches", 0))
+                self.assertEqual(renderer.num_foreign_families[function_index], function_expected.get("num_foreign_families", 0))
+                self.assertEqual(renderer.num_foreign_samples[function_index], function_expected.get("num_foreign_samples", 0))
+                self.assertEqual(renderer.num_library_families[function_index], function_expected.get("num_library_families", 0))
+                for score_name, scores in best_scores.items():
+                    self.assertEqual(scores[function_index], function_expected.get(score_name, 0))
+
+    def testAggregateWithoutMatches(self):
+        report, function_metrics = create_report(0, num_matches=0)
+        renderer = create_renderer(report, function_metrics)
+        self.assertEqual(renderer.function_ids, function_metrics.function_ids.tolist())
+        self.assertEqual(renderer.num_matches.tolist(), [0] * len(function_metrics))
+        self.assertEqual(renderer._getBestScores().tolist(), [0] * len(function_metrics))
+
+    def testDrawBlockColumns(self):
+        renderer = MatchReportRenderer()
+        rng = np.random.default_rng(0)
+        stack_size, block_size = 4, 3
+        for num_blocks in [0, 1, 4, 10, 13]:
+            block_colors = rng.integers(0, 255, size=(num_blocks, 3), dtype=np.uint8)
+            canvas = np.zeros((20, 40, 3), dtype=np.uint8)
+            renderer._drawBlockColumns(canvas, 2, 1, stack_size, block_size, block_colors)
+            expected = np.zeros((20, 40, 3), dtype=np.uint8)
+            for block_index, color in enumerate(block_colors):
+                x1 = 2 + (block_index // stack_size) * (block_size + 1)
+                y1 = 1 + (block_index % stack_size) * block_size
+                expected[y1:y1 + block_size, x1:x1 + block_size] = color
+            self.assertTrue(np.array_equal(canvas, expected), f"{num_blocks} blocks")
+
+    def testRenderStackedDiagram(self):
+        report, function_metrics = create_report(7, num_functions=80)
+        renderer = create_renderer(report, function_metrics)
+        for filters in [{}, {"filtered_family_id": 3}, {"filtered_sample_id": 42}]:
+            pixels = np.asarray(renderer.renderStackedDiagram(**filters))
+            expected = render_with_pixels(renderer, **filters)
+            self.assertEqual(pixels.shape, expected.shape)
+            self.assertTrue(np.array_equal(pixels, expected), f"filters {filters}")
+            # frame in the top left corner, background in the bottom right one
+            self.assertEqual(pixels[20 - 1 - 9, 20 - 1 - 9].tolist(), [0x22, 0x22, 0x22])
+            self.assertEqual(pixels[-1, -1].tolist(), [0xff, 0xff, 0xff])
+
+
+if __name__ == '__main__':
+    unittest.main()